@@ -0,0 +1,63 @@
+"""
+Configurazione di gunicorn (letta automaticamente dalla directory di lavoro).
+
+SERVER_MODE=wsgi (default): worker gthread. Ogni richiesta occupa un
+thread, comprese quelle lunghe (long-poll di /api/gateway-actions/wait/
+e stream di /api/live/): i thread per worker coprono i limiti di quelle
+richieste più una quota per core per il resto delle API.
+
+SERVER_MODE=asgi: worker uvicorn (pacchetto uvicorn), un event loop per
+core; ingestion, dashboard, storico e Mantis usano le view async.
+
+WEB_CONCURRENCY e GUNICORN_THREADS sovrascrivono i valori calcolati.
+Attenzione alle connessioni al DB: con DB_POOL_MODE=persistent ogni
+worker può aprirne fino a una per thread, con DB_POOL_MODE=pool al più
+DB_POOL_MAX_SIZE; con DB_POOL_MODE=none (default) solo per le richieste
+in corso.
+"""
+import importlib.util
+import multiprocessing
+import os
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+CPUS = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', max(2, CPUS)))
+
+if SERVER_MODE == 'asgi':
+    if importlib.util.find_spec('uvicorn') is None:
+        raise RuntimeError(
+            "SERVER_MODE=asgi richiede il pacchetto uvicorn (vedi requirements.txt): "
+            "installarlo nell'immagine oppure usare SERVER_MODE=wsgi"
+        )
+    wsgi_app = 'project.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'project.wsgi:application'
+    worker_class = 'gthread'
+    long_requests = (
+        int(os.getenv('ACTION_WAIT_MAX_WAITERS', '24'))
+        + int(os.getenv('LIVE_MAX_CLIENTS', '16'))
+    )
+    # Budget di connessioni al DB: con DB_POOL_MODE=persistent ogni thread
+    # può tenerne una aperta, cioè workers x threads in tutto (es. 8 core:
+    # 8 x (24 + 16 + 32) = 576, oltre il max_connections di PostgreSQL).
+    # Con molti thread usare DB_POOL_MODE=none o pool (al più
+    # workers x DB_POOL_MAX_SIZE)
+    threads = int(os.getenv('GUNICORN_THREADS', long_requests + 4 * CPUS))
+
+# Oltre la durata massima di una richiesta long-poll (ACTION_WAIT_MAX_TIMEOUT)
+timeout = 90
+graceful_timeout = 30
+keepalive = 5
+
+
+def on_starting(server):
+    # Le metriche salvate dai worker di un avvio precedente (vedi
+    # portal_app/instrumentation.py) non vanno sommate a quelle nuove
+    directory = os.getenv('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.metrics'))
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.endswith(('.json', '.tmp')):
+                os.remove(os.path.join(directory, name))
@@ -0,0 +1,110 @@
+"""
+Canale comandi verso i gateway (long-poll).
+
+Un gateway resta in attesa su /api/gateway-actions/wait/ e riceve le
+nuove azioni appena vengono create, senza aspettare il prossimo report.
+
+- ActionHub: in ogni processo tiene un contatore di "generazione" per
+  gateway e sveglia i thread in attesa quando arriva una notifica.
+- Notifiche: su PostgreSQL la creazione di un'azione esegue
+  pg_notify('gateway_actions', gtw_uid) nella stessa transazione (la
+  notifica parte solo al commit) e il listener del processo (vedi
+  pg_listener.py) la inoltra all'hub: così funziona anche con più
+  worker. Altrove (o con NOTIFY_BACKEND=local) l'hub viene notificato
+  direttamente al commit, solo nel processo che ha creato l'azione.
+- Limiti: attesa massima ACTION_WAIT_MAX_TIMEOUT secondi e al più
+  ACTION_WAIT_MAX_WAITERS gateway in attesa per processo (oltre: 503).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import pg_listener
+from .models import GatewayPendingActions
+
+CHANNEL = 'gateway_actions'
+
+
+class TooManyWaiters(Exception):
+    pass
+
+
+class ActionHub:
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._generations = {}
+        self._epoch = 0
+        self._waiters = 0
+
+    def token(self, gtw_uid):
+        """
+        Stato attuale del gateway: va letto PRIMA di controllare il DB,
+        così una notifica arrivata nel frattempo non va persa.
+        """
+        with self._cond:
+            return (self._epoch, self._generations.get(gtw_uid, 0))
+
+    def notify(self, gtw_uid):
+        with self._cond:
+            self._generations[gtw_uid] = self._generations.get(gtw_uid, 0) + 1
+            self._cond.notify_all()
+
+    def notify_all(self):
+        # Es. dopo una riconnessione del listener: tutti ricontrollano il DB
+        with self._cond:
+            self._epoch += 1
+            self._cond.notify_all()
+
+    def wait(self, gtw_uid, token, timeout):
+        """
+        Attende una notifica per il gateway (o per tutti) successiva a
+        `token`. Restituisce True se notificato, False allo scadere.
+        Solleva TooManyWaiters oltre ACTION_WAIT_MAX_WAITERS.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._waiters >= settings.ACTION_WAIT_MAX_WAITERS:
+                raise TooManyWaiters("Troppi gateway in attesa, riprovare più tardi")
+            self._waiters += 1
+            try:
+                while (self._epoch, self._generations.get(gtw_uid, 0)) == token:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._waiters -= 1
+
+    @property
+    def waiters(self):
+        return self._waiters
+
+
+hub = ActionHub()
+
+
+def _on_listen(reconnected):
+    # Notifiche arrivate prima del LISTEN (o durante una disconnessione):
+    # tutti i gateway in attesa ricontrollano il DB
+    hub.notify_all()
+
+
+pg_listener.register(CHANNEL, hub.notify, on_listen=_on_listen)
+
+
+@receiver(post_save, sender=GatewayPendingActions)
+def _notify_new_action(sender, instance, created, **kwargs):
+    if not created or instance.status != 'PENDING':
+        return
+    if pg_listener.use_postgres_notify():
+        # Consegnata da PostgreSQL solo al commit della transazione
+        pg_listener.notify(CHANNEL, instance.gateway_id)
+    else:
+        gtw_uid = instance.gateway_id
+        transaction.on_commit(lambda: hub.notify(gtw_uid))
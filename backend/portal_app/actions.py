@@ -0,0 +1,72 @@
+"""
+Consegna delle azioni in sospeso ai gateway e raccolta dei loro esiti.
+
+Ciclo di vita: PENDING -> DELIVERED (consegnata nella risposta di un
+report) -> COMPLETED / FAILED (esito inviato dal gateway).
+
+Le azioni vengono "prenotate" con SELECT ... FOR UPDATE SKIP LOCKED e
+segnate DELIVERED nella stessa transazione: due report concorrenti
+dello stesso gateway non possono ricevere la stessa azione (il secondo
+salta le righe già bloccate dal primo). Su PostgreSQL la ricerca usa
+l'indice parziale sulle sole azioni PENDING (vedi GatewayPendingActions).
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GatewayPendingActions
+from .serializers import PendingActionDispatchSerializer
+
+# Esiti che un gateway può riportare
+FINAL_STATUSES = ('COMPLETED', 'FAILED')
+
+
+def deliver_pending_actions(gtw_uids):
+    """
+    Prenota le azioni PENDING dei gateway indicati, le segna DELIVERED e
+    restituisce il payload compatto da inviare (nessun dato utente).
+    """
+    if not gtw_uids:
+        return []
+    with transaction.atomic():
+        actions = list(
+            GatewayPendingActions.objects
+            .filter(gateway_id__in=list(gtw_uids), status='PENDING')
+            .only('id', 'gateway_id', 'action_command', 'payload', 'created_at')
+            .order_by('created_at', 'id')
+            .select_for_update(skip_locked=True)
+        )
+        if actions:
+            GatewayPendingActions.objects.filter(id__in=[a.id for a in actions]).update(
+                status='DELIVERED', updated_at=timezone.now()
+            )
+    return PendingActionDispatchSerializer(actions, many=True).data
+
+
+def report_action_results(gtw_uid, results):
+    """
+    Registra gli esiti inviati dal gateway: `results` è una lista di
+    {"id": ..., "status": "COMPLETED"|"FAILED"}. Una UPDATE per esito.
+
+    Vengono aggiornate solo le azioni del gateway già consegnate (DELIVERED);
+    restituisce (aggiornate, id ignorati).
+    """
+    ids_by_status = {status: [] for status in FINAL_STATUSES}
+    for result in results:
+        ids_by_status[result['status']].append(result['id'])
+
+    updated = set()
+    now = timezone.now()
+    with transaction.atomic():
+        for status, ids in ids_by_status.items():
+            if not ids:
+                continue
+            queryset = GatewayPendingActions.objects.filter(
+                gateway_id=gtw_uid, id__in=ids, status='DELIVERED'
+            )
+            matched = list(queryset.select_for_update().values_list('id', flat=True))
+            if matched:
+                GatewayPendingActions.objects.filter(id__in=matched).update(status=status, updated_at=now)
+                updated.update(matched)
+
+    ignored = [result['id'] for result in results if result['id'] not in updated]
+    return len(updated), ignored
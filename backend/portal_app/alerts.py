@@ -0,0 +1,266 @@
+"""
+Motore degli allarmi, eseguito dall'ingestion (write_rows) sulle righe
+appena ricevute, nella stessa transazione.
+
+Regole:
+- 'check': il check non rispetta la soglia (actual <operator> limit è
+  falso) oppure il gateway lo segnala con level diverso da 'OK';
+- 'mirth_errors': il contatore 'error' del canale è aumentato rispetto
+  al report precedente (letto da mirth_channel_state, prima dell'upsert);
+- 'mirth_queue': la coda del canale è sopra ALERT_QUEUE_THRESHOLD e in
+  crescita; rientra quando scende sotto soglia.
+
+Le righe di un blocco vengono valutate per colonne in un solo passaggio
+e producono "osservazioni" (fuori soglia sì/no); le osservazioni
+aggiornano poi gli allarmi attivi dei gateway del blocco, letti con una
+sola query.
+
+Soppressione dei flap: un allarme resta PENDING finché non arrivano
+ALERT_OPEN_AFTER valutazioni consecutive fuori soglia (una valutazione
+rientrata lo scarta) e si chiude (CLOSED) dopo ALERT_CLOSE_AFTER
+valutazioni consecutive rientrate. I conteggi sono salvati nelle righe
+dell'allarme e non in memoria: i report di uno stesso gateway arrivano a
+worker diversi.
+
+Report in ritardo: un'osservazione più vecchia dell'ultima valutazione
+dell'allarme attivo, o della chiusura dell'ultimo allarme chiuso con la
+stessa chiave, viene ignorata (non riapre un allarme già chiuso).
+
+Soggetti spariti: un check o un canale che manca da un report del suo
+gateway (che contiene altri check / canali) conta come rientrato, così
+gli allarmi di un check rimosso o di un canale eliminato si chiudono
+invece di restare aperti per sempre.
+"""
+import operator
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+
+from .latest_state import parse_timestamp
+from .models import Alert, MirthChannelState
+
+OPERATORS = {
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    '=': operator.eq, '==': operator.eq, '!=': operator.ne, '<>': operator.ne,
+}
+
+# breach: True fuori soglia, False rientrato
+Observation = namedtuple(
+    'Observation', 'gateway rule subject timestamp breach severity value threshold message'
+)
+
+# Regola -> blocco del report che contiene i suoi soggetti
+RULE_BLOCKS = {'check': 'check', 'mirth_errors': 'mirth', 'mirth_queue': 'mirth'}
+
+
+def evaluate_alerts(mirth_rows, check_rows):
+    """
+    Valuta le righe dell'ingestion (tuple come writers.MIRTH_COLUMNS /
+    CHECK_COLUMNS) e aggiorna la tabella degli allarmi. Va chiamata nella
+    transazione dell'ingestion, prima di aggiornare l'ultimo stato.
+    """
+    if not settings.ALERTS_ENABLED:
+        return
+    observations = evaluate_checks(check_rows) + evaluate_mirth(mirth_rows)
+    apply_observations(observations, reported_subjects(mirth_rows, check_rows))
+
+
+def reported_subjects(mirth_rows, check_rows):
+    """
+    Soggetti presenti in ogni report del blocco:
+    {(gateway, timestamp): {'check': {nomi}, 'mirth': {canali}}}, con
+    solo i blocchi che il report contiene.
+    """
+    reported = {}
+    # Nome del check / del canale: terza colonna in entrambi i formati
+    for block, rows in (('check', check_rows), ('mirth', mirth_rows)):
+        for row in rows:
+            report = reported.setdefault((row[0], parse_timestamp(row[1])), {})
+            report.setdefault(block, set()).add(row[2])
+    return reported
+
+
+def evaluate_checks(rows):
+    if not rows:
+        return []
+    gateways, timestamps, names, levels, descriptions, actuals, limits, operators, _ = zip(*rows)
+    within = [
+        OPERATORS[op](actual, limit) if op in OPERATORS else True
+        for actual, limit, op in zip(actuals, limits, operators)
+    ]
+    breaches = [not ok or level != 'OK' for ok, level in zip(within, levels)]
+    return [
+        Observation(
+            gateway, 'check', name, parse_timestamp(ts), breach,
+            level if level != 'OK' else 'WARNING', actual, limit,
+            f"{name}: {actual} {op} {limit} ({level})" + (f" - {description}" if description else ''),
+        )
+        for gateway, ts, name, level, description, actual, limit, op, breach
+        in zip(gateways, timestamps, names, levels, descriptions, actuals, limits, operators, breaches)
+    ]
+
+
+def evaluate_mirth(rows):
+    if not rows:
+        return []
+    # Valori precedenti per canale, dallo stato prima di questo blocco
+    previous = {
+        (gateway, channel): (ts, error, queued)
+        for gateway, channel, ts, error, queued in MirthChannelState.objects.filter(
+            gateway_id__in={row[0] for row in rows}
+        ).values_list('gateway_id', 'channel_name', 'gateway_timestamp', 'error', 'queued')
+    }
+    threshold = settings.ALERT_QUEUE_THRESHOLD
+
+    samples = sorted(
+        ((gateway, channel), parse_timestamp(ts), error, queued)
+        for gateway, ts, channel, _, _, _, error, _, queued in rows
+    )
+    observations = []
+    for key, ts, error, queued in samples:
+        prev = previous.get(key)
+        if prev is not None and prev[0] >= ts:
+            continue  # report in ritardo: nessun confronto
+        previous[key] = (ts, error, queued)
+        if prev is None:
+            continue
+        _, prev_error, prev_queued = prev
+        gateway, channel = key
+
+        # Contatore azzerato (riavvio di Mirth): nessuna valutazione
+        if error >= prev_error:
+            observations.append(Observation(
+                gateway, 'mirth_errors', channel, ts, error > prev_error, 'ERROR', error - prev_error, None,
+                f"{channel}: {error - prev_error} nuovi errori (totale {error})",
+            ))
+
+        if queued < threshold:
+            breach = False
+        elif queued > prev_queued:
+            breach = True
+        else:
+            continue  # sopra soglia ma non in crescita: stato invariato
+        observations.append(Observation(
+            gateway, 'mirth_queue', channel, ts, breach, 'WARNING', queued, threshold,
+            f"{channel}: {queued} messaggi in coda (soglia {threshold})",
+        ))
+    return observations
+
+
+def apply_observations(observations, reported=None):
+    """
+    Applica le osservazioni agli allarmi attivi (PENDING/OPEN) e scrive
+    aperture, aggiornamenti e chiusure. `reported` (vedi
+    reported_subjects) aggiunge un'osservazione rientrata per i soggetti
+    degli allarmi attivi assenti dai report.
+    """
+    reported = reported or {}
+    gateways = {o.gateway for o in observations} | {gateway for gateway, _ in reported}
+    if not gateways:
+        return
+    active_qs = Alert.objects.filter(gateway_id__in=gateways).exclude(status='CLOSED').order_by()
+    if connection.in_atomic_block and connection.features.has_select_for_update:
+        # Report concorrenti dello stesso gateway: uno alla volta
+        active_qs = active_qs.select_for_update()
+    active = {(a.gateway_id, a.rule, a.subject): a for a in active_qs}
+
+    observations = sorted(
+        observations + missing_subjects(active.values(), reported),
+        key=lambda o: (o.gateway, o.rule, o.subject, o.timestamp),
+    )
+    closed = last_closed(o for o in observations if o.breach and (o.gateway, o.rule, o.subject) not in active)
+
+    new, changed, dropped = {}, {}, set()
+    for o in observations:
+        key = (o.gateway, o.rule, o.subject)
+        alert = active.get(key)
+        if alert is not None and o.timestamp < alert.last_seen_at:
+            continue
+
+        if o.breach:
+            if alert is None and key in closed and o.timestamp <= closed[key]:
+                continue  # report in ritardo rispetto alla chiusura
+            if alert is None:
+                alert = active[key] = new[key] = Alert(
+                    gateway_id=o.gateway, rule=o.rule, subject=o.subject,
+                    status='PENDING', first_seen_at=o.timestamp,
+                )
+            alert.breach_count += 1
+            alert.ok_count = 0
+            alert.severity, alert.message = o.severity, o.message
+            alert.value, alert.threshold = o.value, o.threshold
+            alert.last_seen_at = o.timestamp
+            if alert.status == 'PENDING' and alert.breach_count >= settings.ALERT_OPEN_AFTER:
+                alert.status = 'OPEN'
+                alert.opened_at = o.timestamp
+        elif alert is not None:
+            alert.last_seen_at = o.timestamp
+            if alert.status == 'PENDING':
+                # Rientrato prima della conferma: flap, nessun allarme
+                del active[key]
+                if new.pop(key, None) is None:
+                    dropped.add(alert.pk)
+                continue
+            alert.ok_count += 1
+            if alert.ok_count >= settings.ALERT_CLOSE_AFTER:
+                alert.status = 'CLOSED'
+                alert.closed_at = o.timestamp
+                closed[key] = o.timestamp
+                del active[key]
+        else:
+            continue
+
+        if alert.pk is not None:
+            changed[alert.pk] = alert
+
+    if dropped:
+        Alert.objects.filter(pk__in=dropped).delete()
+    if changed:
+        # Prima delle INSERT: un allarme chiuso libera la chiave
+        Alert.objects.bulk_update(changed.values(), fields=[
+            'status', 'severity', 'message', 'value', 'threshold', 'breach_count', 'ok_count',
+            'last_seen_at', 'opened_at', 'closed_at',
+        ])
+    if new:
+        # Conflitto solo se un altro processo ha appena creato lo stesso
+        # allarme: il suo conteggio prosegue dal report successivo
+        Alert.objects.bulk_create(new.values(), ignore_conflicts=True)
+
+
+def missing_subjects(alerts, reported):
+    """
+    Osservazioni rientrate per gli allarmi il cui soggetto manca da un
+    report successivo del gateway che contiene il blocco della regola.
+    """
+    by_gateway = {}
+    for (gateway, timestamp), subjects in reported.items():
+        by_gateway.setdefault(gateway, []).append((timestamp, subjects))
+    observations = []
+    for alert in alerts:
+        block = RULE_BLOCKS[alert.rule]
+        for timestamp, subjects in by_gateway.get(alert.gateway_id, ()):
+            if timestamp > alert.last_seen_at and block in subjects and alert.subject not in subjects[block]:
+                observations.append(Observation(
+                    alert.gateway_id, alert.rule, alert.subject, timestamp, False, alert.severity,
+                    alert.value, alert.threshold, alert.message,
+                ))
+    return observations
+
+
+def last_closed(observations):
+    """Ultima valutazione degli allarmi chiusi con le chiavi delle osservazioni, se più recente."""
+    observations = list(observations)
+    if not observations:
+        return {}
+    rows = (
+        Alert.objects.filter(
+            gateway_id__in={o.gateway for o in observations},
+            subject__in={o.subject for o in observations},
+            status='CLOSED',
+            last_seen_at__gte=min(o.timestamp for o in observations),
+        )
+        .values('gateway_id', 'rule', 'subject').annotate(last=Max('last_seen_at')).order_by()
+    )
+    return {(row['gateway_id'], row['rule'], row['subject']): row['last'] for row in rows}
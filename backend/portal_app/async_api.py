@@ -0,0 +1,79 @@
+"""
+Supporto per le view asincrone (modalità ASGI, SERVER_MODE=asgi).
+
+DRF esegue solo view sincrone: AsyncAPIView riscrive dispatch() per
+gli handler `async def`. Autenticazione, permessi e throttling restano
+quelli di DRF ma girano in un thread (possono interrogare il DB);
+l'handler gira nell'event loop e usa l'ORM asincrono.
+
+Per non duplicare la logica tra versione sync e async, una view può
+essere scritta come generatore che cede (yield) i queryset da leggere
+e riceve le righe: run_queries() li legge in modo sincrono,
+arun_queries() con l'ORM asincrono (`async for`).
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    # True per le view che dopo autenticazione e permessi non usano il DB
+    # (es. proxy verso servizi esterni): la connessione viene chiusa subito
+    # invece di restare occupata durante l'attesa
+    release_db_connection = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self._initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def _initial(self, request, *args, **kwargs):
+        self.initial(request, *args, **kwargs)
+        if self.release_db_connection:
+            connection.close()
+
+
+def run_queries(steps):
+    """
+    Esegue un generatore di query: ogni queryset ceduto viene letto e
+    le righe (lista) gli vengono restituite. Restituisce il valore
+    finale del generatore.
+    """
+    try:
+        queryset = next(steps)
+        while True:
+            queryset = steps.send(list(queryset))
+    except StopIteration as done:
+        return done.value
+
+
+async def arun_queries(steps):
+    """Come run_queries, con l'ORM asincrono."""
+    try:
+        queryset = next(steps)
+        while True:
+            queryset = steps.send([row async for row in queryset])
+    except StopIteration as done:
+        return done.value
@@ -0,0 +1,134 @@
+"""
+Versioni async delle view più sollecitate, usate in modalità ASGI
+(SERVER_MODE=asgi, vedi urls.py e gunicorn.conf.py).
+
+- Ingestion: il gateway viene risolto con l'ORM asincrono; la scrittura
+  (transazione + COPY/bulk_create) resta sincrona, in un thread, perché
+  l'ORM asincrono non supporta le transazioni.
+- Dashboard: lo snapshot viene letto dalla cache con l'API asincrona.
+- Storico: stessa logica della view sync (MirthMetricsHistoryView.history),
+  con le query lette tramite `async for`.
+- Mantis: chiamata HTTP non bloccante con httpx, se installato; altrimenti
+  requests in un thread, così l'event loop non resta mai bloccato.
+"""
+import asyncio
+
+import requests
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from .async_api import AsyncAPIView, arun_queries
+from .dashboard import aget_snapshot
+from .gateway_cache import gateway_cache
+from .ingestion import build_check_rows, build_mirth_rows, store_report
+from .ingestion_queue import QueueFull
+from .views import (
+    MANTIS_TIMEOUT, DashboardStatsView, MantisTicketView, MetricsIngestionView,
+    MirthMetricsHistoryView,
+)
+
+try:
+    import httpx
+except ImportError:  # dipendenza opzionale
+    httpx = None
+
+MANTIS_ERRORS = (requests.exceptions.RequestException,) + ((httpx.HTTPError,) if httpx else ())
+
+
+class AsyncMetricsIngestionView(AsyncAPIView, MetricsIngestionView):
+
+    async def post(self, request, *args, **kwargs):
+        data = request.data
+        try:
+            gtw_uid = data['gtw_uid']
+            timestamp = data['timestamp']
+
+            gateway = await gateway_cache.aget(gtw_uid)
+            if gateway is None:
+                return Response({"error": "Gateway non valido"}, status=status.HTTP_404_NOT_FOUND)
+
+            mirth_rows = build_mirth_rows(gtw_uid, timestamp, data.get('mirth', {}))
+            check_rows = build_check_rows(gtw_uid, timestamp, data.get('CheckStatus', {}))
+
+            queued, actions_data = await sync_to_async(transaction.atomic(store_report))(
+                gateway, data, mirth_rows, check_rows
+            )
+            response_status = status.HTTP_202_ACCEPTED if queued else status.HTTP_201_CREATED
+
+            return Response({
+                "status": "success",
+                "queued": queued,
+                "mirth_records": len(mirth_rows),
+                "check_records": len(check_rows),
+                "pending_actions": actions_data
+            }, status=response_status)
+
+        except QueueFull as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '30'})
+        except KeyError as e:
+            return Response({"error": f"Campo JSON mancante: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"error": f"Valore non valido: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": f"Errore durante l'elaborazione: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncDashboardStatsView(AsyncAPIView, DashboardStatsView):
+
+    async def get(self, request, *args, **kwargs):
+        snapshot, stale = await aget_snapshot()
+        return self.snapshot_response(snapshot, stale)
+
+
+class AsyncMirthMetricsHistoryView(AsyncAPIView, MirthMetricsHistoryView):
+
+    async def get(self, request, *args, **kwargs):
+        return await arun_queries(self.history(request))
+
+
+class AsyncMantisTicketView(AsyncAPIView, MantisTicketView):
+    release_db_connection = True
+
+    async def post(self, request, *args, **kwargs):
+        error, mantis_request = self.mantis_request(request)
+        if error is not None:
+            return error
+
+        try:
+            status_code, body = await mantis_post(mantis_request)
+        except MANTIS_ERRORS as e:
+            return Response({"error": f"Errore chiamata Mantis: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
+        return self.mantis_response(request, status_code, body)
+
+
+async def mantis_post(mantis_request):
+    """
+    POST verso Mantis senza bloccare l'event loop.
+    Restituisce (status, json); solleva MANTIS_ERRORS.
+    """
+    if httpx is None:
+        # Senza httpx: requests in un thread dedicato
+        response = await sync_to_async(requests.post, thread_sensitive=False)(**mantis_request, timeout=MANTIS_TIMEOUT)
+        response.raise_for_status()
+        return response.status_code, response.json()
+
+    response = await _mantis_client().post(**mantis_request)
+    response.raise_for_status()
+    return response.status_code, response.json()
+
+
+_mantis_clients = {}
+
+
+def _mantis_client():
+    # Un client (e un pool di connessioni) per event loop: sotto uvicorn
+    # c'è un solo loop per worker, quindi le connessioni vengono riusate
+    loop = asyncio.get_running_loop()
+    client = _mantis_clients.get(loop)
+    if client is None:
+        for old_loop in [l for l in _mantis_clients if l.is_closed()]:
+            del _mantis_clients[old_loop]
+        client = _mantis_clients[loop] = httpx.AsyncClient(timeout=MANTIS_TIMEOUT)
+    return client
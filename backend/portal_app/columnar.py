@@ -0,0 +1,86 @@
+"""
+Formato colonnare per le serie temporali delle metriche.
+
+Con ?format=columnar la risposta non ripete i nomi dei campi su ogni
+punto ma restituisce un array per colonna:
+
+    {"bucket": "5m", "timestamps": [1718000000000, ...],
+     "received": [...], "sent": [...], "error": [...], ...}
+
+I timestamp sono millisecondi epoch UTC (direttamente utilizzabili con
+`new Date(ms)`). Il formato si combina con la codifica MessagePack
+(header Accept: application/msgpack) se il pacchetto msgpack è installato.
+"""
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+from .fastjson import float_is_safe
+
+try:
+    import msgpack
+except ImportError:  # dipendenza opzionale
+    msgpack = None
+
+COLUMNAR = 'columnar'
+
+
+def wants_columnar(request):
+    return request.query_params.get(api_settings.URL_FORMAT_OVERRIDE) == COLUMNAR
+
+
+class ColumnarContentNegotiation(DefaultContentNegotiation):
+    """
+    ?format=columnar sceglie la forma dei dati, non il renderer: la
+    negoziazione prosegue come se il parametro non ci fosse.
+    """
+
+    def filter_renderers(self, renderers, format):
+        if format == COLUMNAR:
+            return renderers
+        return super().filter_renderers(renderers, format)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True, default=str)
+
+
+def metrics_renderer_classes():
+    """
+    Renderer delle view delle metriche: quelli di default più MessagePack,
+    se disponibile.
+    """
+    renderers = list(api_settings.DEFAULT_RENDERER_CLASSES)
+    if msgpack is not None:
+        renderers.append(MessagePackRenderer)
+    return renderers
+
+
+def epoch_ms(value):
+    return round(value.timestamp() * 1000)
+
+
+def to_columnar(view, points, columns, timestamp_key='gateway_timestamp', **extra):
+    """
+    Converte una lista di punti (dizionari) nel formato colonnare.
+    Registra sulla view se i valori possono passare da orjson
+    (vedi fastjson.FastJSONRenderer).
+    """
+    data = dict(extra)
+    data['timestamps'] = [epoch_ms(p[timestamp_key]) for p in points]
+    safe = True
+    for name in columns:
+        values = [p[name] for p in points]
+        if safe and any(type(v) is float and not float_is_safe(v) for v in values):
+            safe = False
+        data[name] = values
+    view.fast_json_safe = safe
+    return data
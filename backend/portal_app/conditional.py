@@ -0,0 +1,75 @@
+"""
+GET condizionali (ETag / Last-Modified) per i ViewSet in sola lettura.
+
+Prima di leggere e serializzare le righe si calcola con una sola query
+aggregata una "versione" dei dati richiesti: numero di righe, pk massima
+e valore massimo della colonna di aggiornamento (`last_modified_field`,
+es. lastupdate_time). Se il client ha già quella versione (If-None-Match
+o If-Modified-Since) risponde 304 senza corpo; il browser riusa la copia
+in cache, quindi il frontend non deve fare nulla.
+
+Limite: una modifica che non aggiorna la colonna di aggiornamento (né il
+numero di righe) non cambia l'ETag finché la colonna non cambia.
+
+Se non esiste una colonna affidabile (es. gateway: last_date_call cambia
+solo con le chiamate, non con le modifiche dei dati) `etag_fields` elenca
+i campi serializzati: l'ETag è l'hash dei loro valori, letti con una query
+leggera (.values_list, niente serializzazione), e Last-Modified non viene
+inviato.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    last_modified_field = None
+    etag_fields = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self._conditional(request, queryset, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.get_queryset().filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+        return self._conditional(request, queryset, super().retrieve, *args, **kwargs)
+
+    def _conditional(self, request, queryset, handler, *args, **kwargs):
+        etag, last_modified = self.get_validators(request, queryset)
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(last_modified.timestamp())
+
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified and int(last_modified.timestamp())
+        )
+        response = not_modified or handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            for name, value in headers.items():
+                response[name] = value
+        return response
+
+    def get_validators(self, request, queryset):
+        """(ETag, datetime dell'ultima modifica o None) per il queryset."""
+        if self.etag_fields:
+            return self._content_etag(request, queryset), None
+        version = queryset.order_by().aggregate(
+            rows=Count('pk'), max_pk=Max('pk'), last=Max(self.last_modified_field)
+        )
+        # Stessi dati ma URL (filtri, pagina) o formato diversi: ETag diversi
+        key = '|'.join(map(str, (
+            request.get_full_path(), request.accepted_renderer.media_type,
+            version['rows'], version['max_pk'], version['last'] and version['last'].isoformat(),
+        )))
+        return quote_etag(hashlib.md5(key.encode()).hexdigest()), version['last']
+
+    def _content_etag(self, request, queryset):
+        digest = hashlib.md5(
+            f"{request.get_full_path()}|{request.accepted_renderer.media_type}".encode()
+        )
+        for row in queryset.order_by('pk').values_list(*self.etag_fields).iterator():
+            digest.update(repr(row).encode())
+        return quote_etag(digest.hexdigest())
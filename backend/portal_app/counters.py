@@ -0,0 +1,141 @@
+"""
+Delta e rate dei contatori cumulativi di Mirth (received, sent, error,
+filtered), calcolati in SQL con la window function LAG().
+
+Mirth riporta i totali dall'avvio del canale: il delta di un campione è
+la differenza con il campione precedente della stessa serie. Se il
+valore scende il contatore è ripartito da zero (canale ridistribuito,
+Mirth riavviato) e il delta è il valore stesso. Un intervallo più lungo
+di COUNTER_MAX_GAP_SECONDS (gateway offline) non viene conteggiato: i
+messaggi accumulati durante la pausa finirebbero tutti in un solo punto.
+
+Il rate è in messaggi al minuto: somma dei delta diviso la somma degli
+intervalli conteggiati. 'queued' è un valore istantaneo, non un
+contatore: resta aggregato come nella modalità 'value'.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, FloatField, Func, Window
+from django.db.models.functions import Lag
+
+DELTA_COUNTERS = ('received', 'sent', 'error', 'filtered')
+MODES = ('value', 'delta', 'rate')
+# Unità del rate (secondi): messaggi al minuto
+RATE_UNIT = 60
+
+
+class Epoch(Func):
+    """Timestamp come secondi epoch (float)."""
+    output_field = FloatField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        # date_part restituisce double precision: EXTRACT (numeric da PG 14) è più lento
+        template = "date_part('epoch', %(expressions)s)"
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        template = 'ROUND((julianday(%(expressions)s) - 2440587.5) * 86400, 3)'
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+
+def from_epoch(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def max_gap():
+    return timedelta(seconds=settings.COUNTER_MAX_GAP_SECONDS)
+
+
+class SQLRows:
+    """
+    Righe (dict) di una query SQL: si leggono con un normale for oppure
+    con `async for`, come i queryset ceduti alle view generatore
+    (vedi async_api.run_queries).
+    """
+
+    def __init__(self, sql, params, using=DEFAULT_DB_ALIAS):
+        self.sql, self.params, self.using = sql, params, using
+
+    def __iter__(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(self.sql, self.params)
+            columns = [col[0] for col in cursor.description]
+            return iter([dict(zip(columns, row)) for row in cursor.fetchall()])
+
+    async def __aiter__(self):
+        for row in await sync_to_async(list)(self):
+            yield row
+
+
+def counter_deltas(queryset, group_by, partition_by=(), gauges=None, since=None, limit=None,
+                   descending=False, using=DEFAULT_DB_ALIAS):
+    """
+    Query dei delta raggruppati per le colonne `group_by` del queryset
+    (annotazioni comprese, es. un bucket). Il queryset deve contenere
+    anche il campione precedente al periodo richiesto (almeno
+    COUNTER_MAX_GAP_SECONDS prima di `since`): le righe precedenti a
+    `since` servono solo come base di LAG().
+
+    Ogni riga restituita ha le colonne di `group_by`, 'samples',
+    '<contatore>_delta' per DELTA_COUNTERS, 'delta_seconds' (intervalli
+    conteggiati) e un valore per ogni `gauges` {colonna: funzione SQL}.
+    Con `descending` le righe sono dalla più recente: con `limit` si
+    tengono le ultime.
+    """
+    window = {'order_by': F('gateway_timestamp').asc()}
+    if partition_by:
+        window['partition_by'] = [F(name) for name in partition_by]
+    inner = queryset.order_by().annotate(
+        epoch=Epoch('gateway_timestamp'),
+        prev_epoch=Window(Lag(Epoch('gateway_timestamp')), **window),
+        **{f'prev_{c}': Window(Lag(c), **window) for c in DELTA_COUNTERS},
+    ).values(*dict.fromkeys([
+        *group_by, 'epoch', 'prev_epoch', *DELTA_COUNTERS,
+        *[f'prev_{c}' for c in DELTA_COUNTERS], *(gauges or {}),
+    ]))
+    connection = connections[using]
+    inner_sql, params = inner.query.get_compiler(connection=connection).as_sql()
+    params = list(params)
+
+    quote = connection.ops.quote_name
+    group = ', '.join(f's.{quote(name)}' for name in group_by)
+    counted = f's.prev_epoch IS NOT NULL AND s.epoch - s.prev_epoch <= {float(settings.COUNTER_MAX_GAP_SECONDS)}'
+    columns = [f's.{quote(name)}' for name in group_by] + ['COUNT(*) AS samples']
+    for c in DELTA_COUNTERS:
+        column, prev = f's.{quote(c)}', f's.{quote("prev_" + c)}'
+        # Valore sceso: contatore ripartito da zero
+        columns.append(
+            f'SUM(CASE WHEN NOT ({counted}) THEN NULL WHEN {column} >= {prev} '
+            f'THEN {column} - {prev} ELSE {column} END) AS {quote(c + "_delta")}'
+        )
+    columns.append(f'SUM(CASE WHEN {counted} THEN s.epoch - s.prev_epoch END) AS delta_seconds')
+    for name, function in (gauges or {}).items():
+        columns.append(f'{function}(s.{quote(name)}) AS {quote(name)}')
+
+    sql = f'SELECT {", ".join(columns)} FROM ({inner_sql}) s'
+    if since is not None:
+        sql += ' WHERE s.epoch >= %s'
+        params.append(since.timestamp())
+    direction = ' DESC' if descending else ''
+    sql += f' GROUP BY {group} ORDER BY ' + ', '.join(
+        f's.{quote(name)}{direction}' for name in group_by
+    )
+    if limit is not None:
+        sql += f' LIMIT {int(limit)}'
+    return SQLRows(sql, params, using=using)
+
+
+def counter_values(deltas, seconds, mode):
+    """
+    Valori dei contatori di un punto nella modalità `mode` ('delta' o
+    'rate') da {contatore: delta} e dagli intervalli conteggiati.
+    Senza intervalli conteggiati (es. primo campione) i valori sono None.
+    """
+    if not seconds:
+        return {c: None for c in DELTA_COUNTERS}
+    if mode == 'rate':
+        return {c: deltas[c] * RATE_UNIT / seconds for c in DELTA_COUNTERS}
+    return {c: deltas[c] for c in DELTA_COUNTERS}
@@ -0,0 +1,226 @@
+"""
+Snapshot dei KPI della dashboard, calcolato una volta e condiviso tra
+tutte le richieste tramite la cache di Django.
+
+- Entro DASHBOARD_SNAPSHOT_TTL secondi lo snapshot è "fresco".
+- Fino a DASHBOARD_SNAPSHOT_STALE_TTL secondi oltre il TTL viene servito
+  lo snapshot vecchio mentre un thread lo ricalcola (stale-while-revalidate).
+- Un lock garantisce che un solo processo alla volta esegua le query
+  (single-flight): gli altri aspettano il risultato invece di colpire il
+  DB tutti insieme. Su PostgreSQL è un advisory lock di transazione
+  (atomico e rilasciato in automatico anche se il processo muore); sugli
+  altri database un lock in cache con token del proprietario, atomico
+  solo con backend di cache che implementano add() in modo atomico
+  (Redis, Memcached, database; non FileBasedCache).
+
+Lo snapshot può essere precalcolato con `manage.py refresh_dashboard_snapshot`.
+"""
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Alert, Gateways, KfeLogEvent, Channels, ExportPda, ErroriDaImportare
+from .serializers import AlertSerializer, ExportPdaSerializer
+from .logs import top_batch_errors
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'dashboard:snapshot'
+LOCK_KEY = 'dashboard:snapshot:lock'
+# Chiave dell'advisory lock PostgreSQL (arbitraria, unica nel database)
+ADVISORY_LOCK_ID = 0x6b72_6473  # 'krds'
+
+
+def compute_dashboard_stats():
+    """
+    Esegue le query dei KPI della dashboard e restituisce il payload.
+    """
+    now = timezone.now()
+    last_24h = now - timedelta(hours=24)
+
+    # 1. KPI Gateways
+    # Resta esatto anche con gli heartbeat accorpati: il coalescer scrive
+    # subito quando il valore su DB starebbe per uscire dalla finestra
+    active_gateways = Gateways.objects.filter(
+        last_date_call__gte=now - timedelta(minutes=settings.GATEWAY_ACTIVE_WINDOW_MINUTES)
+    ).count()
+    total_gateways = Gateways.objects.count()
+
+    # 2. KPI Canali
+    channels_to_update = Channels.objects.filter(to_update=1).count()
+    channels_to_delete = Channels.objects.filter(to_delete=1).count()
+
+    # 3. KPI Errori (ultime 24h)
+    errors_last_24h = KfeLogEvent.objects.filter(
+        datetime__gte=last_24h,
+        level__in=['ERROR', 'WARNING'] # Includiamo entrambi
+    ).count()
+
+    # 4. KPI Errori da Importare
+    import_errors_count = ErroriDaImportare.objects.count()
+
+    # 5. Stato Ultime Esportazioni
+    recent_exports = ExportPda.objects.order_by('-insert_time')[:5]
+
+    # 6. Errori per Batch (ultime 24h), raggruppati direttamente in SQL
+    top_5_batch_errors = top_batch_errors(since=last_24h, levels=['ERROR'], top=5)
+
+    # 7. Allarmi aperti (tabella alerts, vedi alerts.py)
+    open_alerts = Alert.objects.filter(status='OPEN').order_by('-opened_at', '-id')
+    active_alerts = open_alerts.count()
+    recent_alerts = open_alerts[:10]
+
+    return {
+        "kpi": {
+            "active_gateways": active_gateways,
+            "total_gateways": total_gateways,
+            "channels_to_update": channels_to_update,
+            "channels_to_delete": channels_to_delete,
+            "errors_last_24h": errors_last_24h,
+            "import_errors_count": import_errors_count,
+            "active_alerts": active_alerts,
+        },
+        "recent_exports": ExportPdaSerializer(recent_exports, many=True).data,
+        "active_alerts": AlertSerializer(recent_alerts, many=True).data,
+        "top_batch_errors": top_5_batch_errors,
+    }
+
+
+def refresh_snapshot():
+    """
+    Ricalcola lo snapshot e lo salva in cache. Restituisce lo snapshot.
+    """
+    snapshot = {
+        "data": compute_dashboard_stats(),
+        "computed_at": timezone.now(),
+    }
+    timeout = settings.DASHBOARD_SNAPSHOT_TTL + settings.DASHBOARD_SNAPSHOT_STALE_TTL
+    cache.set(SNAPSHOT_KEY, snapshot, timeout=timeout)
+    return snapshot
+
+
+async def aget_snapshot():
+    """
+    Versione async di get_snapshot (view ASGI): se lo snapshot in cache è
+    fresco lo legge con l'API asincrona della cache, altrimenti esegue
+    get_snapshot in un thread.
+    """
+    snapshot = await cache.aget(SNAPSHOT_KEY)
+    if snapshot is not None and _age(snapshot) <= settings.DASHBOARD_SNAPSHOT_TTL:
+        return snapshot, False
+    return await sync_to_async(get_snapshot)()
+
+
+def refresh_if_older(max_age):
+    """
+    Ricalcola lo snapshot se ha più di `max_age` secondi e nessun altro
+    processo lo sta già facendo (usata dagli aggiornamenti live, vedi
+    live.py). Restituisce lo snapshot più recente disponibile.
+    """
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None or _age(snapshot) > max_age:
+        with snapshot_lock() as acquired:
+            if acquired:
+                return _refresh_unless_fresh(max_age)
+    if snapshot is None:
+        snapshot, _ = get_snapshot()
+    return snapshot
+
+
+@contextmanager
+def snapshot_lock():
+    """
+    Lock single-flight del ricalcolo: restituisce True se è stato
+    ottenuto, False se un altro processo lo tiene (senza attendere).
+    """
+    if connection.vendor == 'postgresql':
+        # Rilasciato al termine della transazione, solo da chi lo ha preso
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [ADVISORY_LOCK_ID])
+                acquired = cursor.fetchone()[0]
+            yield acquired
+        return
+
+    token = uuid.uuid4().hex
+    acquired = cache.add(LOCK_KEY, token, timeout=settings.DASHBOARD_SNAPSHOT_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        # Non rilascia il lock di un altro processo (il proprio può essere scaduto)
+        if acquired and cache.get(LOCK_KEY) == token:
+            cache.delete(LOCK_KEY)
+
+
+def _refresh_unless_fresh(max_age):
+    # Con il lock: un altro processo può averlo appena ricalcolato
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is not None and _age(snapshot) <= max_age:
+        return snapshot
+    return refresh_snapshot()
+
+
+# Al più un ricalcolo in background per processo
+_background = threading.Lock()
+
+
+def _refresh_in_background():
+    if not _background.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            with snapshot_lock() as acquired:
+                if acquired:
+                    _refresh_unless_fresh(settings.DASHBOARD_SNAPSHOT_TTL)
+        except Exception:
+            logger.exception("Errore aggiornamento snapshot dashboard")
+        finally:
+            _background.release()
+            connection.close()
+
+    threading.Thread(target=run, name='dashboard-snapshot', daemon=True).start()
+
+
+def _age(snapshot):
+    return (timezone.now() - snapshot['computed_at']).total_seconds()
+
+
+def get_snapshot():
+    """
+    Restituisce (snapshot, stale). Calcola in modo sincrono solo se non
+    esiste uno snapshot servibile.
+    """
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is not None:
+        age = _age(snapshot)
+        if age <= settings.DASHBOARD_SNAPSHOT_TTL:
+            return snapshot, False
+        if age <= settings.DASHBOARD_SNAPSHOT_TTL + settings.DASHBOARD_SNAPSHOT_STALE_TTL:
+            _refresh_in_background()
+            return snapshot, True
+
+    # Nessuno snapshot servibile: calcola (un solo processo alla volta)
+    with snapshot_lock() as acquired:
+        if acquired:
+            return _refresh_unless_fresh(settings.DASHBOARD_SNAPSHOT_TTL), False
+
+    # Un altro processo sta già calcolando: aspetta il suo risultato
+    deadline = time.monotonic() + settings.DASHBOARD_SNAPSHOT_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        snapshot = cache.get(SNAPSHOT_KEY)
+        if snapshot is not None and _age(snapshot) <= settings.DASHBOARD_SNAPSHOT_TTL:
+            return snapshot, False
+
+    # Lock scaduto senza risultato: calcola comunque
+    return refresh_snapshot(), False
@@ -0,0 +1,153 @@
+"""
+Export in streaming (CSV / NDJSON) di log e metriche.
+
+Le righe vengono lette con .iterator(chunk_size=...) (su PostgreSQL un
+cursore lato server) e scritte nella risposta man mano: la memoria
+resta costante qualunque sia il numero di righe e l'intestazione parte
+subito, prima ancora che il database abbia restituito la prima riga.
+
+Formato scelto con ?format=csv|ndjson (o header Accept), compressione
+opzionale con ?gzip=1. I filtri sono quelli della lista della view.
+"""
+import csv
+import datetime
+import decimal
+import json
+import uuid
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.decorators import action
+from rest_framework.renderers import BaseRenderer
+
+_encoder = DjangoJSONEncoder()
+
+
+class _ExportRenderer(BaseRenderer):
+    """
+    I dati veri escono da StreamingHttpResponse; il renderer serve alla
+    negoziazione del formato e a rendere le eventuali risposte di errore.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+class CSVRenderer(_ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(_ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class _Echo:
+    # Pseudo-buffer per csv.writer: restituisce la riga invece di scriverla
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    # Stessa rappresentazione di date/decimali dell'API JSON
+    if isinstance(value, (datetime.date, datetime.time, decimal.Decimal, uuid.UUID, datetime.timedelta)):
+        return _encoder.default(value)
+    return value
+
+
+def _csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([_cell(v) for v in row])
+
+
+def _ndjson_lines(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def _encode(lines, chunk_lines):
+    # La prima riga (intestazione CSV o primo record) parte da sola, senza
+    # aspettare un blocco intero; le altre vengono raggruppate per non
+    # fare una write per riga
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    yield first.encode()
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= chunk_lines:
+            yield ''.join(buffer).encode()
+            buffer = []
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = formato gzip
+    for chunk in chunks:
+        # SYNC_FLUSH: ogni blocco compresso parte subito verso il client
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def stream_export(queryset, columns, fmt, filename, compress=False, chunk_size=None):
+    """
+    StreamingHttpResponse con le righe della queryset.
+    `columns` è una lista di (intestazione, campo per values_list).
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    header = [name for name, _ in columns]
+    rows = queryset.values_list(*[field for _, field in columns]).iterator(chunk_size=chunk_size)
+
+    if fmt == 'ndjson':
+        lines, content_type, extension = _ndjson_lines(header, rows), NDJSONRenderer.media_type, 'ndjson'
+    else:
+        lines, content_type, extension = _csv_lines(header, rows), CSVRenderer.media_type, 'csv'
+
+    chunks = _encode(lines, chunk_lines=chunk_size)
+    filename = f"{filename}.{extension}"
+    if compress:
+        chunks = _gzip(chunks)
+        content_type = 'application/gzip'
+        filename += '.gz'
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Evita che proxy (es. nginx) trattengano la risposta in un buffer
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class ExportMixin:
+    """
+    Aggiunge a un ViewSet l'azione `export/`:
+    GET /api/<risorsa>/export/?format=csv|ndjson&gzip=1&<filtri della lista>
+
+    Le colonne sono quelle del modello (nome colonna DB) più eventuali
+    `export_extra_columns` [(intestazione, annotazione)].
+    """
+    export_extra_columns = ()
+
+    def get_export_columns(self):
+        columns = [(f.column, f.attname) for f in self.queryset.model._meta.concrete_fields]
+        return columns + list(self.export_extra_columns)
+
+    @action(detail=False, renderer_classes=[CSVRenderer, NDJSONRenderer], pagination_class=None)
+    def export(self, request):
+        queryset = self.filter_queryset(self.get_queryset())
+        compress = request.query_params.get('gzip') in ('1', 'true')
+        model = queryset.model._meta.db_table
+        filename = f"{model}_{timezone.now():%Y%m%d_%H%M%S}"
+        return stream_export(
+            queryset, self.get_export_columns(), request.accepted_renderer.format,
+            filename, compress=compress
+        )
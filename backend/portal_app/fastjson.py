@@ -0,0 +1,197 @@
+"""
+Serializzazione veloce per gli endpoint di lettura ad alto volume.
+
+Invece di istanziare i modelli e passare ogni riga dai campi DRF, si
+leggono dizionari con .values() e si convertono con un "piano" di
+colonne ricavato una volta sola dal serializer della view. Il JSON
+prodotto è identico byte per byte a quello di JSONRenderer:
+- date/ore nel fuso corrente, ISO 8601 con 'Z' per UTC (come DateTimeField);
+- stessi separatori compatti, UTF-8 non escapato, \\u2028/\\u2029 escapati.
+
+Se è installato orjson viene usato per la codifica, tranne quando un
+float cadrebbe in notazione esponenziale (orjson scrive 0.00001, json
+scrive 1e-05): in quel caso si usa json della libreria standard.
+
+I serializer con campi calcolati (SerializerMethodField) dichiarano in
+`fast_sources` da quale colonna/annotazione leggerli.
+"""
+import math
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # dipendenza opzionale
+    orjson = None
+
+# Tipi di conversione per colonna
+RAW, DATETIME, FLOAT, ANY = 'raw', 'datetime', 'float', 'any'
+
+RAW_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+# Per i tipi che orjson passa al default (date, Decimal, ...): come DRF
+_encoder = JSONEncoder()
+
+
+def float_is_safe(value):
+    # Stessa rappresentazione in json e orjson: niente esponente, niente NaN/inf
+    return value == 0 or (not math.isinf(value) and 1e-4 <= abs(value) < 1e16)
+
+
+class FastRowSerializer:
+    """
+    Piano di serializzazione ricavato da un serializer DRF:
+    lista di (chiave, sorgente in .values(), conversione).
+    Solleva TypeError se il serializer contiene campi non supportati.
+    """
+
+    def __init__(self, serializer_class):
+        overrides = getattr(serializer_class, 'fast_sources', {})
+        model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+        self.columns = []
+        for key, field in serializer_class().fields.items():
+            if key in overrides:
+                source, convert = overrides[key]
+                self.columns.append((key, source, convert))
+            else:
+                self.columns.append((key, *self._plan_field(key, field, model)))
+        self.sources = [source for _, source, _ in self.columns]
+
+    def _plan_field(self, key, field, model):
+        if isinstance(field, serializers.SlugRelatedField):
+            # La FK punta già alla colonna "slug" (es. gateway -> gtw_uid)
+            model_field = model._meta.get_field(field.source)
+            if model_field.target_field.name != field.slug_field:
+                raise TypeError(f"{key}: slug_field diverso dal campo della FK")
+            return model_field.attname, RAW
+        if isinstance(field, serializers.PrimaryKeyRelatedField):
+            return model._meta.get_field(field.source).attname, RAW
+        if isinstance(field, serializers.DateTimeField):
+            if getattr(field, 'format', api_settings.DATETIME_FORMAT) != ISO_8601:
+                raise TypeError(f"{key}: formato data non supportato")
+            return field.source, DATETIME
+        if isinstance(field, serializers.FloatField):
+            return field.source, FLOAT
+        if isinstance(field, RAW_FIELDS):
+            return field.source, RAW
+        if isinstance(field, serializers.ReadOnlyField):
+            return field.source, ANY
+        raise TypeError(f"{key}: campo {type(field).__name__} non supportato")
+
+    def serialize(self, rows):
+        """
+        Converte i dizionari di .values() nel formato del serializer.
+        Restituisce (dati, float_sicuri) dove float_sicuri indica se
+        l'output può essere codificato con orjson senza differenze.
+        """
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        columns = self.columns
+        safe = True
+        data = []
+        for row in rows:
+            item = {}
+            for key, source, convert in columns:
+                value = row[source]
+                if value is None:
+                    item[key] = None
+                    continue
+                if convert is RAW:
+                    pass
+                elif convert is DATETIME:
+                    if tz is not None:
+                        value = value.astimezone(tz) if timezone.is_aware(value) else timezone.make_aware(value, tz)
+                    value = value.isoformat()
+                    if value.endswith('+00:00'):
+                        value = value[:-6] + 'Z'
+                elif convert is FLOAT or convert is ANY:
+                    if convert is FLOAT:
+                        value = float(value)
+                    if safe and type(value) is float and not float_is_safe(value):
+                        safe = False
+                else:
+                    value = convert(value)
+                item[key] = value
+            data.append(item)
+        return data, safe
+
+
+_plans = {}
+
+
+def get_row_serializer(serializer_class):
+    """
+    Piano (in cache per classe) oppure None se il serializer non è supportato.
+    """
+    if serializer_class not in _plans:
+        try:
+            _plans[serializer_class] = FastRowSerializer(serializer_class)
+        except TypeError:
+            _plans[serializer_class] = None
+    return _plans[serializer_class]
+
+
+def fast_serialization_enabled(view):
+    return settings.FAST_SERIALIZATION and getattr(view, 'fast_serialization', False)
+
+
+def serialize_rows(view, serializer_class, rows):
+    """
+    Serializza `rows` (dizionari di .values()) per la view e registra se
+    l'output può passare da orjson. Restituisce i dati serializzati.
+    """
+    plan = get_row_serializer(serializer_class)
+    data, view.fast_json_safe = plan.serialize(rows)
+    return data
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer che usa orjson (se installato) per le risposte preparate
+    dal fast path; per tutto il resto si comporta come JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        renderer_context = renderer_context or {}
+        view = renderer_context.get('view')
+        if (
+            orjson is None or data is None
+            or not getattr(view, 'fast_json_safe', False)
+            or self.get_indent(accepted_media_type, renderer_context) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastListMixin:
+    """
+    Fast path per la lista dei ViewSet in sola lettura (attivabile per view
+    con `fast_serialization = True`). Funziona con KeysetPagination, che
+    accetta anche i dizionari di .values().
+    """
+    fast_serialization = True
+
+    def list(self, request, *args, **kwargs):
+        plan = get_row_serializer(self.get_serializer_class())
+        if plan is None or not fast_serialization_enabled(self):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        # Anche i campi usati dal cursore devono essere nei dizionari
+        ordering = [name.lstrip('-') for name in getattr(self, 'keyset_ordering', ())]
+        sources = list(dict.fromkeys(plan.sources + ordering))
+        rows = queryset.values(*sources)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_rows(self, self.get_serializer_class(), page))
+        return Response(serialize_rows(self, self.get_serializer_class(), rows))
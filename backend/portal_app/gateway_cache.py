@@ -0,0 +1,217 @@
+"""
+Cache in-process dei gateway e coalescenza degli aggiornamenti di
+'last_date_call'.
+
+- gateway_cache: gtw_uid -> istanza Gateways, con scadenza (TTL) e
+  invalidazione esplicita. Evita una SELECT su 'gateways' per ogni report.
+- heartbeats: raccoglie in memoria i 'last_date_call' e li scrive con
+  un'unica UPDATE multi-riga ogni HEARTBEAT_FLUSH_INTERVAL secondi, per
+  non prendere lock di riga sulla tabella condivisa con il sistema legacy
+  a ogni report.
+
+Correttezza del KPI "gateway attivi" (last_date_call negli ultimi
+GATEWAY_ACTIVE_WINDOW_MINUTES): se il valore già scritto su DB
+uscirebbe dalla finestra prima del prossimo flush, l'heartbeat viene
+scritto subito (write-through). Quindi un gateway che sta inviando
+report risulta sempre attivo su DB, anche tra un flush e l'altro.
+
+Il flush periodico avviene solo nel thread in background, fuori dalle
+transazioni delle richieste; il write-through gira invece nella
+transazione dell'ingestion e viene considerato scritto solo al commit.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DateTimeField, F, Q, Value, When
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Gateways
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayCache:
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else settings.GATEWAY_CACHE_TTL
+
+    def get(self, gtw_uid):
+        """Restituisce il gateway (o None se non esiste)."""
+        return self.get_many([gtw_uid]).get(gtw_uid)
+
+    def get_many(self, gtw_uids):
+        """
+        Restituisce {gtw_uid: gateway} per gli uid esistenti, caricando
+        dal DB solo quelli mancanti o scaduti (una sola query).
+        """
+        found, missing, now = self._lookup(gtw_uids)
+        if missing:
+            found.update(self._store(Gateways.objects.in_bulk(missing, field_name='gtw_uid'), now))
+        return found
+
+    async def aget(self, gtw_uid):
+        """Come get(), con l'ORM asincrono (per le view async)."""
+        found, missing, now = self._lookup([gtw_uid])
+        if missing:
+            found.update(self._store(await Gateways.objects.ain_bulk(missing, field_name='gtw_uid'), now))
+        return found.get(gtw_uid)
+
+    def _lookup(self, gtw_uids):
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for uid in gtw_uids:
+                entry = self._entries.get(uid)
+                if entry and entry[1] > now:
+                    found[uid] = entry[0]
+                else:
+                    missing.append(uid)
+        return found, missing, now
+
+    def _store(self, loaded, now):
+        expires = now + self.ttl
+        with self._lock:
+            for uid, gateway in loaded.items():
+                self._entries[uid] = (gateway, expires)
+        return loaded
+
+    def invalidate(self, gtw_uid=None):
+        """Invalida un gateway, o tutta la cache se gtw_uid è None."""
+        with self._lock:
+            if gtw_uid is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(gtw_uid, None)
+
+
+class HeartbeatCoalescer:
+
+    def __init__(self, interval=None):
+        self._interval = interval
+        self._pending = {}   # gtw_uid -> ultimo last_date_call non ancora scritto
+        self._flushed = {}   # gtw_uid -> ultimo last_date_call scritto su DB
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def interval(self):
+        return self._interval if self._interval is not None else settings.HEARTBEAT_FLUSH_INTERVAL
+
+    def record(self, gtw_uid, when=None, last_known=None):
+        """
+        Registra una chiamata del gateway. `last_known` è il last_date_call
+        noto (es. dall'istanza in cache), usato al primo heartbeat.
+        """
+        when = when or timezone.now()
+        if self.interval <= 0:
+            self._write({gtw_uid: when})
+            return
+
+        window = timedelta(minutes=settings.GATEWAY_ACTIVE_WINDOW_MINUTES)
+        margin = timedelta(seconds=self.interval * 2)
+        with self._lock:
+            on_db = self._flushed.get(gtw_uid, last_known)
+            # Il valore su DB uscirebbe dalla finestra prima del flush: scrive subito
+            write_through = on_db is None or when - on_db >= window - margin
+            if not write_through:
+                previous = self._pending.get(gtw_uid)
+                if previous is None or when > previous:
+                    self._pending[gtw_uid] = when
+
+        if write_through:
+            self._write({gtw_uid: when})
+        else:
+            self._ensure_thread()
+
+    def flush(self):
+        """Scrive tutti gli heartbeat in sospeso con un'unica UPDATE."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            return self._write(pending)
+        except Exception:
+            # Rimette in coda i valori non scritti (senza perdere quelli più recenti)
+            with self._lock:
+                for uid, when in pending.items():
+                    if uid not in self._pending or self._pending[uid] < when:
+                        self._pending[uid] = when
+            raise
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _write(self, values):
+        # Solo in avanti: un valore più recente scritto da un altro worker
+        # (o dal sistema legacy) non viene sovrascritto
+        updated = Gateways.objects.filter(gtw_uid__in=list(values)).update(
+            last_date_call=Case(
+                *[
+                    When(Q(gtw_uid=uid) & (Q(last_date_call__isnull=True) | Q(last_date_call__lt=when)),
+                         then=Value(when))
+                    for uid, when in values.items()
+                ],
+                default=F('last_date_call'),
+                output_field=DateTimeField(),
+            )
+        )
+        # Nella transazione di una richiesta: valori scritti solo dopo il
+        # commit (con un rollback il prossimo report riprova il write-through)
+        transaction.on_commit(lambda: self._mark_flushed(values))
+        return updated
+
+    def _mark_flushed(self, values):
+        with self._lock:
+            for uid, when in values.items():
+                if uid not in self._flushed or self._flushed[uid] < when:
+                    self._flushed[uid] = when
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='heartbeat-coalescer', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        # Flush periodico anche quando non arrivano altri report
+        while True:
+            time.sleep(max(self.interval, 0.1))
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Errore flush heartbeat gateway")
+            finally:
+                connection.close()
+
+
+gateway_cache = GatewayCache()
+heartbeats = HeartbeatCoalescer()
+
+# Alla chiusura del worker scrive gli heartbeat rimasti in memoria
+atexit.register(heartbeats.flush)
+
+
+@receiver([post_save, post_delete], sender=Gateways)
+def _invalidate_gateway(sender, instance, **kwargs):
+    gateway_cache.invalidate(instance.gtw_uid)
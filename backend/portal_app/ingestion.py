@@ -0,0 +1,262 @@
+"""
+Logica di ingestion delle metriche inviate dai gateway.
+
+Usata sia dall'endpoint singolo (MetricsIngestionView) sia da quello
+batch (MetricsBatchIngestionView), così i due percorsi scrivono le
+righe esattamente nello stesso modo.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .actions import deliver_pending_actions
+from .alerts import evaluate_alerts
+from .gateway_cache import gateway_cache, heartbeats
+from .ingestion_queue import SpoolQueue
+from .instrumentation import count_ingested_rows
+from .latest_state import parse_timestamp, update_latest_state
+from .live import publish_points
+from .writers import get_metrics_writer
+
+
+def report_timestamp(value):
+    """
+    Timestamp del report come datetime aware: senza fuso orario vale
+    quello corrente (TIME_ZONE), per qualunque writer. Solleva ValueError
+    se non è una data ISO 8601.
+    """
+    if not isinstance(value, (str, datetime)):
+        raise ValueError(f"timestamp non valido: {value!r}")
+    try:
+        return parse_timestamp(value)
+    except (ValidationError, AttributeError):
+        raise ValueError(f"timestamp non valido: {value!r}")
+
+
+# Colonne int4: un valore fuori intervallo farebbe fallire tutta la scrittura bulk
+INT4_MIN, INT4_MAX = -2 ** 31, 2 ** 31 - 1
+
+
+def _integer(name, value):
+    # Interi anche se inviati come "12" o 12.0, mai come bool o 12.5
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{name} non è un intero: {value!r}")
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{name} non è un intero: {value!r}")
+    if not INT4_MIN <= value <= INT4_MAX:
+        raise ValueError(f"{name} fuori intervallo: {value}")
+    return value
+
+
+def _number(name, value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{name} non è un numero: {value!r}")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} non è un numero: {value!r}")
+
+
+def _text(name, value):
+    if value is None:
+        return None
+    if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+        raise ValueError(f"{name} non è una stringa: {value!r}")
+    return str(value)
+
+
+def build_mirth_rows(gtw_uid, timestamp, mirth_metrics_data):
+    """
+    Converte il blocco "mirth" del report in tuple ordinate come
+    writers.MIRTH_COLUMNS, con i valori già convertiti ai tipi delle
+    colonne (così COPY e bulk_create scrivono gli stessi valori).
+    Solleva KeyError se manca un campo obbligatorio e ValueError se un
+    valore non è del tipo atteso.
+    """
+    timestamp = report_timestamp(timestamp)
+    return [
+        (
+            gtw_uid, timestamp, _text('channel_name', name), _text('channelId', details['channelId']),
+            *(_integer(f'{name}.{c}', metrics[c]) for c in ('received', 'sent', 'error', 'filtered', 'queued')),
+        )
+        for name, details in mirth_metrics_data.items()
+        for metrics in [details['metrics']]
+    ]
+
+
+def build_check_rows(gtw_uid, timestamp, check_status_data):
+    """
+    Converte il blocco "CheckStatus" del report in tuple ordinate come
+    writers.CHECK_COLUMNS, con i valori già convertiti (vedi
+    build_mirth_rows). Solleva KeyError se manca un campo obbligatorio e
+    ValueError se un valore non è del tipo atteso.
+    """
+    timestamp = report_timestamp(timestamp)
+    return [
+        (
+            gtw_uid, timestamp, _text('check_name', name), _text(f'{name}.level', details['level']),
+            _text(f'{name}.description', details.get('description', '')),
+            _integer(f'{name}.act', details['act']), _integer(f'{name}.limit', details['limit']),
+            _text(f'{name}.operator', details['operator']),
+            _number(f'{name}.query_time_sec', details.get('query_time_sec')),
+        )
+        for name, details in check_status_data.items()
+    ]
+
+
+def touch_gateways(gtw_uids, when=None):
+    """
+    Registra la chiamata dei gateway indicati. L'UPDATE di 'last_date_call'
+    viene accorpata dal coalescer (vedi gateway_cache.heartbeats).
+    """
+    when = when or timezone.now()
+    gateways = gateway_cache.get_many(gtw_uids)
+    for gtw_uid, gateway in gateways.items():
+        heartbeats.record(gtw_uid, when, last_known=gateway.last_date_call)
+
+
+def prepare_reports(reports):
+    """
+    Valida una lista di report (anche di gateway diversi) e ne costruisce
+    le righe, senza scrivere nulla.
+
+    Restituisce (results, mirth_rows, check_rows, touched): un risultato
+    per ogni report, nello stesso ordine, le righe da scrivere e i gtw_uid
+    dei report validi. I report non validi vengono scartati senza
+    bloccare gli altri.
+    """
+    # Risolve tutti i gateway (dalla cache, o con una sola query)
+    uids = {r.get('gtw_uid') for r in reports if isinstance(r, dict) and r.get('gtw_uid')}
+    gateways = gateway_cache.get_many(uids) if uids else {}
+
+    results = []
+    mirth_rows = []
+    check_rows = []
+    touched = set()
+
+    for index, data in enumerate(reports):
+        if not isinstance(data, dict):
+            results.append({"index": index, "status": "error", "error": "Report non valido"})
+            continue
+        try:
+            gtw_uid = data['gtw_uid']
+            timestamp = data['timestamp']
+
+            if gtw_uid not in gateways:
+                results.append({
+                    "index": index, "gtw_uid": gtw_uid,
+                    "status": "error", "error": "Gateway non valido"
+                })
+                continue
+
+            report_mirth = build_mirth_rows(gtw_uid, timestamp, data.get('mirth', {}))
+            report_check = build_check_rows(gtw_uid, timestamp, data.get('CheckStatus', {}))
+        except KeyError as e:
+            results.append({
+                "index": index, "gtw_uid": data.get('gtw_uid'),
+                "status": "error", "error": f"Campo JSON mancante: {e}"
+            })
+            continue
+        except ValueError as e:
+            results.append({
+                "index": index, "gtw_uid": data.get('gtw_uid'),
+                "status": "error", "error": f"Valore non valido: {e}"
+            })
+            continue
+        except (AttributeError, TypeError):
+            results.append({
+                "index": index, "gtw_uid": data.get('gtw_uid'),
+                "status": "error", "error": "Struttura del report non valida"
+            })
+            continue
+
+        mirth_rows.extend(report_mirth)
+        check_rows.extend(report_check)
+        touched.add(gtw_uid)
+        results.append({
+            "index": index, "gtw_uid": gtw_uid, "status": "success",
+            "mirth_records": len(report_mirth), "check_records": len(report_check),
+        })
+
+    count_ingested_rows(len(mirth_rows), len(check_rows))
+    return results, mirth_rows, check_rows, touched
+
+
+def write_rows(mirth_rows, check_rows):
+    """
+    Scrive le righe con il writer configurato: una scrittura bulk per tabella,
+    più l'upsert dell'ultimo stato per canale/check (latest_state.py).
+    Gli allarmi (alerts.py) vengono valutati prima dell'upsert, per
+    confrontare i contatori Mirth con il report precedente.
+    I nuovi punti vengono pubblicati agli aggiornamenti live al commit.
+    """
+    writer = get_metrics_writer()
+    writer.write_mirth(mirth_rows)
+    writer.write_checks(check_rows)
+    evaluate_alerts(mirth_rows, check_rows)
+    update_latest_state(mirth_rows, check_rows)
+    publish_points(mirth_rows)
+
+
+def store_report(gateway, data, mirth_rows, check_rows):
+    """
+    Salva un singolo report già validato (o lo accoda, se
+    INGESTION_MODE='queue'), registra la chiamata del gateway e consegna
+    le sue azioni in sospeso. Va chiamata dentro una transazione.
+
+    Restituisce (queued, pending_actions). Solleva QueueFull se la coda è piena.
+    """
+    count_ingested_rows(len(mirth_rows), len(check_rows))
+    queued = settings.INGESTION_MODE == 'queue'
+    if queued:
+        SpoolQueue().enqueue([data])
+    else:
+        # COPY su PostgreSQL, bulk_create altrove
+        write_rows(mirth_rows, check_rows)
+
+    # 'last_date_call' (UPDATE accorpate dal coalescer) e azioni in sospeso
+    heartbeats.record(gateway.gtw_uid, timezone.now(), last_known=gateway.last_date_call)
+    return queued, deliver_pending_actions([gateway.gtw_uid])
+
+
+def ingest_reports(reports):
+    """
+    Salva una lista di report (anche di gateway diversi) con una sola
+    scrittura bulk per tabella. Va chiamata dentro una transazione.
+
+    Restituisce (results, pending_actions): un risultato per ogni report
+    e le azioni in sospeso di tutti i gateway validi.
+    """
+    results, mirth_rows, check_rows, touched = prepare_reports(reports)
+    write_rows(mirth_rows, check_rows)
+
+    # Aggiorna 'last_date_call' e raccoglie le azioni in sospeso
+    touch_gateways(touched)
+    actions_data = deliver_pending_actions(touched)
+
+    return results, actions_data
+
+
+def enqueue_reports(reports):
+    """
+    Modalità coda (INGESTION_MODE='queue'): valida i report, accoda quelli
+    validi per il writer in background e consegna subito le azioni in
+    sospeso. Solleva QueueFull se la coda è piena.
+
+    Restituisce (results, pending_actions) come ingest_reports.
+    """
+    results, _, _, touched = prepare_reports(reports)
+    valid = [reports[r['index']] for r in results if r['status'] == 'success']
+    if valid:
+        SpoolQueue().enqueue(valid)
+
+    touch_gateways(touched)
+    actions_data = deliver_pending_actions(touched)
+
+    return results, actions_data
@@ -0,0 +1,183 @@
+"""
+Coda di ingestion su disco (spool directory).
+
+In modalità INGESTION_MODE='queue' le view di ingestion validano il
+report, lo accodano qui e rispondono subito; il comando
+`manage.py ingestion_writer` svuota poi la coda a blocchi grandi.
+
+Layout della directory:
+    ready/        file pronti, uno per chiamata (lista JSON di report)
+    processing/   file presi in carico da un writer
+    failed/       file illeggibili o la cui scrittura è fallita
+                  INGESTION_WRITER_MAX_ATTEMPTS volte, lasciati per
+                  analisi manuale
+
+I nomi iniziano con il timestamp in nanosecondi, quindi l'ordine
+alfabetico corrisponde all'ordine di arrivo (FIFO). Un file rimesso in
+coda dopo un errore porta nel nome il numero di tentativi
+(<timestamp>-<uuid>.<tentativi>.json). Ogni file viene
+scritto in tmp/, sincronizzato su disco e poi spostato con rename
+atomico in ready/: il writer non vede mai file scritti a metà.
+"""
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+
+class QueueFull(Exception):
+    """La coda ha superato INGESTION_QUEUE_MAX_DEPTH (backpressure)."""
+
+
+class SpoolQueue:
+
+    def __init__(self, directory=None, max_depth=None, max_attempts=None):
+        self.directory = Path(directory or settings.INGESTION_SPOOL_DIR)
+        self.max_depth = max_depth if max_depth is not None else settings.INGESTION_QUEUE_MAX_DEPTH
+        self.max_attempts = max_attempts if max_attempts is not None else settings.INGESTION_WRITER_MAX_ATTEMPTS
+        self.tmp_dir = self.directory / 'tmp'
+        self.ready_dir = self.directory / 'ready'
+        self.processing_dir = self.directory / 'processing'
+        self.failed_dir = self.directory / 'failed'
+        for d in (self.tmp_dir, self.ready_dir, self.processing_dir, self.failed_dir):
+            d.mkdir(parents=True, exist_ok=True)
+
+    # --- Lato produttore (view) ---
+
+    def enqueue(self, reports):
+        """
+        Accoda una lista di report in modo durevole.
+        Solleva QueueFull se la coda è oltre la profondità massima.
+        """
+        if self.max_depth and self.depth() >= self.max_depth:
+            raise QueueFull(f"Coda di ingestion piena ({self.max_depth} file)")
+
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex}.json"
+        tmp_path = self.tmp_dir / name
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(reports, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.ready_dir / name)
+        self._fsync_dir(self.ready_dir)
+        return name
+
+    # --- Lato consumatore (writer) ---
+
+    def claim(self, limit):
+        """
+        Prende in carico fino a `limit` file (i più vecchi) spostandoli in
+        processing/. Restituisce una lista di (path, reports).
+        Il rename è atomico: due writer non prendono mai lo stesso file.
+        """
+        claimed = []
+        for name in sorted(os.listdir(self.ready_dir)):
+            if len(claimed) >= limit:
+                break
+            target = self.processing_dir / name
+            try:
+                os.rename(self.ready_dir / name, target)
+            except FileNotFoundError:
+                continue # preso da un altro writer
+            try:
+                with open(target, encoding='utf-8') as f:
+                    reports = json.load(f)
+            except (OSError, ValueError):
+                os.rename(target, self.failed_dir / name)
+                continue
+            claimed.append((target, reports))
+        return claimed
+
+    def ack(self, paths):
+        """Rimuove i file scritti con successo."""
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def release(self, paths, count_attempt=True):
+        """
+        Rimette in ready/ i file di un blocco fallito, per riprovare.
+        Con `count_attempt` (errore causato dal contenuto del file, non dal
+        database) conta il tentativo e oltre max_attempts sposta il file in
+        failed/. Restituisce i nomi dei file spostati in failed/.
+        """
+        failed = []
+        for path in paths:
+            name = Path(path).name
+            try:
+                if not count_attempt:
+                    os.rename(path, self.ready_dir / name)
+                    continue
+                attempts = self.attempts(name) + 1
+                if self.max_attempts and attempts >= self.max_attempts:
+                    os.rename(path, self.failed_dir / name)
+                    failed.append(name)
+                else:
+                    base = name.split('.', 1)[0]
+                    os.rename(path, self.ready_dir / f"{base}.{attempts}.json")
+            except FileNotFoundError:
+                pass
+        return failed
+
+    @staticmethod
+    def attempts(name):
+        """Tentativi di scrittura già falliti del file `name`."""
+        parts = name.split('.')
+        return int(parts[1]) if len(parts) == 3 else 0
+
+    def recover(self, stale_after):
+        """
+        Rimette in coda i file rimasti in processing/ da più di
+        `stale_after` secondi (es. writer terminato a metà blocco).
+        """
+        now = time.time()
+        recovered = 0
+        for name in os.listdir(self.processing_dir):
+            path = self.processing_dir / name
+            try:
+                if now - path.stat().st_mtime >= stale_after:
+                    os.rename(path, self.ready_dir / name)
+                    recovered += 1
+            except FileNotFoundError:
+                pass
+        return recovered
+
+    # --- Metriche ---
+
+    def depth(self):
+        return len(os.listdir(self.ready_dir))
+
+    def oldest_age(self):
+        """Età in secondi del file più vecchio in coda (0 se vuota)."""
+        names = sorted(os.listdir(self.ready_dir))
+        if not names:
+            return 0.0
+        enqueued_ns = int(names[0].split('-', 1)[0])
+        return max(0.0, (time.time_ns() - enqueued_ns) / 1e9)
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "oldest_age_sec": round(self.oldest_age(), 3),
+            "processing": len(os.listdir(self.processing_dir)),
+            "failed": len(os.listdir(self.failed_dir)),
+        }
+
+    @staticmethod
+    def _fsync_dir(directory):
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
@@ -0,0 +1,339 @@
+"""
+Metriche delle richieste HTTP in formato Prometheus (GET /metrics).
+
+MetricsMiddleware registra per ogni view (nome della route, es.
+'mirth-history', 'gateway-detail'), metodo e status:
+- numero di richieste e istogramma delle durate;
+- query SQL eseguite e loro durata (istogramma delle query per richiesta:
+  gli N+1 compaiono come code lunghe);
+- dimensione delle risposte (non per quelle in streaming, per cui la
+  durata è il tempo fino all'inizio della risposta);
+- righe ricevute dall'ingestion.
+
+METRICS_MODE:
+- 'basic' (default): solo contatori e istogrammi aggiornati una volta per
+  richiesta sotto un lock, più un contatore per query; adatto alla
+  produzione;
+- 'full': anche le query ripetute identiche nella stessa richiesta
+  (tipico segnale di un N+1); conserva il testo delle query della
+  richiesta, da usare per le indagini;
+- 'off': middleware disattivato.
+
+Ogni worker di gunicorn ha le sue metriche: con METRICS_DIR ogni worker
+salva le proprie su file (al più ogni METRICS_FLUSH_INTERVAL secondi e
+all'uscita) e /metrics restituisce la somma di tutti i worker.
+"""
+import atexit
+import contextvars
+import hmac
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.permissions import BasePermission
+
+PREFIX = 'portal_'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# nome -> (tipo, descrizione, label, bucket degli istogrammi)
+METRICS = {
+    'http_requests_total': ('counter', 'Richieste HTTP', ('view', 'method', 'status'), None),
+    'http_request_duration_seconds': (
+        'histogram', 'Durata delle richieste HTTP', ('view', 'method'), DURATION_BUCKETS
+    ),
+    'http_db_queries_per_request': (
+        'histogram', 'Query SQL eseguite per richiesta', ('view', 'method'), QUERY_COUNT_BUCKETS
+    ),
+    'http_db_query_seconds_total': ('counter', 'Tempo speso nelle query SQL', ('view', 'method'), None),
+    'http_db_duplicate_queries_total': (
+        'counter', 'Query SQL ripetute identiche nella stessa richiesta (METRICS_MODE=full)',
+        ('view', 'method'), None
+    ),
+    'http_response_size_bytes': (
+        'histogram', 'Dimensione delle risposte HTTP (escluse quelle in streaming)',
+        ('view', 'method'), SIZE_BUCKETS
+    ),
+    'ingested_rows_total': ('counter', "Righe ricevute dall'ingestion", ('view', 'table'), None),
+}
+
+
+class RequestStats:
+    """Dati raccolti durante una richiesta."""
+    __slots__ = ('queries', 'query_time', 'statements', 'duplicates', 'rows')
+
+    def __init__(self, full):
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = set() if full else None
+        self.duplicates = 0
+        self.rows = {}
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def count_ingested_rows(mirth_rows, check_rows):
+    """Righe ricevute dalla richiesta in corso (nessun effetto fuori da una richiesta)."""
+    stats = _current.get()
+    if stats is not None:
+        stats.rows['mirth_metrics'] = stats.rows.get('mirth_metrics', 0) + mirth_rows
+        stats.rows['check_status_metrics'] = stats.rows.get('check_status_metrics', 0) + check_rows
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.query_time += time.perf_counter() - start
+        stats.queries += 1
+        if stats.statements is not None:
+            if sql in stats.statements:
+                stats.duplicates += 1
+            else:
+                stats.statements.add(sql)
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    # connection_created scatta a ogni nuova connessione dello stesso wrapper
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class Registry:
+    """
+    Metriche del processo: valori per (nome, label). Gli istogrammi sono
+    [conteggi per bucket (non cumulativi) + overflow, somma, conteggio].
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(dict)
+        self._last_flush = time.monotonic()
+
+    def record(self, view, method, status, duration, stats, size):
+        with self._lock:
+            self._inc('http_requests_total', (view, method, str(status)))
+            labels = (view, method)
+            self._observe('http_request_duration_seconds', labels, duration)
+            self._observe('http_db_queries_per_request', labels, stats.queries)
+            self._inc('http_db_query_seconds_total', labels, stats.query_time)
+            if stats.duplicates:
+                self._inc('http_db_duplicate_queries_total', labels, stats.duplicates)
+            if size is not None:
+                self._observe('http_response_size_bytes', labels, size)
+            for table, rows in stats.rows.items():
+                self._inc('ingested_rows_total', (view, table), rows)
+
+    def _inc(self, name, labels, amount=1):
+        values = self._values[name]
+        values[labels] = values.get(labels, 0) + amount
+
+    def _observe(self, name, labels, value):
+        buckets = METRICS[name][3]
+        values = self._values[name]
+        histogram = values.get(labels)
+        if histogram is None:
+            histogram = values[labels] = [[0] * (len(buckets) + 1), 0, 0]
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: [
+                    [list(labels), [list(value[0]), value[1], value[2]] if isinstance(value, list) else value]
+                    for labels, value in values.items()
+                ]
+                for name, values in self._values.items()
+            }
+
+    def flush_due(self):
+        return time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL
+
+    def flush(self):
+        """Salva le metriche del processo in METRICS_DIR/<pid>.json."""
+        self._last_flush = time.monotonic()
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+registry = Registry()
+
+
+def collect():
+    """
+    Metriche di tutti i worker: quelle salvate in METRICS_DIR (gli altri
+    processi) sommate a quelle correnti di questo processo.
+    """
+    snapshots = [registry.snapshot()]
+    directory = settings.METRICS_DIR
+    if directory and os.path.isdir(directory):
+        own = f'{os.getpid()}.json'
+        for name in os.listdir(directory):
+            if name.endswith('.json') and name != own:
+                try:
+                    with open(os.path.join(directory, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # file di un worker in scrittura o rimosso
+
+    merged = defaultdict(dict)
+    for snapshot in snapshots:
+        for name, values in snapshot.items():
+            if name not in METRICS:
+                continue
+            for labels, value in values:
+                labels = tuple(labels)
+                current = merged[name].get(labels)
+                if current is None:
+                    merged[name][labels] = value
+                elif METRICS[name][0] == 'histogram':
+                    current[0] = [a + b for a, b in zip(current[0], value[0])]
+                    current[1] += value[1]
+                    current[2] += value[2]
+                else:
+                    merged[name][labels] = current + value
+    return merged
+
+
+def render_prometheus(merged):
+    """Metriche nel formato testuale di Prometheus (versione 0.0.4)."""
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        full_name = PREFIX + name
+        lines.append(f'# HELP {full_name} {help_text}')
+        lines.append(f'# TYPE {full_name} {kind}')
+        for labels, value in sorted(merged.get(name, {}).items()):
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(label_names, labels))
+            if kind != 'histogram':
+                lines.append(f'{full_name}{{{label_text}}} {_number(value)}')
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{full_name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{full_name}_sum{{{label_text}}} {_number(total)}')
+            lines.append(f'{full_name}_count{{{label_text}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+# request.auth delle richieste autenticate con METRICS_TOKEN
+METRICS_SCRAPER = 'metrics-scraper'
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """
+    Authorization: Bearer <METRICS_TOKEN> per lo scraper di Prometheus.
+    Con un token diverso l'autenticazione passa alle classi successive (JWT).
+    """
+
+    def authenticate(self, request):
+        token = settings.METRICS_TOKEN
+        auth = get_authorization_header(request).split()
+        if not token or len(auth) != 2 or auth[0].lower() != b'bearer':
+            return None
+        if not hmac.compare_digest(auth[1], token.encode()):
+            return None
+        return AnonymousUser(), METRICS_SCRAPER
+
+    def authenticate_header(self, request):
+        # 401 invece di 403 senza credenziali
+        return 'Bearer realm="metrics"'
+
+
+class HasMetricsAccess(BasePermission):
+    def has_permission(self, request, view):
+        return request.auth == METRICS_SCRAPER or bool(request.user and request.user.is_authenticated)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    """
+    Registra durata, query SQL, righe ricevute e dimensione della risposta
+    di ogni richiesta (vedi il docstring del modulo). Sincrono e asincrono:
+    in modalità ASGI non aggiunge passaggi tra thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.METRICS_MODE == 'off':
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.full = settings.METRICS_MODE == 'full'
+        connection_created.connect(_install_query_counter, dispatch_uid='portal_metrics_query_counter')
+        for connection in connections.all(initialized_only=True):
+            _install_query_counter(None, connection)
+        if settings.METRICS_DIR:
+            atexit.register(registry.flush)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats(self.full)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats(self.full)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def _record(self, request, response, stats, duration):
+        size = None if response.streaming else len(response.content)
+        registry.record(_view_name(request), request.method, response.status_code, duration, stats, size)
+        if settings.METRICS_DIR and registry.flush_due():
+            registry.flush()
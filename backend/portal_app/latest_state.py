@@ -0,0 +1,210 @@
+"""
+Ultimo stato noto di ogni canale Mirth e di ogni check per gateway.
+
+Le tabelle mirth_channel_state e check_status_state hanno una riga per
+(gateway, canale) e per (gateway, check), aggiornata dall'ingestion con
+INSERT ... ON CONFLICT DO UPDATE nella stessa transazione delle righe
+grezze. La panoramica della flotta (fleet_overview) le legge con query
+sull'indice univoco, senza DISTINCT ON su mirth_metrics/check_status_metrics.
+
+Un report più vecchio dello stato salvato (es. report bufferizzati
+inviati in ritardo con l'ingestion batch) non sovrascrive lo stato.
+
+Su un database esistente le tabelle si popolano la prima volta con
+`manage.py rebuild_latest_state`.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import CheckStatusMetrics, CheckStatusState, Gateways, MirthChannelState, MirthMetrics
+from .writers import CHECK_COLUMNS, MIRTH_COLUMNS
+
+# Tabella di stato -> (tabella sorgente, colonne, colonne della chiave)
+STATES = {
+    MirthChannelState: (MirthMetrics, MIRTH_COLUMNS, ('gateway_uid', 'channel_name')),
+    CheckStatusState: (CheckStatusMetrics, CHECK_COLUMNS, ('gateway_uid', 'check_name')),
+}
+
+_timestamp_field = MirthChannelState._meta.get_field('gateway_timestamp')
+
+
+def parse_timestamp(value):
+    """Timestamp di un report (stringa ISO 8601 o datetime) come datetime aware."""
+    value = _timestamp_field.to_python(value)
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def update_latest_state(mirth_rows, check_rows):
+    """
+    Aggiorna lo stato con le righe dell'ingestion (tuple come
+    writers.MIRTH_COLUMNS / CHECK_COLUMNS). Va chiamata nella transazione
+    che scrive le righe.
+    """
+    upsert_state(MirthChannelState, mirth_rows)
+    upsert_state(CheckStatusState, check_rows)
+
+
+def upsert_state(model, rows):
+    """
+    Upsert delle righe nella tabella di stato `model`: per ogni chiave
+    vince la riga con gateway_timestamp più recente, sia all'interno di
+    `rows` sia rispetto allo stato già salvato.
+    """
+    if not rows:
+        return 0
+    _, columns, key = STATES[model]
+    fields = {f.column: f for f in model._meta.concrete_fields}
+    ts_index = columns.index('gateway_timestamp')
+    key_index = [columns.index(c) for c in key]
+
+    latest = {}
+    for row in rows:
+        ts = parse_timestamp(row[ts_index])
+        row_key = tuple(row[i] for i in key_index)
+        if row_key not in latest or latest[row_key][0] <= ts:
+            latest[row_key] = (ts, row)
+
+    # Ordine costante delle chiavi: transazioni concorrenti bloccano le
+    # righe nello stesso ordine (niente deadlock)
+    values = []
+    for row_key in sorted(latest):
+        ts, row = latest[row_key]
+        row = list(row)
+        row[ts_index] = connection.ops.adapt_datetimefield_value(ts)
+        values.append(row)
+
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    sql_head = 'INSERT INTO {} ({}) '.format(table, ', '.join(quote(c) for c in columns))
+    sql_tail = ' ON CONFLICT ({}) DO UPDATE SET {} WHERE {}.{} <= EXCLUDED.{}'.format(
+        ', '.join(quote(c) for c in key),
+        ', '.join(f'{quote(c)} = EXCLUDED.{quote(c)}' for c in columns if c not in key),
+        table, quote('gateway_timestamp'), quote('gateway_timestamp'),
+    )
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Un array per colonna: un solo statement con pochi parametri,
+            # qualunque sia il numero di righe
+            arrays = ', '.join(f'%s::{fields[c].db_type(connection)}[]' for c in columns)
+            cursor.execute(
+                sql_head + f'SELECT * FROM unnest({arrays})' + sql_tail,
+                [list(column) for column in zip(*values)],
+            )
+        else:
+            placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+            batch_size = connection.ops.bulk_batch_size(columns, values)
+            for start in range(0, len(values), batch_size):
+                batch = values[start:start + batch_size]
+                cursor.execute(
+                    sql_head + 'VALUES ' + ', '.join([placeholders] * len(batch)) + sql_tail,
+                    [v for row in batch for v in row],
+                )
+    return len(values)
+
+
+def rebuild_latest_state(model, since=None, gateways=None):
+    """
+    Ricalcola lo stato `model` dalle righe grezze (da `since` in poi e dei
+    soli `gateways`, se indicati). Su PostgreSQL con un solo INSERT ...
+    SELECT DISTINCT ON. Restituisce il numero di chiavi scritte (o lette,
+    fuori da PostgreSQL).
+    """
+    source, columns, key = STATES[model]
+    queryset = source.objects.all()
+    if since is not None:
+        queryset = queryset.filter(gateway_timestamp__gte=since)
+    if gateways is not None:
+        queryset = queryset.filter(gateway_id__in=list(gateways))
+
+    if connection.vendor != 'postgresql':
+        rows = queryset.order_by().values_list(*[_attname(source, c) for c in columns])
+        return upsert_state(model, list(rows))
+
+    quote = connection.ops.quote_name
+    conditions, params = [], []
+    if since is not None:
+        conditions.append(f'{quote("gateway_timestamp")} >= %s')
+        params.append(since)
+    if gateways is not None:
+        conditions.append(f'{quote(source._meta.get_field("gateway").column)} = ANY(%s)')
+        params.append(list(gateways))
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    cols = ', '.join(quote(c) for c in columns)
+    key_cols = ', '.join(quote(c) for c in key)
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} ({cols}) '
+        f'SELECT DISTINCT ON ({key_cols}) {cols} FROM {quote(source._meta.db_table)}{where} '
+        f'ORDER BY {key_cols}, {quote("gateway_timestamp")} DESC '
+        f'ON CONFLICT ({key_cols}) DO UPDATE SET '
+        + ', '.join(f'{quote(c)} = EXCLUDED.{quote(c)}' for c in columns if c not in key)
+        + f' WHERE {quote(model._meta.db_table)}.{quote("gateway_timestamp")} <= EXCLUDED.{quote("gateway_timestamp")}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def _attname(model, column):
+    return next(f.attname for f in model._meta.concrete_fields if f.column == column)
+
+
+GATEWAY_FIELDS = (
+    'pk', 'gtw_uid', 'gtw_name', 'last_date_call', 'sw_version', 'current_version', 'gateway_description',
+)
+CHANNEL_FIELDS = ('channel_name', 'channel_id', 'gateway_timestamp', 'received', 'sent', 'error', 'filtered', 'queued')
+CHECK_FIELDS = (
+    'check_name', 'gateway_timestamp', 'level', 'description', 'actual_value', 'limit_value',
+    'operator', 'query_time_sec',
+)
+
+
+def fleet_overview():
+    """
+    Stato corrente di tutti i gateway: canali Mirth e check con gli
+    ultimi valori ricevuti, più un riepilogo per gateway e complessivo.
+
+    Un canale/check è 'stale' se l'ultimo valore è più vecchio dell'ultimo
+    report del gateway (canale rimosso o check non più inviato).
+    """
+    now = timezone.now()
+    active_since = now - timedelta(minutes=settings.GATEWAY_ACTIVE_WINDOW_MINUTES)
+
+    gateways = {}
+    for gateway in Gateways.objects.order_by('pk').values(*GATEWAY_FIELDS):
+        gateway.update(
+            online=gateway['last_date_call'] is not None and gateway['last_date_call'] >= active_since,
+            last_report=None, channels=[], checks=[],
+        )
+        gateways[gateway['gtw_uid']] = gateway
+
+    for name, model, fields in (
+        ('channels', MirthChannelState, CHANNEL_FIELDS),
+        ('checks', CheckStatusState, CHECK_FIELDS),
+    ):
+        key = fields[0]
+        for row in model.objects.order_by('gateway_id', key).values('gateway_id', *fields):
+            gateway = gateways.get(row.pop('gateway_id'))
+            if gateway is None:
+                continue
+            gateway[name].append(row)
+            if gateway['last_report'] is None or row['gateway_timestamp'] > gateway['last_report']:
+                gateway['last_report'] = row['gateway_timestamp']
+
+    summary = {'gateways': len(gateways), 'online': 0, 'errors': 0, 'queued': 0, 'checks_not_ok': 0}
+    for gateway in gateways.values():
+        for row in gateway['channels'] + gateway['checks']:
+            row['stale'] = row['gateway_timestamp'] < gateway['last_report']
+        current_channels = [c for c in gateway['channels'] if not c['stale']]
+        gateway['errors'] = sum(c['error'] for c in current_channels)
+        gateway['queued'] = sum(c['queued'] for c in current_channels)
+        gateway['checks_not_ok'] = sum(1 for c in gateway['checks'] if not c['stale'] and c['level'] != 'OK')
+
+        summary['online'] += gateway['online']
+        for field in ('errors', 'queued', 'checks_not_ok'):
+            summary[field] += gateway[field]
+
+    return {'generated_at': now, 'summary': summary, 'gateways': list(gateways.values())}
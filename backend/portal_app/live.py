@@ -0,0 +1,411 @@
+"""
+Aggiornamenti live della dashboard con Server-Sent Events.
+
+Invece di ricaricare periodicamente /dashboard/stats/ e lo storico, il
+frontend apre GET /api/live/ e riceve:
+
+    event: points   nuovi punti Mirth appena ingeriti (filtrabili per
+                    gateway_uid / channel_name), timestamp in ms epoch
+    event: kpi      solo i KPI cambiati (il primo evento li contiene tutti)
+    event: reset    eventi persi: il client deve ricaricare i dati
+
+Gli eventi nascono dall'ingestion (write_rows): su PostgreSQL passano da
+NOTIFY (vedi pg_listener.py), così arrivano a tutti i worker e anche dal
+writer in background della modalità coda; altrimenti restano nel
+processo che ha scritto le righe.
+
+I KPI vengono ricalcolati da un solo thread per processo (e, grazie al
+lock dello snapshot, da un solo processo alla volta) quando l'ingestion
+segnala nuovi dati, al più ogni LIVE_KPI_INTERVAL secondi: N dashboard
+aperte costano un calcolo, non N richieste.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import pg_listener
+from .columnar import epoch_ms
+from .dashboard import refresh_if_older
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'metrics_live'
+
+# Limite del payload di NOTIFY (8000 byte) con un po' di margine
+NOTIFY_MAX_BYTES = 7500
+
+POINT_FIELDS = ('received', 'sent', 'error', 'filtered', 'queued')
+
+TOPICS = ('kpi', 'points')
+
+
+class TooManyClients(Exception):
+    pass
+
+
+class LiveHub:
+    """
+    Buffer circolare degli eventi del processo. Ogni client tiene il
+    numero di sequenza dell'ultimo evento letto.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        # Client asincroni (ASGI) in attesa: (event loop, asyncio.Event)
+        self._async_waiters = set()
+        self._events = deque()
+        self._seq = 0
+        self._clients = 0
+        # Id del processo: un Last-Event-ID di un altro worker non vale qui
+        self.instance = uuid.uuid4().hex[:8]
+        # Ultimi KPI pubblicati (per i client appena connessi)
+        self.kpi_state = None
+        self.kpi_dirty = threading.Event()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    @property
+    def clients(self):
+        return self._clients
+
+    def publish(self, event, data):
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event, data))
+            while len(self._events) > settings.LIVE_BUFFER_SIZE:
+                self._events.popleft()
+            self._cond.notify_all()
+            for loop, waiter in self._async_waiters:
+                loop.call_soon_threadsafe(waiter.set)
+
+    def read(self, after, timeout):
+        """
+        Eventi successivi a `after`, attendendo al più `timeout` secondi.
+        Restituisce (eventi, ultimo seq, persi): `persi` è True se alcuni
+        eventi sono già usciti dal buffer.
+        """
+        with self._cond:
+            if self._seq <= after:
+                self._cond.wait(timeout)
+            return self._after(after)
+
+    async def aread(self, after, timeout):
+        """Come read(), attendendo nell'event loop invece di bloccare un thread."""
+        waiter = asyncio.Event()
+        entry = (asyncio.get_running_loop(), waiter)
+        with self._cond:
+            if self._seq > after:
+                return self._after(after)
+            self._async_waiters.add(entry)
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(entry)
+        with self._cond:
+            return self._after(after)
+
+    def _after(self, after):
+        # Da chiamare con self._cond acquisito
+        oldest = self._events[0][0] if self._events else self._seq + 1
+        if after < oldest - 1:
+            return [], self._seq, True
+        events = [e for e in self._events if e[0] > after]
+        return events, self._seq, False
+
+    def connect(self):
+        with self._cond:
+            if self._clients >= settings.LIVE_MAX_CLIENTS:
+                raise TooManyClients("Troppi client collegati, riprovare più tardi")
+            self._clients += 1
+        ensure_kpi_publisher()
+        self.kpi_dirty.set()  # il nuovo client riceve KPI aggiornati
+
+    def disconnect(self):
+        with self._cond:
+            self._clients -= 1
+
+
+hub = LiveHub()
+
+
+# --- Lato ingestion ---
+
+def _point_rows(mirth_rows):
+    # Tuple di writers.MIRTH_COLUMNS -> [gtw_uid, ms, canale, received, ...]
+    points = []
+    tz = timezone.get_current_timezone()
+    for gtw_uid, timestamp, channel_name, _, *values in mirth_rows:
+        if isinstance(timestamp, str):
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None:
+                continue
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp, tz)
+        points.append([gtw_uid, epoch_ms(timestamp), channel_name, *values])
+    return points
+
+
+def _chunks(points):
+    # Payload JSON compatti che stanno in una NOTIFY
+    chunk, size = [], 2
+    for point in points:
+        encoded = len(json.dumps(point, separators=(',', ':'))) + 1
+        if chunk and size + encoded > NOTIFY_MAX_BYTES:
+            yield json.dumps(chunk, separators=(',', ':'))
+            chunk, size = [], 2
+        chunk.append(point)
+        size += encoded
+    if chunk:
+        yield json.dumps(chunk, separators=(',', ':'))
+
+
+def _receive_points(points):
+    hub.publish('points', points)
+    hub.kpi_dirty.set()
+
+
+def publish_points(mirth_rows):
+    """
+    Pubblica i punti Mirth appena scritti. Va chiamata nella transazione
+    della scrittura: gli eventi partono solo al commit.
+    """
+    if not settings.LIVE_UPDATES or not mirth_rows:
+        return
+    points = _point_rows(mirth_rows)
+    if not points:
+        return
+    if pg_listener.use_postgres_notify():
+        for payload in _chunks(points):
+            pg_listener.notify(CHANNEL, payload)
+    else:
+        transaction.on_commit(lambda: _receive_points(points))
+
+
+def _on_notify(payload):
+    _receive_points(json.loads(payload))
+
+
+def _on_listen(reconnected):
+    if reconnected:
+        # Punti persi durante la disconnessione: i client ricaricano
+        hub.publish('reset', {})
+
+
+pg_listener.register(CHANNEL, _on_notify, on_listen=_on_listen)
+
+
+# --- KPI ---
+
+def kpi_delta(previous, current):
+    """
+    Campi dello snapshot cambiati rispetto al precedente: i KPI singoli
+    e, per intero, le tabelle che sono cambiate.
+    """
+    if previous is None:
+        return dict(current)
+    delta = {}
+    kpi = {k: v for k, v in current['kpi'].items() if previous['kpi'].get(k) != v}
+    if kpi:
+        delta['kpi'] = kpi
+    for key, value in current.items():
+        if key != 'kpi' and previous.get(key) != value:
+            delta[key] = value
+    return delta
+
+
+class KpiPublisher(threading.Thread):
+    """
+    Ricalcola lo snapshot della dashboard quando l'ingestion segnala nuovi
+    dati (al più ogni LIVE_KPI_INTERVAL secondi, altrimenti con il TTL
+    dello snapshot) e pubblica solo i KPI cambiati.
+    """
+
+    def __init__(self):
+        super().__init__(name='live-kpi', daemon=True)
+
+    def run(self):
+        while True:
+            dirty = hub.kpi_dirty.wait(settings.DASHBOARD_SNAPSHOT_TTL)
+            if hub.clients > 0:
+                hub.kpi_dirty.clear()
+                try:
+                    self._publish(settings.LIVE_KPI_INTERVAL if dirty else settings.DASHBOARD_SNAPSHOT_TTL)
+                except Exception:
+                    logger.exception("Errore aggiornamento KPI live")
+                finally:
+                    connection.close()
+            time.sleep(settings.LIVE_KPI_INTERVAL)
+
+    def _publish(self, max_age):
+        snapshot = refresh_if_older(max_age)
+        # Serializzato come in DashboardStatsView (date, Decimal, ...)
+        current = json.loads(json.dumps(snapshot['data'], cls=JSONEncoder))
+        delta = kpi_delta(hub.kpi_state, current)
+        hub.kpi_state = current
+        if delta:
+            delta['computed_at'] = snapshot['computed_at']
+            hub.publish('kpi', delta)
+
+
+_kpi_publisher = None
+_kpi_publisher_lock = threading.Lock()
+
+
+def ensure_kpi_publisher():
+    global _kpi_publisher
+    with _kpi_publisher_lock:
+        if _kpi_publisher is None or not _kpi_publisher.is_alive():
+            _kpi_publisher = KpiPublisher()
+            _kpi_publisher.start()
+
+
+# --- Lato client ---
+
+def _format(seq, event, data):
+    payload = json.dumps(data, cls=JSONEncoder, separators=(',', ':'))
+    return f"id: {hub.instance}:{seq}\nevent: {event}\ndata: {payload}\n\n"
+
+
+class LiveStream:
+    """
+    Corpo della risposta SSE di un client (WSGI: iteratore sincrono). Ha
+    close() (chiamata da Django a fine risposta, anche se il client si
+    scollega) che libera il posto.
+    """
+
+    def __init__(self, topics, gateway_uid=None, channel_name=None, last_event_id=None):
+        hub.connect()
+        self.topics = topics
+        self.gateway_uid = gateway_uid
+        self.channel_name = channel_name
+        self.last_event_id = last_event_id
+        self._closed = False
+        self._events = self._generate()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._events)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._events.close()
+            hub.disconnect()
+
+    def _start(self):
+        # Ripresa dopo una riconnessione allo stesso processo
+        instance, _, seq = (self.last_event_id or '').partition(':')
+        if instance == hub.instance and seq.isdigit():
+            return int(seq), False
+        return hub.seq, bool(self.last_event_id)
+
+    def _points(self, points):
+        return [
+            {'gateway_uid': p[0], 'timestamp': p[1], 'channel_name': p[2], **dict(zip(POINT_FIELDS, p[3:]))}
+            for p in points
+            if (not self.gateway_uid or p[0] == self.gateway_uid)
+            and (not self.channel_name or p[2] == self.channel_name)
+        ]
+
+    def _opening(self):
+        """(cursore iniziale, messaggi iniziali del flusso)."""
+        cursor, lost = self._start()
+        chunks = [f"retry: {settings.LIVE_RETRY_MS}\n\n"]
+        if lost:
+            chunks.append(_format(cursor, 'reset', {}))
+        if 'kpi' in self.topics and hub.kpi_state is not None and not self.last_event_id:
+            chunks.append(_format(cursor, 'kpi', hub.kpi_state))
+        return cursor, chunks
+
+    def _messages(self, events, last, lost):
+        """Messaggi SSE per il client dagli eventi letti dal hub."""
+        chunks = []
+        if lost:
+            chunks.append(_format(last, 'reset', {}))
+        for seq, event, data in events:
+            if event == 'points':
+                if 'points' not in self.topics:
+                    continue
+                data = {'points': self._points(data)}
+                if not data['points']:
+                    continue
+            elif event == 'kpi' and 'kpi' not in self.topics:
+                continue
+            chunks.append(_format(seq, event, data))
+        return chunks
+
+    def _generate(self):
+        deadline = time.monotonic() + settings.LIVE_MAX_DURATION
+        cursor, chunks = self._opening()
+        yield from chunks
+
+        last_write = time.monotonic()
+        while time.monotonic() < deadline:
+            events, cursor, lost = hub.read(cursor, settings.LIVE_HEARTBEAT)
+            chunks = self._messages(events, cursor, lost)
+            if chunks:
+                yield from chunks
+                last_write = time.monotonic()
+            if time.monotonic() - last_write >= settings.LIVE_HEARTBEAT:
+                # Commento SSE: tiene viva la connessione e rileva i client scollegati
+                yield ": ping\n\n"
+                last_write = time.monotonic()
+        # Chiusura periodica: il client si ricollega (anche su un altro worker)
+
+
+class AsyncLiveStream(LiveStream):
+    """
+    Come LiveStream, come iteratore asincrono per ASGI: l'attesa degli
+    eventi avviene nell'event loop (hub.aread) e non occupa un thread.
+    """
+
+    # Senza __iter__ StreamingHttpResponse tratta il corpo come asincrono
+    __iter__ = None
+    __next__ = None
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._events.__anext__()
+
+    def close(self):
+        # Il generatore asincrono viene finalizzato dall'event loop
+        if not self._closed:
+            self._closed = True
+            hub.disconnect()
+
+    async def _generate(self):
+        deadline = time.monotonic() + settings.LIVE_MAX_DURATION
+        cursor, chunks = self._opening()
+        for chunk in chunks:
+            yield chunk
+
+        last_write = time.monotonic()
+        while time.monotonic() < deadline:
+            events, cursor, lost = await hub.aread(cursor, settings.LIVE_HEARTBEAT)
+            chunks = self._messages(events, cursor, lost)
+            for chunk in chunks:
+                yield chunk
+            if chunks:
+                last_write = time.monotonic()
+            if time.monotonic() - last_write >= settings.LIVE_HEARTBEAT:
+                yield ": ping\n\n"
+                last_write = time.monotonic()
@@ -0,0 +1,172 @@
+"""
+Query sui log (kfe_log_event) eseguite interamente nel database.
+
+Il "nome batch" è la parte della descrizione prima del primo " - "
+(es. "xds_cron - ((93vl)) Errore..." -> "xds_cron"). BatchName calcola
+la stessa espressione dell'indice creato da `manage.py create_log_indexes`,
+così PostgreSQL può usarlo sia per i filtri sia per i raggruppamenti.
+
+Ricerca testuale (parametro `search`), modalità:
+- icontains: UPPER(col) LIKE UPPER('%testo%'), comportamento storico,
+  sempre una scansione sequenziale;
+- trigram: col ILIKE '%testo%', servito dagli indici GIN pg_trgm;
+- fts: ricerca per parole (websearch_to_tsquery) su un tsvector
+  indicizzato, con punteggio di rilevanza (ts_rank).
+Con LOG_SEARCH_MODE=auto si usa trigram se gli indici esistono.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, CharField, Count, FloatField, Func, Q, Value
+from django.utils import timezone
+
+from .models import KfeLogEvent
+
+# Espressione SQL indicizzata (deve coincidere con quella di BatchName)
+BATCH_NAME_SQL = "btrim(split_part(description, ' - ', 1))"
+
+# Espressione indicizzata per la ricerca per parole (deve coincidere con LogSearchVector)
+SEARCH_VECTOR_SQL = "to_tsvector('simple', coalesce(description, '') || ' ' || coalesce(doc_channel, ''))"
+
+SEARCH_MODES = ('icontains', 'trigram', 'fts')
+TRIGRAM_INDEXES = ('kfe_log_event_description_trgm_idx', 'kfe_log_event_doc_channel_trgm_idx')
+
+
+class BatchName(Func):
+    """
+    Nome del batch estratto dalla descrizione del log.
+    """
+    output_field = CharField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template="btrim(split_part(%(expressions)s, ' - ', 1))",
+            **extra_context
+        )
+
+    def as_sql(self, compiler, connection, template=None, **extra_context):
+        # Fallback portabile (es. SQLite)
+        template = template or (
+            "trim(CASE WHEN instr(%(expressions)s, ' - ') > 0 "
+            "THEN substr(%(expressions)s, 1, instr(%(expressions)s, ' - ') - 1) "
+            "ELSE %(expressions)s END)"
+        )
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+
+def top_batch_errors(since=None, levels=('ERROR',), top=5):
+    """
+    Restituisce [(batch_name, conteggio), ...] ordinati per conteggio,
+    raggruppando direttamente in SQL.
+    """
+    since = since or timezone.now() - timedelta(hours=24)
+    rows = (
+        KfeLogEvent.objects
+        .filter(datetime__gte=since, level__in=list(levels), description__isnull=False)
+        .annotate(batch=BatchName('description'))
+        .exclude(batch='')
+        .values('batch')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'batch')[:top]
+    )
+    return [(row['batch'], row['count']) for row in rows]
+
+
+class ILike(Func):
+    """
+    `campo ILIKE pattern`: a differenza di icontains (UPPER(...) LIKE)
+    può usare gli indici GIN pg_trgm.
+    """
+    arg_joiner = ' ILIKE '
+    template = '%(expressions)s'
+    output_field = BooleanField()
+
+
+class LogSearchVector(Func):
+    template = "to_tsvector('simple', coalesce(%(expressions)s, ''))"
+    arg_joiner = ", '') || ' ' || coalesce("
+    output_field = CharField()
+
+
+class WebSearchQuery(Func):
+    template = "websearch_to_tsquery('simple', %(expressions)s)"
+    output_field = CharField()
+
+
+class TextMatch(Func):
+    arg_joiner = ' @@ '
+    template = '(%(expressions)s)'
+    output_field = BooleanField()
+
+
+class TextRank(Func):
+    function = 'ts_rank'
+    output_field = FloatField()
+
+
+def like_pattern(text):
+    """
+    Pattern '%testo%' con i caratteri speciali di LIKE neutralizzati.
+    """
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+
+_trigram_state = {'checked_at': 0.0, 'available': False}
+
+
+def trigram_indexes_available():
+    """
+    True se gli indici trigram esistono (verifica ripetuta ogni 5 minuti,
+    così non serve riavviare dopo `create_log_indexes`).
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    now = time.monotonic()
+    if now - _trigram_state['checked_at'] > 300:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_indexes WHERE tablename = 'kfe_log_event' AND indexname = ANY(%s)",
+                [list(TRIGRAM_INDEXES)]
+            )
+            _trigram_state['available'] = cursor.fetchone()[0] == len(TRIGRAM_INDEXES)
+        _trigram_state['checked_at'] = now
+    return _trigram_state['available']
+
+
+def resolve_search_mode(requested=None):
+    """
+    Modalità effettiva: quella richiesta (o LOG_SEARCH_MODE), ripiegando
+    su icontains dove PostgreSQL non è disponibile.
+    """
+    mode = requested or settings.LOG_SEARCH_MODE
+    if mode == 'auto':
+        return 'trigram' if trigram_indexes_available() else 'icontains'
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"search_mode non valido (valori ammessi: auto, {', '.join(SEARCH_MODES)})")
+    if mode != 'icontains' and connection.vendor != 'postgresql':
+        return 'icontains'
+    return mode
+
+
+def search_logs(queryset, text, mode):
+    """
+    Applica la ricerca `text` alla queryset dei log secondo `mode`
+    (già risolta con resolve_search_mode). In modalità fts annota `rank`.
+    """
+    if mode == 'trigram':
+        pattern = Value(like_pattern(text))
+        return queryset.filter(
+            Q(ILike('description', pattern)) | Q(ILike('doc_channel', pattern))
+        )
+    if mode == 'fts':
+        vector = LogSearchVector('description', 'doc_channel')
+        query = WebSearchQuery(Value(text))
+        return queryset.filter(TextMatch(vector, query)).annotate(rank=TextRank(vector, query))
+    return queryset.filter(
+        Q(description__icontains=text) |
+        Q(doc_channel__icontains=text)
+    )
@@ -0,0 +1,109 @@
+import statistics
+import threading
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections
+
+from portal_app.models import GatewayPendingActions, Gateways
+
+MODES = ('none', 'persistent', 'pool')
+
+
+class Command(BaseCommand):
+    help = (
+        "Latenza per richiesta con le diverse gestioni delle connessioni al DB "
+        "(DB_POOL_MODE none / persistent / pool). Ogni richiesta simulata esegue "
+        "le letture tipiche dell'ingestion (gateway e azioni in sospeso) tra i "
+        "segnali request_started/request_finished di Django, come una richiesta "
+        "HTTP vera. Nessuna scrittura."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=MODES, help="Modalità da provare (default: tutte)")
+        parser.add_argument('--requests', type=int, default=500, help="Richieste per thread")
+        parser.add_argument('--threads', type=int, default=1, help="Thread concorrenti (come i thread di un worker)")
+        parser.add_argument('--pool-size', type=int, default=4, help="DB_POOL_MAX_SIZE per la modalità pool")
+        parser.add_argument('--gateway', help="gtw_uid da leggere (default: il primo)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Il benchmark è significativo solo su PostgreSQL")
+
+        gtw_uid = options['gateway'] or Gateways.objects.values_list('gtw_uid', flat=True).first()
+        if gtw_uid is None:
+            raise CommandError("Nessun gateway nel database")
+
+        settings_dict = connection.settings_dict
+        original = {key: settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        original_options = dict(settings_dict['OPTIONS'])
+        connection.close()
+        try:
+            for mode in options['mode'] or MODES:
+                if not self._configure(mode, options['pool_size']):
+                    continue
+                latencies = self._run(gtw_uid, options['requests'], options['threads'])
+                self.stdout.write(self._format(mode, latencies, options['threads']))
+        finally:
+            self._reset()
+            settings_dict.update(original)
+            settings_dict['OPTIONS'] = original_options
+
+    def _configure(self, mode, pool_size):
+        self._reset()
+        settings_dict = connection.settings_dict
+        options = {k: v for k, v in settings_dict['OPTIONS'].items() if k != 'pool'}
+        settings_dict['CONN_MAX_AGE'] = 600 if mode == 'persistent' else 0
+        settings_dict['CONN_HEALTH_CHECKS'] = mode != 'none'
+        if mode == 'pool':
+            try:
+                import psycopg_pool  # noqa: F401
+            except ImportError:
+                self.stdout.write("pool: psycopg[pool] non installato, saltato")
+                return False
+            options['pool'] = {'min_size': 1, 'max_size': pool_size, 'timeout': 30}
+        settings_dict['OPTIONS'] = options
+        return True
+
+    def _reset(self):
+        connection.close()
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+
+    def _run(self, gtw_uid, n_requests, n_threads):
+        latencies = []
+        lock = threading.Lock()
+
+        def worker():
+            local = []
+            for _ in range(n_requests):
+                start = time.perf_counter()
+                request_started.send(sender=WSGIHandler)
+                try:
+                    Gateways.objects.filter(gtw_uid=gtw_uid).values_list('last_date_call', flat=True).first()
+                    GatewayPendingActions.objects.filter(gateway_id=gtw_uid, status='PENDING').exists()
+                finally:
+                    # Come a fine richiesta: chiude la connessione o la restituisce al pool
+                    request_finished.send(sender=WSGIHandler)
+                local.append(time.perf_counter() - start)
+            connections.close_all()
+            with lock:
+                latencies.extend(local)
+
+        threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies
+
+    def _format(self, mode, latencies, n_threads):
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+        return (
+            f"{mode:10s} {len(latencies)} richieste ({n_threads} thread)  "
+            f"media {statistics.mean(latencies) * 1000:6.2f} ms  p50 {pct(0.50):6.2f} ms  "
+            f"p95 {pct(0.95):6.2f} ms  p99 {pct(0.99):6.2f} ms"
+        )
@@ -0,0 +1,86 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from portal_app.logs import SEARCH_MODES, search_logs
+from portal_app.models import KfeLogEvent
+
+WORDS = [
+    'xds_cron', 'import_pda', 'export', 'timeout', 'connessione', 'documento',
+    'errore', 'paziente', 'referto', 'firma', 'archivio', 'invio', 'ricezione',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta i tempi della ricerca nei log per modalità (icontains, trigram, fts). "
+        "Con --seed inserisce righe sintetiche in una transazione annullata."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', default=['timeout', 'xds_cron'], help="Testi da cercare")
+        parser.add_argument('--mode', action='append', choices=SEARCH_MODES, help="Limita alle modalità indicate")
+        parser.add_argument('--repeat', type=int, default=5, help="Ripetizioni per prova (si tiene la migliore)")
+        parser.add_argument('--page-size', type=int, default=25, help="Righe della prima pagina")
+        parser.add_argument('--seed', type=int, default=0, help="Righe sintetiche da inserire prima del benchmark")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Le modalità trigram/fts sono disponibili solo su PostgreSQL")
+
+        with transaction.atomic():
+            if options['seed']:
+                self._seed(options['seed'])
+            for term in options['terms']:
+                for mode in options['mode'] or SEARCH_MODES:
+                    self._bench(term, mode, options['repeat'], options['page_size'])
+            transaction.set_rollback(True)
+
+    def _bench(self, term, mode, repeat, page_size):
+        queryset = search_logs(KfeLogEvent.objects.all(), term, mode).order_by('-datetime', '-id')
+        page_best = count_best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.values_list('id', flat=True)[:page_size])
+            page_best = min(page_best, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            matches = queryset.count()
+            count_best = min(count_best, time.perf_counter() - start)
+
+        self.stdout.write(
+            f"{term!r:14s} {mode:10s} prima pagina {page_best * 1000:8.1f} ms  "
+            f"conteggio {count_best * 1000:8.1f} ms  righe {matches:8d}  piano: {self._scan(queryset)}"
+        )
+
+    def _scan(self, queryset):
+        # Tipo di accesso scelto dal planner per il conteggio (indice o scansione)
+        sql, params = queryset.order_by().values('id').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {sql}", params)
+            plan = [row[0] for row in cursor.fetchall()]
+        scans = [line.strip().lstrip('-> ').split('  ')[0] for line in plan if 'Scan' in line]
+        return ', '.join(scans) or plan[0]
+
+    def _seed(self, n_rows):
+        base = timezone.now()
+        rng = random.Random(42)
+        batch = []
+        for i in range(n_rows):
+            batch.append(KfeLogEvent(
+                level=rng.choice(['INFO', 'WARNING', 'ERROR']),
+                description=f"{rng.choice(WORDS)} - (({i:x})) " + ' '.join(rng.choices(WORDS, k=8)),
+                doc_channel=f"CH{i % 500:05d}",
+                datetime=base - timedelta(seconds=i),
+            ))
+            if len(batch) >= 5000:
+                KfeLogEvent.objects.bulk_create(batch)
+                batch = []
+        KfeLogEvent.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE kfe_log_event")
+        self.stdout.write(f"Inserite {n_rows} righe sintetiche")
@@ -0,0 +1,76 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from portal_app.models import Gateways
+from portal_app.writers import WRITERS, PostgresCopyWriter
+
+
+class Command(BaseCommand):
+    help = (
+        "Confronta le righe/sec dei writer delle metriche (COPY vs bulk_create). "
+        "Ogni prova gira in una transazione annullata: il DB non viene modificato."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help="Righe per tabella e per prova")
+        parser.add_argument('--repeat', type=int, default=3, help="Ripetizioni per writer (si tiene la migliore)")
+        parser.add_argument('--gateway', help="gtw_uid da usare (default: il primo gateway esistente)")
+        parser.add_argument('--writer', action='append', choices=sorted(WRITERS), help="Limita ai writer indicati")
+
+    def handle(self, *args, **options):
+        gateways = Gateways.objects.all()
+        if options['gateway']:
+            gateways = gateways.filter(gtw_uid=options['gateway'])
+        gtw_uid = gateways.exclude(gtw_uid=None).values_list('gtw_uid', flat=True).first()
+        if not gtw_uid:
+            raise CommandError("Nessun gateway disponibile per il benchmark")
+
+        n_rows = options['rows']
+        mirth_rows, check_rows = self._make_rows(gtw_uid, n_rows)
+
+        names = options['writer'] or sorted(WRITERS)
+        for name in names:
+            if name == PostgresCopyWriter.name and connection.vendor != 'postgresql':
+                self.stdout.write(f"{name:12s} saltato (backend '{connection.vendor}', serve PostgreSQL)")
+                continue
+
+            best = None
+            for _ in range(options['repeat']):
+                elapsed = self._run_once(WRITERS[name](), mirth_rows, check_rows)
+                best = elapsed if best is None else min(best, elapsed)
+
+            total = len(mirth_rows) + len(check_rows)
+            self.stdout.write(
+                f"{name:12s} {total} righe in {best:.3f}s -> {total / best:,.0f} righe/sec"
+            )
+
+    def _run_once(self, writer, mirth_rows, check_rows):
+        with transaction.atomic():
+            start = time.perf_counter()
+            writer.write_mirth(mirth_rows)
+            writer.write_checks(check_rows)
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed
+
+    def _make_rows(self, gtw_uid, n_rows):
+        base = timezone.now() - timedelta(minutes=n_rows)
+        mirth_rows = [
+            (
+                gtw_uid, base + timedelta(minutes=i), f"bench_channel_{i % 20}", f"bench-{i % 20}",
+                i, i, i % 7, 0, i % 3,
+            )
+            for i in range(n_rows)
+        ]
+        check_rows = [
+            (
+                gtw_uid, base + timedelta(minutes=i), f"bench_check_{i % 10}", 'OK',
+                'benchmark\tcon caratteri\nspeciali', i % 100, 90, '<', 0.01,
+            )
+            for i in range(n_rows)
+        ]
+        return mirth_rows, check_rows
@@ -0,0 +1,86 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from portal_app import fastjson
+from portal_app.models import Gateways, KfeLogEvent, MirthMetrics
+from portal_app.serializers import KfeLogEventSerializer, MirthMetricsSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Micro-benchmark della serializzazione: serializer DRF + JSONRenderer "
+        "contro il fast path (.values() + orjson/json). Lavora in memoria, "
+        "senza database, e verifica che l'output sia identico."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Righe per prova")
+        parser.add_argument('--repeat', type=int, default=5, help="Ripetizioni (si tiene la migliore)")
+
+    def handle(self, *args, **options):
+        n_rows = options['rows']
+        if fastjson.orjson is None:
+            self.stdout.write("orjson non installato: il fast path usa json della libreria standard")
+
+        for label, serializer_class, instances in (
+            ('mirth_metrics', MirthMetricsSerializer, self._mirth(n_rows)),
+            ('kfe_log_event', KfeLogEventSerializer, self._logs(n_rows)),
+        ):
+            plan = fastjson.get_row_serializer(serializer_class)
+            rows = [{source: getattr(obj, source) for source in plan.sources} for obj in instances]
+
+            drf_time, drf_bytes = self._best(options['repeat'], lambda: JSONRenderer().render(
+                serializer_class(instances, many=True).data
+            ))
+            fast_time, fast_bytes = self._best(options['repeat'], lambda: self._fast(serializer_class, rows))
+
+            self.stdout.write(
+                f"{label:14s} {n_rows} righe  DRF {drf_time * 1000:8.1f} ms  "
+                f"fast {fast_time * 1000:8.1f} ms  x{drf_time / fast_time:.1f}  "
+                f"output identico: {'sì' if drf_bytes == fast_bytes else 'NO'}"
+            )
+
+    def _fast(self, serializer_class, rows):
+        view = type('BenchView', (), {})()
+        data = fastjson.serialize_rows(view, serializer_class, rows)
+        return fastjson.FastJSONRenderer().render(data, renderer_context={'view': view})
+
+    def _best(self, repeat, func):
+        best, result = None, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    def _mirth(self, n_rows):
+        base = timezone.now() - timedelta(minutes=n_rows)
+        # Gateway già in memoria: si misura la serializzazione, non le query
+        # della FK (SlugRelatedField la legge riga per riga)
+        gateway = Gateways(gtw_uid='bench-gateway')
+        return [
+            MirthMetrics(
+                id=i, gateway=gateway, gateway_timestamp=base + timedelta(minutes=i),
+                channel_name=f"bench_channel_{i % 20}", channel_id=f"bench-{i % 20}",
+                received=i, sent=i, error=i % 7, filtered=0, queued=i % 3,
+            )
+            for i in range(n_rows)
+        ]
+
+    def _logs(self, n_rows):
+        base = timezone.now() - timedelta(seconds=n_rows)
+        logs = []
+        for i in range(n_rows):
+            log = KfeLogEvent(
+                id=i, datetime=base + timedelta(seconds=i), level='ERROR', action='SEND',
+                description=f"xds_cron - (({i:x})) Errore invio documento", node_type='GTW',
+                ip_address='10.0.0.1', doc_channel='CH00001',
+            )
+            log.batch = 'xds_cron'  # come l'annotazione SQL della view
+            logs.append(log)
+        return logs
@@ -0,0 +1,299 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from itertools import cycle
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from portal_app.models import Gateways, KfeLogEvent, MirthMetrics
+from portal_app.synthetic import (
+    DEFAULT_PREFIX, LOG_BATCHES, LOG_WORDS, SyntheticFleet, check_benchmark_database, create_tables, delete_fleet,
+    seed_fleet,
+)
+
+SCENARIOS = (
+    'ingest', 'ingest_batch', 'history_24h', 'history_7d', 'history_30d', 'history_rate_7d',
+    'dashboard', 'fleet', 'logs_search', 'logs_pages',
+)
+DEFAULT_SCENARIOS = tuple(s for s in SCENARIOS if s != 'history_rate_7d')
+BENCHMARK_USER = 'benchmark'
+# Pagine seguite (link 'next') per ogni richiesta della prima pagina in logs_pages
+LOG_PAGES = 5
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark riproducibile in-process (senza server) su una flotta di gateway sintetica: "
+        "--seed crea gateway, storico delle metriche e log (vedi portal_app/synthetic.py), poi "
+        "ogni scenario esegue richieste con il client di test di Django misurando req/s, "
+        "latenze (p50/p95/p99) e query SQL per richiesta. --output salva i risultati in JSON, "
+        "--compare li confronta con quelli di un'altra versione. Per i test di carico HTTP "
+        "concorrenti contro un server in esecuzione vedi load_test. Scrive nel database: "
+        "richiede BENCHMARK_DATABASE=True (database dedicato, es. DB_ENGINE=sqlite dopo "
+        "manage.py migrate e --create-tables)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--create-tables', action='store_true',
+            help="Crea le tabelle mancanti di portal_app (database di benchmark vuoto)",
+        )
+        parser.add_argument('--seed', action='store_true', help="Crea la flotta sintetica prima del benchmark")
+        parser.add_argument(
+            '--cleanup', action='store_true', help="Rimuove la flotta sintetica e l'utente del benchmark alla fine"
+        )
+        parser.add_argument('--gateways', type=int, default=20, help="Gateway della flotta")
+        parser.add_argument('--channels', type=int, default=4, help="Canali Mirth per gateway")
+        parser.add_argument('--checks', type=int, default=3, help="Check per gateway")
+        parser.add_argument('--days', type=int, default=30, help="Giorni di storico")
+        parser.add_argument('--interval', type=int, default=300, help="Secondi tra due report dello storico")
+        parser.add_argument('--logs', type=int, default=100000, help="Righe di kfe_log_event")
+        parser.add_argument('--random-seed', type=int, default=42, help="Seed dei dati sintetici")
+        parser.add_argument('--prefix', default=DEFAULT_PREFIX, help="Prefisso di gtw_uid ed external_id sintetici")
+        parser.add_argument(
+            '--scenario', action='append', choices=SCENARIOS,
+            help=f"Scenari da eseguire (ripetibile, default: {', '.join(DEFAULT_SCENARIOS)})",
+        )
+        parser.add_argument('--requests', type=int, default=200, help="Richieste misurate per scenario")
+        parser.add_argument('--warmup', type=int, default=10, help="Richieste di riscaldamento non misurate")
+        parser.add_argument('--batch-size', type=int, default=50, help="Report per richiesta in ingest_batch")
+        parser.add_argument('--output', help="File JSON dei risultati ('-' per stamparlo)")
+        parser.add_argument('--compare', help="JSON di un'esecuzione precedente da confrontare")
+
+    def handle(self, *args, **options):
+        try:
+            check_benchmark_database()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        if options['create_tables']:
+            created = create_tables()
+            self.stderr.write(f"Tabelle create: {', '.join(created) or 'nessuna'}")
+
+        prefix = options['prefix']
+        fleet = SyntheticFleet(
+            gateways=options['gateways'], channels=options['channels'], checks=options['checks'],
+            seed=options['random_seed'], prefix=prefix,
+        )
+        if options['seed']:
+            if Gateways.objects.filter(gtw_uid__startswith=prefix).exists():
+                raise CommandError(f"Flotta '{prefix}' già presente: rimuoverla con --cleanup o cambiare --prefix")
+            start = time.perf_counter()
+            counts = seed_fleet(fleet, options['days'], options['interval'], options['logs'])
+            self.stderr.write(
+                f"Flotta creata in {time.perf_counter() - start:.1f} s: "
+                + ', '.join(f"{table} {n}" for table, n in counts.items())
+            )
+        elif not Gateways.objects.filter(gtw_uid__in=fleet.gateway_uids).exists():
+            raise CommandError("Flotta sintetica non trovata: eseguire prima con --seed (stessi parametri)")
+        # I contatori dei report nuovi proseguono dall'ultimo stato salvato
+        fleet.resume()
+
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {self._token()}")
+        results = {
+            'metadata': self._metadata(options, fleet),
+            'scenarios': {},
+        }
+        try:
+            for name in options['scenario'] or DEFAULT_SCENARIOS:
+                calls = self._calls(name, fleet, options)
+                for _ in range(options['warmup']):
+                    self._request(client, next(calls))
+                stats = self._run(client, calls, options['requests'])
+                results['scenarios'][name] = stats
+                self.stderr.write(self._format(name, stats))
+        finally:
+            if options['cleanup']:
+                delete_fleet(prefix)
+                get_user_model().objects.filter(username=BENCHMARK_USER).delete()
+
+        if options['output'] == '-':
+            self.stdout.write(json.dumps(results, indent=2))
+        elif options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+        if options['compare']:
+            self._compare(options['compare'], results)
+
+    def _token(self):
+        user, _ = get_user_model().objects.get_or_create(
+            username=BENCHMARK_USER, defaults={'is_active': True}
+        )
+        if user.has_usable_password():
+            user.set_unusable_password()
+            user.save(update_fields=['password'])
+        return str(RefreshToken.for_user(user).access_token)
+
+    def _calls(self, name, fleet, options):
+        """Generatore infinito di (metodo, path, json) per lo scenario, deterministico."""
+        series = cycle([(g, c) for g in fleet.gateway_uids for c in fleet.channels])
+        gateways = cycle(fleet.gateway_uids)
+        terms = cycle(LOG_WORDS + LOG_BATCHES)
+
+        if name == 'ingest':
+            while True:
+                yield 'post', '/api/ingest-metrics/', fleet.report(next(gateways), timezone.now())
+        elif name == 'ingest_batch':
+            while True:
+                now = timezone.now()
+                reports = [fleet.report(next(gateways), now) for _ in range(options['batch_size'])]
+                yield 'post', '/api/ingest-metrics/batch/', {'reports': reports}
+        elif name.startswith('history_'):
+            *mode, period = name.split('_')[1:]
+            extra = f"&mode={mode[0]}" if mode else ''
+            while True:
+                gtw_uid, channel = next(series)
+                yield 'get', (
+                    f"/api/metrics/mirth/history/?gateway_uid={gtw_uid}&channel_name={channel}"
+                    f"&range={period}{extra}"
+                ), None
+        elif name == 'dashboard':
+            while True:
+                yield 'get', '/api/dashboard/stats/', None
+        elif name == 'fleet':
+            while True:
+                yield 'get', '/api/fleet/overview/', None
+        elif name == 'logs_search':
+            while True:
+                yield 'get', f"/api/logs/?search={next(terms)}", None
+        elif name == 'logs_pages':
+            while True:
+                path = f"/api/logs/?search={next(terms)}"
+                for _ in range(LOG_PAGES):
+                    response = yield 'get', path, None
+                    path = response and response.get('next')
+                    if not path:
+                        break
+
+    def _request(self, client, call):
+        method, path, body = call
+        if body is None:
+            return getattr(client, method)(path)
+        return getattr(client, method)(path, data=json.dumps(body), content_type='application/json')
+
+    def _run(self, client, calls, n_requests):
+        latencies, query_counts, query_times = [], [], []
+        errors = {}
+        current = {}
+
+        def count(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                current['queries'] += 1
+                current['time'] += time.perf_counter() - start
+
+        call = next(calls)
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            for _ in range(n_requests):
+                current.update(queries=0, time=0.0)
+                start = time.perf_counter()
+                response = self._request(client, call)
+                latencies.append(time.perf_counter() - start)
+                query_counts.append(current['queries'])
+                query_times.append(current['time'])
+                if response.status_code >= 400:
+                    errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+                # logs_pages riceve la risposta per seguire il link 'next'
+                call = calls.send(self._next_link(response))
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+        return {
+            'requests': len(latencies),
+            'errors': sum(errors.values()),
+            'error_status': errors,
+            'rps': round(len(latencies) / wall, 2) if wall else 0,
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            'p50_ms': round(pct(0.50), 3), 'p95_ms': round(pct(0.95), 3), 'p99_ms': round(pct(0.99), 3),
+            'max_ms': round(latencies[-1] * 1000, 3),
+            'queries_per_request': round(statistics.mean(query_counts), 2),
+            'max_queries': max(query_counts),
+            'query_ms_per_request': round(statistics.mean(query_times) * 1000, 3),
+        }
+
+    def _next_link(self, response):
+        if response.status_code != 200 or 'json' not in response.get('Content-Type', ''):
+            return None
+        try:
+            data = json.loads(response.content)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or not data.get('next'):
+            return None
+        # Link assoluto (http://testserver/api/logs/?...): il client vuole il path
+        link = data['next']
+        return {'next': link[link.index('/api/'):]}
+
+    def _metadata(self, options, fleet):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'git_commit': commit,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'settings': {
+                name: getattr(settings, name, None)
+                for name in ('SERVER_MODE', 'DB_POOL_MODE', 'INGESTION_MODE', 'METRICS_MODE', 'METRICS_WRITER')
+            },
+            'dataset': {
+                'prefix': fleet.prefix,
+                'gateways': len(fleet.gateway_uids),
+                'channels': len(fleet.channels),
+                'checks': len(fleet.checks),
+                'random_seed': options['random_seed'],
+                'mirth_metrics_rows': MirthMetrics.objects.filter(gateway_id__in=fleet.gateway_uids).count(),
+                'kfe_log_event_rows': KfeLogEvent.objects.filter(external_id__startswith=fleet.prefix).count(),
+            },
+            'requests': options['requests'],
+            'warmup': options['warmup'],
+            'batch_size': options['batch_size'],
+        }
+
+    def _format(self, name, stats):
+        line = (
+            f"{name:16s} {stats['requests']:5d} richieste {stats['rps']:9.1f} req/s  "
+            f"p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms  "
+            f"query/richiesta {stats['queries_per_request']:6.1f} ({stats['query_ms_per_request']:.1f} ms)"
+        )
+        if stats['errors']:
+            line += f"  errori {stats['errors']} {stats['error_status']}"
+        return line
+
+    def _compare(self, path, results):
+        try:
+            with open(path) as f:
+                base = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"{path}: {e}")
+        meta = base.get('metadata', {})
+        self.stderr.write(f"Confronto con {path} (commit {meta.get('git_commit')}, {meta.get('database')}):")
+        for name, stats in results['scenarios'].items():
+            old = base.get('scenarios', {}).get(name)
+            if not old:
+                self.stderr.write(f"{name:16s} assente nel file di confronto")
+                continue
+            ratio = lambda key: f"x{stats[key] / old[key]:.2f}" if old[key] else 'n/d'
+            self.stderr.write(
+                f"{name:16s} throughput {ratio('rps'):>7s}  p50 {ratio('p50_ms'):>7s}  p99 {ratio('p99_ms'):>7s}  "
+                f"query/richiesta {old['queries_per_request']:.1f} -> {stats['queries_per_request']:.1f}"
+            )
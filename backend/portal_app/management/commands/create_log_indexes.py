@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from portal_app.logs import BATCH_NAME_SQL, SEARCH_VECTOR_SQL
+
+# kfe_log_event è una tabella legacy (managed = False): Django non ne
+# gestisce lo schema, quindi gli indici si creano con questo comando.
+# CONCURRENTLY evita di bloccare le scritture del sistema legacy.
+# Gli indici trigram richiedono l'estensione pg_trgm (creata se assente,
+# serve un utente con i privilegi necessari).
+LOG_INDEXES = {
+    'batch_name': (
+        'kfe_log_event_batch_name_idx',
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS kfe_log_event_batch_name_idx "
+        f"ON kfe_log_event (({BATCH_NAME_SQL}), datetime DESC)"
+    ),
+    # Ordinamento e cursore della paginazione keyset (pagination.py)
+    'datetime_id': (
+        'kfe_log_event_datetime_id_idx',
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS kfe_log_event_datetime_id_idx "
+        "ON kfe_log_event (datetime DESC NULLS LAST, id DESC)"
+    ),
+    'level_datetime': (
+        'kfe_log_event_level_datetime_idx',
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS kfe_log_event_level_datetime_idx "
+        "ON kfe_log_event (level, datetime DESC)"
+    ),
+    'trigram': [
+        (
+            'kfe_log_event_description_trgm_idx',
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS kfe_log_event_description_trgm_idx "
+            "ON kfe_log_event USING gin (description gin_trgm_ops)"
+        ),
+        (
+            'kfe_log_event_doc_channel_trgm_idx',
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS kfe_log_event_doc_channel_trgm_idx "
+            "ON kfe_log_event USING gin (doc_channel gin_trgm_ops)"
+        ),
+    ],
+    'fts': (
+        'kfe_log_event_search_fts_idx',
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS kfe_log_event_search_fts_idx "
+        f"ON kfe_log_event USING gin (({SEARCH_VECTOR_SQL}))"
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Crea (opt-in) gli indici usati dall'API dei log sulla tabella legacy "
+        "kfe_log_event. Solo PostgreSQL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--index', action='append', choices=sorted(LOG_INDEXES), help="Limita agli indici indicati")
+        parser.add_argument('--drop', action='store_true', help="Elimina gli indici invece di crearli")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Gli indici dei log sono disponibili solo su PostgreSQL")
+
+        # CREATE INDEX CONCURRENTLY non può girare in una transazione
+        connection.set_autocommit(True)
+        with connection.cursor() as cursor:
+            keys = options['index'] or sorted(LOG_INDEXES)
+            if 'trigram' in keys and not options['drop']:
+                try:
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                except DatabaseError as e:
+                    keys = [key for key in keys if key != 'trigram']
+                    self.stderr.write(f"Estensione pg_trgm non disponibile, indici trigram saltati: {e}")
+            for key in keys:
+                indexes = LOG_INDEXES[key]
+                for name, create_sql in indexes if isinstance(indexes, list) else [indexes]:
+                    if options['drop']:
+                        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                        self.stdout.write(f"Indice {name} eliminato")
+                    else:
+                        cursor.execute(create_sql)
+                        self.stdout.write(f"Indice {name} creato")
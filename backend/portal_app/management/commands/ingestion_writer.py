@@ -0,0 +1,119 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import InterfaceError, OperationalError, transaction
+
+from portal_app.ingestion import prepare_reports, write_rows
+from portal_app.ingestion_queue import SpoolQueue
+
+# Errori di connessione: non dipendono dal contenuto dei file
+DATABASE_ERRORS = (OperationalError, InterfaceError)
+
+
+class Command(BaseCommand):
+    help = (
+        "Svuota la coda di ingestion (INGESTION_MODE='queue') scrivendo i "
+        "report a blocchi, con una scrittura bulk per tabella per blocco."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.INGESTION_WRITER_BATCH_SIZE,
+            help="Numero massimo di file della coda scritti in un blocco"
+        )
+        parser.add_argument(
+            '--flush-interval', type=float, default=settings.INGESTION_WRITER_FLUSH_INTERVAL,
+            help="Secondi massimi di attesa prima di scrivere un blocco non pieno"
+        )
+        parser.add_argument(
+            '--stale-after', type=float, default=300,
+            help="Rimette in coda i file in 'processing' più vecchi di N secondi all'avvio"
+        )
+        parser.add_argument('--once', action='store_true', help="Svuota la coda ed esce")
+        parser.add_argument('--stats', action='store_true', help="Stampa lo stato della coda ed esce")
+
+    def handle(self, *args, **options):
+        queue = SpoolQueue()
+
+        if options['stats']:
+            self.stdout.write(str(queue.stats()))
+            return
+
+        recovered = queue.recover(options['stale_after'])
+        if recovered:
+            self.stdout.write(f"Rimessi in coda {recovered} file rimasti in 'processing'")
+
+        batch_size = options['batch_size']
+        flush_interval = options['flush_interval']
+
+        while True:
+            depth = queue.depth()
+            if options['once']:
+                if not depth:
+                    return
+            elif depth < batch_size and queue.oldest_age() < flush_interval:
+                # Blocco non ancora pieno: aspetta altri report
+                time.sleep(min(0.5, flush_interval))
+                continue
+
+            self._flush(queue, batch_size)
+
+    def _flush(self, queue, batch_size):
+        lag = queue.oldest_age()
+        claimed = queue.claim(batch_size)
+        if not claimed:
+            return
+
+        start = time.perf_counter()
+        try:
+            blocks = self._write_block(queue, claimed)
+        except DATABASE_ERRORS as e:
+            # Database non disponibile: nessun file è responsabile, si riprova
+            # senza contare il tentativo (i file già scritti non ci sono più)
+            queue.release([path for path, _ in claimed], count_attempt=False)
+            self.stderr.write(f"Errore database, blocco ({len(claimed)} file) rimesso in coda: {e}")
+            time.sleep(1)
+            return
+        elapsed = time.perf_counter() - start
+
+        results = [r for block_results, _, _ in blocks for r in block_results]
+        rejected = [r for r in results if r['status'] != 'success']
+        for r in rejected:
+            self.stderr.write(f"Report scartato ({r.get('gtw_uid')}): {r['error']}")
+
+        # Metriche di backpressure: dimensione blocco, ritardo e coda residua
+        self.stdout.write(
+            f"files={len(claimed)} reports={len(results)} rejected={len(rejected)} "
+            f"mirth_rows={sum(b[1] for b in blocks)} check_rows={sum(b[2] for b in blocks)} "
+            f"write_sec={elapsed:.3f} lag_sec={lag:.3f} queue_depth={queue.depth()}"
+        )
+
+    def _write_block(self, queue, claimed):
+        """
+        Scrive i file `claimed` in una transazione. Se la scrittura fallisce
+        il blocco viene diviso a metà, fino a isolare i file che la fanno
+        fallire: quelli tornano in coda (o in failed/ dopo
+        INGESTION_WRITER_MAX_ATTEMPTS tentativi) senza bloccare gli altri.
+        Restituisce una lista di (results, mirth_rows, check_rows) dei
+        blocchi scritti.
+        """
+        paths = [path for path, _ in claimed]
+        reports = [report for _, file_reports in claimed for report in file_reports]
+        try:
+            with transaction.atomic():
+                results, mirth_rows, check_rows, _ = prepare_reports(reports)
+                write_rows(mirth_rows, check_rows)
+        except DATABASE_ERRORS:
+            raise
+        except Exception as e:
+            if len(claimed) > 1:
+                middle = len(claimed) // 2
+                return self._write_block(queue, claimed[:middle]) + self._write_block(queue, claimed[middle:])
+            if queue.release(paths):
+                self.stderr.write(f"Errore scrittura {paths[0].name}, spostato in failed/: {e}")
+            else:
+                self.stderr.write(f"Errore scrittura {paths[0].name}, rimesso in coda: {e}")
+            return []
+        queue.ack(paths)
+        return [(results, len(mirth_rows), len(check_rows))]
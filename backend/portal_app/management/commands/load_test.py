@@ -0,0 +1,136 @@
+import itertools
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+SCENARIOS = ('ingest', 'dashboard', 'history', 'mantis', 'mixed')
+
+
+class Command(BaseCommand):
+    help = (
+        "Test di carico HTTP contro un server in esecuzione (es. confronto tra "
+        "SERVER_MODE=wsgi e SERVER_MODE=asgi): --url del primo server, --compare "
+        "del secondo. Stampa throughput e latenze (p50/p95/p99)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000', help="Base URL del server")
+        parser.add_argument('--compare', action='append', default=[], help="Altri server da confrontare (ripetibile)")
+        parser.add_argument('--scenario', choices=SCENARIOS, default='mixed')
+        parser.add_argument('--concurrency', type=int, default=32, help="Client concorrenti")
+        parser.add_argument('--duration', type=float, default=30, help="Durata per server (secondi)")
+        parser.add_argument('--username', help="Utente per il token JWT (dashboard, storico, Mantis)")
+        parser.add_argument('--password')
+        parser.add_argument('--gateway', default='load-test', help="gtw_uid esistente per ingestion e storico")
+        parser.add_argument('--channel', default='load_test_channel', help="Canale Mirth dei report")
+
+    def handle(self, *args, **options):
+        if options['scenario'] != 'ingest' and not options['username']:
+            raise CommandError("Lo scenario richiede --username/--password (endpoint autenticati)")
+
+        results = []
+        for url in [options['url'], *options['compare']]:
+            url = url.rstrip('/')
+            token = self._token(url, options) if options['username'] else None
+            stats = self._run(url, token, options)
+            results.append((url, stats))
+            self.stdout.write(self._format(url, stats))
+
+        if len(results) > 1:
+            base = results[0][1]
+            for url, stats in results[1:]:
+                if base['rps'] and stats['rps']:
+                    self.stdout.write(
+                        f"{url}: throughput x{stats['rps'] / base['rps']:.2f}, "
+                        f"p95 x{stats['p95'] / base['p95']:.2f} rispetto a {results[0][0]}"
+                    )
+
+    def _token(self, url, options):
+        response = requests.post(f"{url}/api/token/", json={
+            'username': options['username'], 'password': options['password'],
+        }, timeout=10)
+        if response.status_code != 200:
+            raise CommandError(f"{url}: login fallito ({response.status_code})")
+        return response.json()['access']
+
+    def _requests(self, options):
+        """Generatore infinito di (metodo, path, json) per lo scenario."""
+        gateway, channel = options['gateway'], options['channel']
+        calls = {
+            'ingest': lambda: ('post', '/api/ingest-metrics/', {
+                'gtw_uid': gateway,
+                'timestamp': timezone.now().isoformat(),
+                'mirth': {channel: {'channelId': 'load-test', 'metrics': {
+                    'received': 1, 'sent': 1, 'error': 0, 'filtered': 0, 'queued': 0,
+                }}},
+            }),
+            'dashboard': lambda: ('get', '/api/dashboard/stats/', None),
+            'history': lambda: (
+                'get', f"/api/metrics/mirth/history/?gateway_uid={gateway}&channel_name={channel}&range=24h", None
+            ),
+            'mantis': lambda: ('post', '/api/integrations/mantis/create-ticket/', {
+                'summary': 'Load test', 'description': 'Ticket generato da manage.py load_test',
+            }),
+        }
+        if options['scenario'] == 'mixed':
+            return (calls[name]() for name in itertools.cycle(('ingest', 'dashboard', 'history')))
+        return (calls[options['scenario']]() for _ in itertools.count())
+
+    def _run(self, url, token, options):
+        deadline = time.monotonic() + options['duration']
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def client():
+            session = requests.Session()
+            if token:
+                session.headers['Authorization'] = f"Bearer {token}"
+            for method, path, body in self._requests(options):
+                if time.monotonic() >= deadline:
+                    return
+                start = time.perf_counter()
+                try:
+                    response = session.request(method, url + path, json=body, timeout=60)
+                    ok = response.status_code < 400
+                    error = None if ok else response.status_code
+                except requests.RequestException as e:
+                    error = type(e).__name__
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    if error is not None:
+                        errors.append(error)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            for _ in range(options['concurrency']):
+                pool.submit(client)
+        wall = time.monotonic() - started
+
+        latencies.sort()
+        pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0
+        return {
+            'requests': len(latencies),
+            'errors': len(errors),
+            'error_kinds': sorted(set(map(str, errors))),
+            'rps': len(latencies) / wall if wall else 0,
+            'mean': statistics.mean(latencies) * 1000 if latencies else 0,
+            'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99),
+            'max': latencies[-1] * 1000 if latencies else 0,
+        }
+
+    def _format(self, url, stats):
+        line = (
+            f"{url}: {stats['requests']} richieste, {stats['rps']:.1f} req/s, "
+            f"latenza media {stats['mean']:.1f} ms, p50 {stats['p50']:.1f} ms, "
+            f"p95 {stats['p95']:.1f} ms, p99 {stats['p99']:.1f} ms, max {stats['max']:.1f} ms"
+        )
+        if stats['errors']:
+            line += f", errori {stats['errors']} ({', '.join(stats['error_kinds'])})"
+        return line
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from portal_app.partitions import (
+    PARTITIONED_TABLES, convert_to_partitioned, ensure_partitions, expire_default_rows, expire_partitions,
+    is_partitioned
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Gestisce le partizioni mensili di mirth_metrics e check_status_metrics: "
+        "crea in anticipo le partizioni future e applica la retention. "
+        "Con --convert trasforma una tabella normale in partizionata (una tantum)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', action='append', choices=sorted(PARTITIONED_TABLES), help="Limita alle tabelle indicate")
+        parser.add_argument(
+            '--months-ahead', type=int, default=settings.METRICS_PARTITIONS_AHEAD,
+            help="Partizioni future da mantenere pronte"
+        )
+        parser.add_argument(
+            '--retention-months', type=int, default=settings.METRICS_RETENTION_MONTHS,
+            help="Mesi di dati grezzi da conservare (0 = nessuna retention)"
+        )
+        parser.add_argument('--detach', action='store_true', help="Stacca le partizioni scadute invece di eliminarle")
+        parser.add_argument('--convert', action='store_true', help="Converte le tabelle non ancora partizionate")
+        parser.add_argument('--keep-legacy', action='store_true', help="Con --convert, conserva la tabella originale come <tabella>_legacy")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Il partizionamento è disponibile solo su PostgreSQL")
+
+        for table in options['table'] or sorted(PARTITIONED_TABLES):
+            if not is_partitioned(table):
+                if not options['convert']:
+                    self.stdout.write(f"{table}: non partizionata (usa --convert per migrarla)")
+                    continue
+                copied = convert_to_partitioned(table, options['months_ahead'], keep_legacy=options['keep_legacy'])
+                self.stdout.write(f"{table}: convertita in tabella partizionata, {copied} righe copiate")
+
+            created = ensure_partitions(table, options['months_ahead'])
+            for name in created:
+                self.stdout.write(f"{table}: creata partizione {name}")
+
+            if options['retention_months'] > 0:
+                expired = expire_partitions(table, options['retention_months'], detach=options['detach'])
+                verb = "staccata" if options['detach'] else "eliminata"
+                for name in expired:
+                    self.stdout.write(f"{table}: {verb} partizione {name}")
+                deleted = expire_default_rows(table, options['retention_months'])
+                if deleted:
+                    self.stdout.write(f"{table}: {deleted} righe scadute eliminate dalla partizione di default")
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from portal_app.latest_state import STATES, rebuild_latest_state
+
+
+class Command(BaseCommand):
+    help = (
+        "Ricalcola le tabelle di ultimo stato (mirth_channel_state, "
+        "check_status_state) dalle metriche grezze. Da eseguire una volta "
+        "dopo averle create su un database esistente; poi le aggiorna l'ingestion."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help="Considera solo le righe da questa data (ISO 8601): canali e check "
+                 "senza dati successivi non compaiono nello stato"
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError("--since non è una data ISO 8601 valida")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+
+        for model in STATES:
+            start = time.perf_counter()
+            with transaction.atomic():
+                count = rebuild_latest_state(model, since=since)
+            self.stdout.write(
+                f"{model._meta.db_table}: {count} righe in {time.perf_counter() - start:.3f}s"
+            )
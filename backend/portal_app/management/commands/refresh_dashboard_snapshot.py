@@ -0,0 +1,38 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from portal_app.dashboard import refresh_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Precalcola lo snapshot dei KPI della dashboard e lo salva in cache, "
+        "così le richieste degli operatori non eseguono mai le query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Ripete il calcolo all'infinito")
+        parser.add_argument('--interval', type=float, default=30, help="Secondi tra due calcoli con --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.perf_counter()
+            try:
+                refresh_snapshot()
+            except Exception:
+                if not options['loop']:
+                    raise
+                # Con --loop un errore non ferma il processo: la cache tiene
+                # l'ultimo snapshot fino al calcolo successivo
+                logger.exception("Errore refresh snapshot dashboard")
+            else:
+                self.stdout.write(f"Snapshot dashboard aggiornato in {time.perf_counter() - start:.3f}s")
+            if not options['loop']:
+                return
+            connection.close()
+            time.sleep(options['interval'])
@@ -0,0 +1,62 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from portal_app.rollups import ROLLUPS, refresh_rollups
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Aggiorna i rollup orari/giornalieri delle metriche rielaborando "
+        "solo i bucket toccati dalle righe arrivate dopo l'ultimo refresh."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', action='append', choices=sorted(ROLLUPS), help="Limita ai rollup indicati")
+        parser.add_argument(
+            '--rebuild-since',
+            help="Ricalcola tutti i bucket da questa data (ISO 8601), es. dopo un import massivo"
+        )
+        parser.add_argument('--loop', action='store_true', help="Ripete il refresh all'infinito")
+        parser.add_argument('--interval', type=float, default=60, help="Secondi tra due refresh con --loop")
+
+    def handle(self, *args, **options):
+        rebuild_since = None
+        if options['rebuild_since']:
+            rebuild_since = parse_datetime(options['rebuild_since'])
+            if rebuild_since is None:
+                raise CommandError("--rebuild-since non è una data ISO 8601 valida")
+            if timezone.is_naive(rebuild_since):
+                rebuild_since = timezone.make_aware(rebuild_since)
+
+        names = options['only'] or sorted(ROLLUPS)
+        # --rebuild-since vale fino al primo refresh riuscito di ogni rollup
+        rebuild = dict.fromkeys(names, rebuild_since)
+        while True:
+            for name in names:
+                start = time.perf_counter()
+                try:
+                    n_rows, n_hours, n_days = refresh_rollups(name, rebuild_since=rebuild[name])
+                except Exception:
+                    if not options['loop']:
+                        raise
+                    # Con --loop un errore (es. database non raggiungibile) non
+                    # ferma il processo: si riprova al giro successivo
+                    logger.exception("Errore refresh rollup %s", name)
+                    connection.close()
+                    continue
+                rebuild[name] = None
+                self.stdout.write(
+                    f"{name}: {n_rows} righe nuove, {n_hours} ore e {n_days} giorni "
+                    f"ricalcolati in {time.perf_counter() - start:.3f}s"
+                )
+            if not options['loop']:
+                return
+            connection.close()
+            time.sleep(options['interval'])
@@ -74,6 +74,211 @@ class GatewayPendingActions(models.Model):
         managed = True
         db_table = 'gateway_pending_actions'
         ordering = ['-created_at']
+        indexes = [
+            # Indice parziale: la consegna cerca solo le azioni PENDING di un gateway
+            models.Index(
+                fields=['gateway', 'created_at'],
+                condition=models.Q(status='PENDING'),
+                name='gpa_pending_gateway_idx'
+            ),
+        ]
+
+
+# --- Rollup orari/giornalieri (aggiornati da `manage.py refresh_rollups`) ---
+
+ROLLUP_PERIOD_CHOICES = [
+    ('1h', 'Oraria'),
+    ('1d', 'Giornaliera'),
+]
+
+class MirthMetricsRollup(models.Model):
+    gateway = models.ForeignKey(
+        'Gateways',
+        to_field='gtw_uid',
+        on_delete=models.CASCADE,
+        db_column='gateway_uid'
+    )
+    channel_name = models.CharField(max_length=255)
+    period = models.CharField(max_length=2, choices=ROLLUP_PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    samples = models.IntegerField(default=0)
+    # Per ogni contatore: somma (per la media), minimo e massimo nel bucket
+    received_sum = models.BigIntegerField(default=0)
+    received_min = models.IntegerField(default=0)
+    received_max = models.IntegerField(default=0)
+    sent_sum = models.BigIntegerField(default=0)
+    sent_min = models.IntegerField(default=0)
+    sent_max = models.IntegerField(default=0)
+    error_sum = models.BigIntegerField(default=0)
+    error_min = models.IntegerField(default=0)
+    error_max = models.IntegerField(default=0)
+    filtered_sum = models.BigIntegerField(default=0)
+    filtered_min = models.IntegerField(default=0)
+    filtered_max = models.IntegerField(default=0)
+    queued_sum = models.BigIntegerField(default=0)
+    queued_min = models.IntegerField(default=0)
+    queued_max = models.IntegerField(default=0)
+    # Delta dei contatori cumulativi nel bucket (azzeramenti gestiti) e
+    # secondi conteggiati, per delta e rate (vedi counters.py)
+    received_delta = models.BigIntegerField(default=0)
+    sent_delta = models.BigIntegerField(default=0)
+    error_delta = models.BigIntegerField(default=0)
+    filtered_delta = models.BigIntegerField(default=0)
+    delta_seconds = models.FloatField(default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'mirth_metrics_rollup'
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['gateway', 'channel_name', 'period', 'bucket_start'],
+                name='uniq_mirth_metrics_rollup'
+            ),
+        ]
+
+class CheckStatusMetricsRollup(models.Model):
+    gateway = models.ForeignKey(
+        'Gateways',
+        to_field='gtw_uid',
+        on_delete=models.CASCADE,
+        db_column='gateway_uid'
+    )
+    check_name = models.CharField(max_length=255)
+    period = models.CharField(max_length=2, choices=ROLLUP_PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    samples = models.IntegerField(default=0)
+    # Campioni con level diverso da 'OK'
+    non_ok_samples = models.IntegerField(default=0)
+    actual_sum = models.BigIntegerField(default=0)
+    actual_min = models.IntegerField(default=0)
+    actual_max = models.IntegerField(default=0)
+    limit_max = models.IntegerField(default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'check_status_metrics_rollup'
+        ordering = ['-bucket_start']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['gateway', 'check_name', 'period', 'bucket_start'],
+                name='uniq_check_status_metrics_rollup'
+            ),
+        ]
+
+class RollupWatermark(models.Model):
+    # Ultimo id della tabella sorgente già incluso nei rollup
+    name = models.CharField(max_length=64, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    refreshed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'rollup_watermark'
+
+
+# --- Ultimo stato per gateway/canale e gateway/check (aggiornato dall'ingestion) ---
+
+class MirthChannelState(models.Model):
+    gateway = models.ForeignKey(
+        'Gateways',
+        to_field='gtw_uid',
+        on_delete=models.CASCADE,
+        db_column='gateway_uid'
+    )
+    channel_name = models.CharField(max_length=255)
+    channel_id = models.CharField(max_length=50)
+    gateway_timestamp = models.DateTimeField()
+    received = models.IntegerField(default=0)
+    sent = models.IntegerField(default=0)
+    error = models.IntegerField(default=0)
+    filtered = models.IntegerField(default=0)
+    queued = models.IntegerField(default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'mirth_channel_state'
+        constraints = [
+            models.UniqueConstraint(fields=['gateway', 'channel_name'], name='uniq_mirth_channel_state'),
+        ]
+
+class CheckStatusState(models.Model):
+    gateway = models.ForeignKey(
+        'Gateways',
+        to_field='gtw_uid',
+        on_delete=models.CASCADE,
+        db_column='gateway_uid'
+    )
+    check_name = models.CharField(max_length=255)
+    gateway_timestamp = models.DateTimeField()
+    level = models.CharField(max_length=10)
+    description = models.TextField(blank=True, null=True)
+    actual_value = models.IntegerField()
+    limit_value = models.IntegerField()
+    operator = models.CharField(max_length=5)
+    query_time_sec = models.FloatField(blank=True, null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'check_status_state'
+        constraints = [
+            models.UniqueConstraint(fields=['gateway', 'check_name'], name='uniq_check_status_state'),
+        ]
+
+
+# --- Allarmi (valutati dall'ingestion, vedi alerts.py) ---
+
+class Alert(models.Model):
+    RULE_CHOICES = [
+        ('check', 'Check fuori soglia'),
+        ('mirth_errors', 'Errori Mirth in aumento'),
+        ('mirth_queue', 'Coda Mirth in crescita'),
+    ]
+    STATUS_CHOICES = [
+        # In attesa di conferma (soppressione dei flap): non ancora un allarme
+        ('PENDING', 'Pending'),
+        ('OPEN', 'Open'),
+        ('CLOSED', 'Closed'),
+    ]
+
+    gateway = models.ForeignKey(
+        'Gateways',
+        to_field='gtw_uid',
+        on_delete=models.CASCADE,
+        db_column='gateway_uid'
+    )
+    rule = models.CharField(max_length=20, choices=RULE_CHOICES)
+    # Nome del check o del canale Mirth
+    subject = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    severity = models.CharField(max_length=10)
+    message = models.TextField(blank=True, default='')
+    value = models.FloatField(blank=True, null=True)
+    threshold = models.FloatField(blank=True, null=True)
+    # Valutazioni consecutive fuori soglia / rientrate
+    breach_count = models.IntegerField(default=0)
+    ok_count = models.IntegerField(default=0)
+    # Timestamp dei report (orologio del gateway)
+    first_seen_at = models.DateTimeField()
+    last_seen_at = models.DateTimeField()
+    opened_at = models.DateTimeField(blank=True, null=True)
+    closed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'alerts'
+        ordering = ['-opened_at']
+        constraints = [
+            # Al più un allarme non chiuso per gateway/regola/soggetto
+            models.UniqueConstraint(
+                fields=['gateway', 'rule', 'subject'],
+                condition=~models.Q(status='CLOSED'),
+                name='uniq_active_alert'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['status', '-opened_at'], name='alerts_status_opened_idx'),
+        ]
 
 
 # === Modelli NON GESTITI (managed = False) ===
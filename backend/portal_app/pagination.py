@@ -0,0 +1,214 @@
+"""
+Paginazione a cursore (keyset) per le tabelle grandi.
+
+Invece di COUNT(*) + OFFSET crescente, ogni pagina riparte dall'ultima
+riga della precedente: WHERE (datetime, id) < (cursore) ORDER BY
+datetime DESC NULLS LAST, id DESC LIMIT n. Il confronto tra righe
+(non una OR tra colonne) permette a PostgreSQL di scorrere l'indice
+(datetime DESC NULLS LAST, id DESC) creato da `create_log_indexes`:
+il costo resta costante anche sulle pagine profonde. Le righe senza
+datetime, in fondo, si leggono a parte (solo sull'ultima pagina con
+valori, e poi per id).
+
+La view indica l'ordinamento con `keyset_ordering`, es.
+('-datetime', '-id'): il primo campo è la colonna temporale (può essere
+NULL, le righe senza valore vanno in fondo), il secondo un campo univoco
+che fa da spareggio. Il primo campo può anche essere un'annotazione
+della queryset (es. il punteggio della ricerca testuale).
+
+Il totale non viene calcolato, a meno di ?count=approx (stima del
+planner di PostgreSQL, gratuita) o ?count=exact.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import BooleanField, Expression, F, Q, Value
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Numero di righe stimato dal planner (EXPLAIN) su PostgreSQL, senza
+    eseguire la query. Sugli altri database esegue un COUNT esatto.
+    Restituisce (totale, approssimato).
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count(), False
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows']), True
+
+
+class RowComparison(Expression):
+    """
+    Confronto tra righe, es. (datetime, id) < (%s, %s): a differenza
+    della OR equivalente, PostgreSQL lo usa come intervallo di un indice
+    su quelle colonne.
+    """
+    output_field = BooleanField()
+    conditional = True
+
+    def __init__(self, fields, op, values):
+        super().__init__()
+        self.lhs = [F(name) for name in fields]
+        self.rhs = [Value(value) for value in values]
+        self.op = op
+
+    def get_source_expressions(self):
+        return [*self.lhs, *self.rhs]
+
+    def set_source_expressions(self, exprs):
+        self.lhs, self.rhs = exprs[:len(self.lhs)], exprs[len(self.lhs):]
+
+    def as_sql(self, compiler, connection):
+        sides, params = [], []
+        for side in (self.lhs, self.rhs):
+            sqls = []
+            for expression in side:
+                sql, expression_params = compiler.compile(expression)
+                sqls.append(sql)
+                params.extend(expression_params)
+            sides.append(', '.join(sqls))
+        return f'({sides[0]}) {self.op} ({sides[1]})', params
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE or 25
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-datetime', '-id')
+
+    def get_ordering(self, view):
+        return getattr(view, 'keyset_ordering', self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    # --- Cursore: base64 di {"v": valore ordinamento, "k": spareggio} ---
+
+    def encode_cursor(self, value, key):
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        raw = json.dumps({'v': value, 'k': key}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, field):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            data = json.loads(raw)
+            value = data['v']
+            if value is not None:
+                value = field.to_python(value)
+            return value, data['k']
+        except (binascii.Error, ValueError, KeyError, TypeError, ValidationError):
+            raise NotFound("Cursore non valido")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        first, second = self.get_ordering(view)
+        descending = first.startswith('-')
+        self.value_field = first.lstrip('-')
+        self.key_field = second.lstrip('-')
+
+        if descending:
+            queryset = queryset.order_by(F(self.value_field).desc(nulls_last=True), F(self.key_field).desc())
+        else:
+            queryset = queryset.order_by(F(self.value_field).asc(nulls_last=True), F(self.key_field).asc())
+
+        self.count = None
+        self.count_approximate = False
+        count_mode = request.query_params.get(self.count_query_param)
+        if count_mode == 'approx':
+            self.count, self.count_approximate = estimate_count(queryset)
+        elif count_mode == 'exact':
+            self.count = queryset.count()
+
+        if self.value_field in queryset.query.annotations:
+            # Ordinamento su un valore calcolato (es. rank della ricerca)
+            field = queryset.query.annotations[self.value_field].output_field
+        else:
+            field = queryset.model._meta.get_field(self.value_field)
+        cursor = self.decode_cursor(request, field)
+        limit = self.page_size + 1
+        if cursor is None:
+            rows = list(queryset[:limit])
+        else:
+            value, key = cursor
+            null_tail = queryset.filter(**{f"{self.value_field}__isnull": True})
+            if value is None:
+                # Siamo già nella coda delle righe senza valore
+                op = 'lt' if descending else 'gt'
+                rows = list(null_tail.filter(**{f"{self.key_field}__{op}": key})[:limit])
+            else:
+                rows = list(queryset.filter(self.after_cursor(value, key, descending))[:limit])
+                if len(rows) < limit:
+                    rows += list(null_tail[:limit - len(rows)])
+
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def after_cursor(self, value, key, descending):
+        """
+        Condizione per le righe con valore che seguono (value, key)
+        nell'ordinamento (le righe senza valore si leggono a parte).
+        """
+        return Q(**{f"{self.value_field}__isnull": False}) & RowComparison(
+            (self.value_field, self.key_field), '<' if descending else '>', (value, key)
+        )
+
+    @staticmethod
+    def _get(row, name):
+        # Righe come istanze del modello o come dizionari di .values()
+        return row[name] if isinstance(row, dict) else getattr(row, name)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        # Il totale serve solo alla prima pagina
+        url = remove_query_param(url, self.count_query_param)
+        cursor = self.encode_cursor(self._get(self.last, self.value_field), self._get(self.last, self.key_field))
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link()}
+        if self.count is not None:
+            payload['count'] = self.count
+            payload['count_approximate'] = self.count_approximate
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_approximate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,29 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parser per stream NDJSON (un oggetto JSON per riga).
+    Usato dall'ingestion batch: i gateway possono inviare il loro buffer
+    di report così com'è, senza doverlo trasformare in un array.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        reports = []
+        for line_no, raw_line in enumerate(stream, start=1):
+            line = raw_line.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                reports.append(json.loads(line))
+            except ValueError as e:
+                raise ParseError(f"NDJSON non valido alla riga {line_no}: {e}")
+        return reports
@@ -0,0 +1,268 @@
+"""
+Partizionamento mensile (PostgreSQL, RANGE su gateway_timestamp) di
+mirth_metrics e check_status_metrics.
+
+Le partizioni si chiamano <tabella>_pYYYY_MM e coprono un mese solare
+in UTC; <tabella>_default raccoglie le righe fuori intervallo (es.
+orologio del gateway sballato). Con le tabelle partizionate la
+retention diventa un DROP/DETACH di partizione, senza DELETE massivi,
+e le query per intervallo temporale leggono solo le partizioni utili
+(partition pruning). Solo le righe scadute finite nella partizione di
+default (report in ritardo, mesi senza partizione) vengono cancellate
+con un DELETE.
+
+Usato da `manage.py manage_partitions`.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+
+from .models import MirthMetrics, CheckStatusMetrics
+
+# Tabelle partizionabili e colonna "serie" per l'indice composto
+PARTITIONED_TABLES = {
+    MirthMetrics._meta.db_table: (MirthMetrics, 'channel_name'),
+    CheckStatusMetrics._meta.db_table: (CheckStatusMetrics, 'check_name'),
+}
+
+PARTITION_RE = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(value, months):
+    index = value.year * 12 + (value.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind FROM pg_class c "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relname = %s AND n.nspname = current_schema()",
+            [table]
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def list_partitions(table):
+    """
+    Restituisce {mese: nome_partizione} delle partizioni mensili esistenti.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s",
+            [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_RE.search(name)
+        if match:
+            month = datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=dt_timezone.utc)
+            partitions[month] = name
+    return partitions
+
+
+def default_partition(table):
+    """Nome della partizione DEFAULT di `table`, o None se non ne ha una."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'",
+            [table]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_partition(table, month):
+    """
+    Crea la partizione del mese indicato. Se la partizione di default
+    contiene già righe di quel mese, le sposta nella nuova partizione.
+    """
+    name = partition_name(table, month)
+    default = default_partition(table)
+    lower, upper = month, add_months(month, 1)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        has_default_rows = False
+        if default is not None:
+            cursor.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {_q(default)} "
+                f"WHERE gateway_timestamp >= %s AND gateway_timestamp < %s)",
+                [lower, upper]
+            )
+            has_default_rows = cursor.fetchone()[0]
+
+        if has_default_rows:
+            cursor.execute(f"ALTER TABLE {_q(table)} DETACH PARTITION {_q(default)}")
+        cursor.execute(
+            f"CREATE TABLE {_q(name)} PARTITION OF {_q(table)} "
+            f"FOR VALUES FROM (%s) TO (%s)",
+            [lower, upper]
+        )
+        if has_default_rows:
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {_q(default)} "
+                f"WHERE gateway_timestamp >= %s AND gateway_timestamp < %s RETURNING *) "
+                f"INSERT INTO {_q(table)} SELECT * FROM moved",
+                [lower, upper]
+            )
+            cursor.execute(f"ALTER TABLE {_q(table)} ATTACH PARTITION {_q(default)} DEFAULT")
+    return name
+
+
+def ensure_partitions(table, months_ahead, now=None):
+    """
+    Crea le partizioni dal mese corrente fino a `months_ahead` mesi avanti.
+    Restituisce i nomi delle partizioni create.
+    """
+    current = month_start(now or datetime.now(dt_timezone.utc))
+    existing = list_partitions(table)
+    created = []
+    for i in range(months_ahead + 1):
+        month = add_months(current, i)
+        if month not in existing:
+            created.append(create_partition(table, month))
+    return created
+
+
+def retention_cutoff(retention_months, now=None):
+    """Inizio del mese più vecchio da conservare."""
+    return add_months(month_start(now or datetime.now(dt_timezone.utc)), -retention_months)
+
+
+def expire_partitions(table, retention_months, detach=False, now=None):
+    """
+    Elimina (o stacca, con detach=True) le partizioni interamente più
+    vecchie di `retention_months` mesi. Restituisce i nomi coinvolti.
+    """
+    cutoff = retention_cutoff(retention_months, now)
+    expired = []
+    for month, name in sorted(list_partitions(table).items()):
+        if add_months(month, 1) > cutoff:
+            continue
+        with connection.cursor() as cursor:
+            if detach:
+                # La tabella resta nel DB come tabella normale (es. per archiviazione)
+                cursor.execute(f"ALTER TABLE {_q(table)} DETACH PARTITION {_q(name)}")
+            else:
+                cursor.execute(f"DROP TABLE {_q(name)}")
+        expired.append(name)
+    return expired
+
+
+def expire_default_rows(table, retention_months, now=None):
+    """
+    Cancella dalla partizione di default le righe più vecchie della
+    retention (non coperte dal DROP delle partizioni mensili).
+    Restituisce il numero di righe cancellate.
+    """
+    default = default_partition(table)
+    if default is None:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {_q(default)} WHERE gateway_timestamp < %s",
+            [retention_cutoff(retention_months, now)]
+        )
+        return cursor.rowcount
+
+
+def convert_to_partitioned(table, months_ahead, keep_legacy=False):
+    """
+    Converte una tabella normale in tabella partizionata, copiando i dati.
+    Tutto avviene in una transazione: durante la copia la tabella è
+    bloccata, conviene quindi sospendere l'ingestion (o usare
+    INGESTION_MODE=queue, che accoda i report nel frattempo).
+    """
+    model, series = PARTITIONED_TABLES[table]
+    pk = model._meta.pk.column
+    legacy = f"{table}_legacy"
+    default = f"{table}_default"
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {_q(table)} IN ACCESS EXCLUSIVE MODE")
+            cursor.execute(f"SELECT min(gateway_timestamp) FROM {_q(table)}")
+            first = cursor.fetchone()[0]
+            # La pk può essere IDENTITY (tabelle create da Django) o bigserial
+            # (tabelle create da tabelle_db.sql): in entrambi i casi la
+            # numerazione deve proseguire da dove era arrivata
+            cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, pk])
+            sequence = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT attidentity FROM pg_attribute "
+                "WHERE attrelid = %s::regclass AND attname = %s",
+                [table, pk]
+            )
+            identity = cursor.fetchone()[0] != ''
+            next_id = 1
+            if sequence:
+                cursor.execute(f"SELECT last_value + CASE WHEN is_called THEN 1 ELSE 0 END FROM {sequence}")
+                next_id = cursor.fetchone()[0]
+
+            cursor.execute(f"ALTER TABLE {_q(table)} RENAME TO {_q(legacy)}")
+            cursor.execute(
+                f"CREATE TABLE {_q(table)} (LIKE {_q(legacy)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                f"PARTITION BY RANGE (gateway_timestamp)"
+            )
+            # La chiave primaria deve includere la chiave di partizionamento
+            cursor.execute(
+                f"ALTER TABLE {_q(table)} ADD CONSTRAINT {_q(table + '_pkey_part')} "
+                f"PRIMARY KEY ({_q(pk)}, gateway_timestamp)"
+            )
+            cursor.execute(
+                f"ALTER TABLE {_q(table)} ADD CONSTRAINT {_q(table + '_gateway_uid_fk_part')} "
+                f"FOREIGN KEY (gateway_uid) REFERENCES {_q('gateways')} (gtw_uid) "
+                f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED"
+            )
+            # Un indice composto al posto degli indici su singola colonna
+            cursor.execute(
+                f"CREATE INDEX {_q(table + '_series_ts_idx')} ON {_q(table)} "
+                f"(gateway_uid, {_q(series)}, gateway_timestamp)"
+            )
+            cursor.execute(
+                f"CREATE INDEX {_q(table + '_ts_idx')} ON {_q(table)} (gateway_timestamp)"
+            )
+            cursor.execute(f"CREATE TABLE {_q(default)} PARTITION OF {_q(table)} DEFAULT")
+
+        # Partizioni dal mese del dato più vecchio fino a `months_ahead` mesi avanti
+        current = month_start(datetime.now(dt_timezone.utc))
+        month = month_start(first) if first else current
+        while month <= add_months(current, months_ahead):
+            create_partition(table, month)
+            month = add_months(month, 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {_q(table)} SELECT * FROM {_q(legacy)}")
+            copied = cursor.rowcount
+            if identity:
+                cursor.execute(
+                    f"ALTER TABLE {_q(table)} ALTER COLUMN {_q(pk)} "
+                    f"ADD GENERATED BY DEFAULT AS IDENTITY (START WITH {int(next_id)})"
+                )
+            elif sequence:
+                cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {_q(table)}.{_q(pk)}")
+            if not keep_legacy:
+                cursor.execute(f"DROP TABLE {_q(legacy)}")
+    return copied
@@ -0,0 +1,125 @@
+"""
+Notifiche tra processi con LISTEN/NOTIFY di PostgreSQL.
+
+Un solo thread per processo, con una connessione dedicata (fuori dal
+pool di Django), resta in LISTEN su tutti i canali registrati e passa
+ogni notifica al relativo handler. Lo usano il canale comandi dei
+gateway (action_channel.py) e gli aggiornamenti live (live.py).
+
+Con NOTIFY_BACKEND='auto' le notifiche passano da PostgreSQL solo se il
+database è PostgreSQL; altrimenti (o con 'local') ogni modulo notifica
+direttamente nel processo corrente.
+"""
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+logger = logging.getLogger(__name__)
+
+# canale -> (handler(payload), on_listen(reconnected))
+_channels = {}
+
+
+def use_postgres_notify():
+    backend = settings.NOTIFY_BACKEND
+    return backend == 'postgres' or (backend == 'auto' and connection.vendor == 'postgresql')
+
+
+def register(channel, handler, on_listen=None):
+    """
+    Registra l'handler di un canale. `on_listen(reconnected)` viene
+    chiamata ogni volta che il LISTEN è attivo: le notifiche inviate
+    prima (o durante una disconnessione) sono perse e vanno recuperate.
+    """
+    _channels[channel] = (handler, on_listen)
+
+
+def notify(channel, payload):
+    """
+    Invia una notifica nella transazione corrente: PostgreSQL la
+    consegna solo al commit (e la scarta in caso di rollback).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_notify(%s, %s)", [channel, payload])
+
+
+class PostgresListener(threading.Thread):
+
+    def __init__(self):
+        super().__init__(name='pg-listener', daemon=True)
+        self.connected_once = False
+
+    def run(self):
+        backoff = 1
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                logger.warning("Listener PostgreSQL: %s, nuovo tentativo tra %ss", e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _listening(self):
+        for handler, on_listen in list(_channels.values()):
+            if on_listen is not None:
+                on_listen(self.connected_once)
+        self.connected_once = True
+
+    def _dispatch(self, channel, payload):
+        handler, _ = _channels.get(channel, (None, None))
+        if handler is None:
+            return
+        try:
+            handler(payload)
+        except Exception:
+            logger.exception("Listener PostgreSQL: errore nell'handler di %s", channel)
+
+    def _listen(self):
+        wrapper = connections['default']
+        conn = wrapper.Database.connect(**wrapper.get_connection_params())
+        try:
+            if not is_psycopg3:
+                conn.set_isolation_level(0)  # autocommit
+                cursor = conn.cursor()
+                for channel in list(_channels):
+                    cursor.execute(f"LISTEN {channel}")
+                self._listening()
+                while True:
+                    if select.select([conn], [], [], 30) != ([], [], []):
+                        conn.poll()
+                        while conn.notifies:
+                            notify = conn.notifies.pop(0)
+                            self._dispatch(notify.channel, notify.payload)
+            else:
+                conn.autocommit = True
+                for channel in list(_channels):
+                    conn.execute(f"LISTEN {channel}")
+                self._listening()
+                while True:
+                    for notify in conn.notifies(timeout=30):
+                        self._dispatch(notify.channel, notify.payload)
+        finally:
+            conn.close()
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listener():
+    """
+    Avvia il thread di LISTEN del processo, se serve e non è già attivo.
+    I canali vanno registrati prima (al caricamento dei moduli).
+    """
+    global _listener
+    if not use_postgres_notify():
+        return
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = PostgresListener()
+            _listener.start()
@@ -0,0 +1,313 @@
+"""
+Rollup orari e giornalieri di mirth_metrics e check_status_metrics.
+
+`manage.py refresh_rollups` legge solo le righe grezze con id maggiore
+del watermark salvato, individua i bucket orari che toccano e li
+ricalcola per intero dai dati grezzi; i giorni toccati vengono poi
+ricalcolati dai rollup orari. Può quindi girare a intervalli brevi: il
+costo dipende dalle righe nuove, non dalla dimensione delle tabelle.
+
+Le transazioni di ingestion non committano in ordine di id (COPY a
+blocchi, writer della coda, worker concorrenti): una riga con id sotto
+il watermark può diventare visibile dopo il refresh. Ogni refresh
+rielabora quindi anche le ultime ROLLUP_OVERLAP_ROWS righe sotto il
+watermark; una transazione rimasta aperta più a lungo va ripresa con
+`refresh_rollups --rebuild-since <data>`.
+
+Lo storico legge dai rollup solo i bucket precedenti sia all'ultimo
+refresh sia al campione più vecchio della serie non ancora garantito
+nei rollup (id oltre watermark - ROLLUP_OVERLAP_ROWS): un report in
+ritardo o recuperato dalla coda resta visibile dai dati grezzi finché
+il refresh successivo non lo include.
+
+I rollup Mirth salvano anche i delta dei contatori cumulativi (vedi
+counters.py): i bucket orari li calcolano con LAG() sui dati grezzi,
+includendo il campione precedente all'ora (fino a
+COUNTER_MAX_GAP_SECONDS prima), i giorni li sommano.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from .models import (
+    MirthMetrics, CheckStatusMetrics, MirthMetricsRollup, CheckStatusMetricsRollup,
+    RollupWatermark
+)
+from .counters import DELTA_COUNTERS, Epoch, counter_deltas, counter_values, max_gap
+from .timeseries import TimeBucket
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+MIRTH_COUNTERS = ('received', 'sent', 'error', 'filtered', 'queued')
+
+# Definizione dei rollup: chiave di serie, misure orarie (dai dati grezzi)
+# e misure giornaliere (ri-aggregate dai rollup orari)
+ROLLUPS = {
+    'mirth_metrics': {
+        'source': MirthMetrics,
+        'rollup': MirthMetricsRollup,
+        'series': 'channel_name',
+        'hourly': dict(
+            [('samples', Count('pk'))]
+            + [(f'{c}_sum', Sum(c)) for c in MIRTH_COUNTERS]
+            + [(f'{c}_min', Min(c)) for c in MIRTH_COUNTERS]
+            + [(f'{c}_max', Max(c)) for c in MIRTH_COUNTERS]
+        ),
+        'daily': dict(
+            [('samples', Sum)]
+            + [(f'{c}_sum', Sum) for c in MIRTH_COUNTERS]
+            + [(f'{c}_min', Min) for c in MIRTH_COUNTERS]
+            + [(f'{c}_max', Max) for c in MIRTH_COUNTERS]
+            + [(f'{c}_delta', Sum) for c in DELTA_COUNTERS]
+            + [('delta_seconds', Sum)]
+        ),
+        'deltas': True,
+    },
+    'check_status_metrics': {
+        'source': CheckStatusMetrics,
+        'rollup': CheckStatusMetricsRollup,
+        'series': 'check_name',
+        'hourly': {
+            'samples': Count('pk'),
+            'non_ok_samples': Count('pk', filter=~Q(level='OK')),
+            'actual_sum': Sum('actual_value'),
+            'actual_min': Min('actual_value'),
+            'actual_max': Max('actual_value'),
+            'limit_max': Max('limit_value'),
+        },
+        'daily': {
+            'samples': Sum,
+            'non_ok_samples': Sum,
+            'actual_sum': Sum,
+            'actual_min': Min,
+            'actual_max': Max,
+            'limit_max': Max,
+        },
+    },
+}
+
+
+def refresh_rollups(name, rebuild_since=None):
+    """
+    Aggiorna i rollup `name` (chiave di ROLLUPS) a partire dal watermark.
+    Con `rebuild_since` ricalcola tutti i bucket da quella data in poi.
+    Restituisce (righe_nuove, ore_ricalcolate, giorni_ricalcolati).
+    """
+    spec = ROLLUPS[name]
+    source = spec['source']
+
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=name)
+        max_id = source.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+
+        if rebuild_since is not None:
+            new_rows = source.objects.filter(gateway_timestamp__gte=rebuild_since, pk__lte=max_id)
+        else:
+            # Anche le ultime righe sotto il watermark: commit fuori ordine
+            new_rows = source.objects.filter(pk__gt=reprocess_from(watermark.last_id), pk__lte=max_id)
+
+        # Bucket orari toccati dalle righe nuove
+        hours = sorted(set(
+            new_rows.annotate(hour=TimeBucket('gateway_timestamp', HOUR))
+            .values_list('hour', flat=True).distinct()
+        ))
+        n_rows = new_rows.filter(pk__gt=watermark.last_id).count() if hours else 0
+
+        _rebuild_hours(spec, hours)
+        days = sorted({h.replace(hour=0, minute=0, second=0, microsecond=0) for h in hours})
+        _rebuild_days(spec, days)
+
+        watermark.last_id = max_id
+        watermark.refreshed_at = timezone.now()
+        watermark.save()
+
+    return n_rows, len(hours), len(days)
+
+
+def rebuild_rollups(name, since, gateways):
+    """
+    Ricalcola i rollup `name` dei soli `gateways` da `since` in poi (es.
+    dati sintetici appena scritti) senza toccare il watermark: il refresh
+    periodico resta responsabile delle righe degli altri gateway.
+    Restituisce (ore_ricalcolate, giorni_ricalcolati).
+    """
+    spec = ROLLUPS[name]
+    gateways = list(gateways)
+    with transaction.atomic():
+        hours = sorted(set(
+            spec['source'].objects.filter(gateway_timestamp__gte=since, gateway_id__in=gateways)
+            .annotate(hour=TimeBucket('gateway_timestamp', HOUR))
+            .values_list('hour', flat=True).distinct()
+        ))
+        _rebuild_hours(spec, hours, gateways)
+        days = sorted({h.replace(hour=0, minute=0, second=0, microsecond=0) for h in hours})
+        _rebuild_days(spec, days, gateways)
+    return len(hours), len(days)
+
+
+def _scoped(queryset, gateways):
+    return queryset if gateways is None else queryset.filter(gateway_id__in=gateways)
+
+
+def _ranges_filter(field, starts, length):
+    """Q che seleziona le righe con `field` in uno degli intervalli [start, start+length)."""
+    q = Q()
+    for start in starts:
+        q |= Q(**{f'{field}__gte': start, f'{field}__lt': start + length})
+    return q
+
+
+def _rebuild_hours(spec, hours, gateways=None):
+    if not hours:
+        return
+    series = spec['series']
+    rows = (
+        _scoped(spec['source'].objects, gateways)
+        .filter(_ranges_filter('gateway_timestamp', hours, timedelta(hours=1)))
+        .annotate(bucket=TimeBucket('gateway_timestamp', HOUR))
+        .values('gateway_id', series, 'bucket')
+        .annotate(**{f'r_{k}': agg for k, agg in spec['hourly'].items()})
+    )
+    if spec.get('deltas'):
+        rows = list(rows)
+        _add_hourly_deltas(spec, hours, rows, gateways)
+    _upsert(spec, '1h', rows)
+
+
+def _add_hourly_deltas(spec, hours, rows, gateways=None):
+    """Aggiunge a `rows` (bucket orari) i delta dei contatori e i secondi conteggiati."""
+    series = spec['series']
+    gap = max_gap()
+    queryset = (
+        _scoped(spec['source'].objects, gateways)
+        .filter(_ranges_filter('gateway_timestamp', [h - gap for h in hours], timedelta(hours=1) + gap))
+        .annotate(bucket=Epoch(TimeBucket('gateway_timestamp', HOUR)))
+    )
+    deltas = {
+        (row['gateway_id'], row[series], round(row['bucket'])): row
+        for row in counter_deltas(
+            queryset, ('gateway_id', series, 'bucket'), partition_by=('gateway_id', series), since=hours[0]
+        )
+    }
+    for row in rows:
+        delta = deltas.get((row['gateway_id'], row[series], round(row['bucket'].timestamp())), {})
+        for c in DELTA_COUNTERS:
+            row[f'r_{c}_delta'] = delta.get(f'{c}_delta')
+        row['r_delta_seconds'] = delta.get('delta_seconds')
+
+
+def _rebuild_days(spec, days, gateways=None):
+    if not days:
+        return
+    series = spec['series']
+    rows = (
+        _scoped(spec['rollup'].objects, gateways)
+        .filter(period='1h')
+        .filter(_ranges_filter('bucket_start', days, timedelta(days=1)))
+        .annotate(bucket=TimeBucket('bucket_start', DAY))
+        .values('gateway_id', series, 'bucket')
+        .annotate(**{f'r_{k}': agg(k) for k, agg in spec['daily'].items()})
+    )
+    _upsert(spec, '1d', rows)
+
+
+def _upsert(spec, period, rows):
+    rollup = spec['rollup']
+    series = spec['series']
+    # Le misure giornaliere comprendono anche quelle calcolate a parte (delta)
+    measures = list(spec['daily'])
+    objs = [
+        rollup(
+            gateway_id=row['gateway_id'],
+            period=period,
+            bucket_start=row['bucket'],
+            **{series: row[series]},
+            **{k: row[f'r_{k}'] or 0 for k in measures}
+        )
+        for row in rows
+    ]
+    if objs:
+        # INSERT ... ON CONFLICT DO UPDATE
+        rollup.objects.bulk_create(
+            objs, batch_size=1000, update_conflicts=True,
+            unique_fields=['gateway', series, 'period', 'bucket_start'],
+            update_fields=measures,
+        )
+
+
+def reprocess_from(last_id):
+    """Id oltre il quale le righe non sono garantite nei rollup (vedi il docstring del modulo)."""
+    return max(0, last_id - settings.ROLLUP_OVERLAP_ROWS)
+
+
+def watermark_queryset(name):
+    """Watermark del rollup `name` (al più una riga: refreshed_at, last_id)."""
+    return RollupWatermark.objects.filter(name=name).values_list('refreshed_at', 'last_id')[:1]
+
+
+def pending_queryset(series, last_id):
+    """
+    Timestamp del campione più vecchio di `series` (queryset delle righe
+    grezze di una serie) non ancora garantito nei rollup: al più una riga.
+    """
+    return (
+        series.filter(pk__gt=reprocess_from(last_id))
+        .order_by('gateway_timestamp').values_list('gateway_timestamp', flat=True)[:1]
+    )
+
+
+def cutoff_from_watermark(refreshed_at, period, pending_since=None):
+    """
+    Inizio del primo bucket `period` non ancora coperto dai rollup,
+    oppure None se i rollup non sono mai stati calcolati. Con
+    `pending_since` (vedi pending_queryset) il bucket che contiene quel
+    campione e i successivi restano ai dati grezzi.
+    """
+    if refreshed_at is None:
+        return None
+    covered = refreshed_at if pending_since is None else min(refreshed_at, pending_since)
+    seconds = HOUR if period == '1h' else DAY
+    epoch = int(covered.timestamp()) // seconds * seconds
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+def mirth_rollup_queryset(gtw_uid, channel_name, period, start, end):
+    return MirthMetricsRollup.objects.filter(
+        gateway_id=gtw_uid,
+        channel_name=channel_name,
+        period=period,
+        bucket_start__gte=start,
+        bucket_start__lt=end,
+    ).order_by('bucket_start')
+
+
+def rollup_points(rows, agg, mode='value'):
+    """
+    Converte le righe dei rollup Mirth in punti dello storico (stesso
+    formato dell'aggregazione sui dati grezzi). Con mode 'delta'/'rate'
+    i contatori cumulativi sono sostituiti dai delta salvati.
+    """
+    points = []
+    for row in rows:
+        point = {'gateway_timestamp': row.bucket_start, 'samples': row.samples}
+        for c in MIRTH_COUNTERS:
+            if agg == 'avg':
+                point[c] = getattr(row, f'{c}_sum') / row.samples if row.samples else 0
+            else:
+                point[c] = getattr(row, f'{c}_{agg}')
+        if mode != 'value':
+            deltas = {c: getattr(row, f'{c}_delta') for c in DELTA_COUNTERS}
+            point.update(counter_values(deltas, row.delta_seconds, mode))
+        points.append(point)
+    return points
+
+
+def mirth_rollup_points(gtw_uid, channel_name, period, start, end, agg, mode='value'):
+    """
+    Punti dello storico Mirth letti dai rollup.
+    """
+    return rollup_points(mirth_rollup_queryset(gtw_uid, channel_name, period, start, end), agg, mode)
@@ -2,7 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import (
     Gateways, KfeLogEvent, Channels, ExportPda, PdaStatsV6, ErroriDaImportare,
-    MirthMetrics, CheckStatusMetrics, GatewayPendingActions
+    MirthMetrics, CheckStatusMetrics, GatewayPendingActions, Alert
 )
 
 # Serializer per l'utente (per tracciamento)
@@ -24,6 +24,8 @@ class GatewaySerializer(serializers.ModelSerializer):
 class KfeLogEventSerializer(serializers.ModelSerializer):
     # Il nostro campo virtuale per estrarre il nome del batch
     batch_name = serializers.SerializerMethodField()
+    # Per il fast path (fastjson): batch_name arriva dall'annotazione SQL 'batch'
+    fast_sources = {'batch_name': ('batch', lambda value: value or None)}
 
     class Meta:
         model = KfeLogEvent
@@ -37,6 +39,9 @@ class KfeLogEventSerializer(serializers.ModelSerializer):
         Estrae la parte della descrizione prima del " - ".
         Esempio: "xds_cron - ((93vl)) Errore..." -> "xds_cron"
         """
+        # Già calcolato in SQL dalla queryset (vedi logs.BatchName)
+        if hasattr(obj, 'batch'):
+            return obj.batch or None
         if obj.description:
             try:
                 # Splitta la stringa al primo " - " e prende la parte [0]
@@ -73,11 +78,29 @@ class MirthMetricsSerializer(serializers.ModelSerializer):
         model = MirthMetrics
         fields = '__all__'
 
+# Punto aggregato (bucket temporale) dello storico Mirth
+class MirthMetricsBucketSerializer(serializers.Serializer):
+    gateway_timestamp = serializers.DateTimeField()
+    received = serializers.ReadOnlyField()
+    sent = serializers.ReadOnlyField()
+    error = serializers.ReadOnlyField()
+    filtered = serializers.ReadOnlyField()
+    queued = serializers.ReadOnlyField()
+    samples = serializers.IntegerField()
+
 class CheckStatusMetricsSerializer(serializers.ModelSerializer):
     class Meta:
         model = CheckStatusMetrics
         fields = '__all__'
 
+class AlertSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Alert
+        fields = [
+            'id', 'gateway', 'rule', 'subject', 'status', 'severity', 'message', 'value', 'threshold',
+            'first_seen_at', 'last_seen_at', 'opened_at', 'closed_at',
+        ]
+
 class GatewayPendingActionSerializer(serializers.ModelSerializer):
     # Mostra i dettagli dell'utente, non solo l'ID
     created_by = UserSerializer(read_only=True)
@@ -90,6 +113,23 @@ class GatewayPendingActionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_by', 'status']
 
+# Payload compatto inviato ai gateway (niente dati utente, nessuna query sulla FK)
+class PendingActionDispatchSerializer(serializers.ModelSerializer):
+    gateway = serializers.CharField(source='gateway_id', read_only=True)
+
+    class Meta:
+        model = GatewayPendingActions
+        fields = ['id', 'gateway', 'action_command', 'payload', 'created_at']
+
+# Esiti delle azioni riportati dal gateway
+class ActionResultSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['COMPLETED', 'FAILED'])
+
+class ActionResultsReportSerializer(serializers.Serializer):
+    gtw_uid = serializers.CharField(max_length=64)
+    results = ActionResultSerializer(many=True, allow_empty=False)
+
 # Serializer per la creazione dell'azione
 class CreateActionSerializer(serializers.Serializer):
     gtw_uid = serializers.CharField(max_length=64)
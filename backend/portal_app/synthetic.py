@@ -0,0 +1,277 @@
+"""
+Flotta di gateway sintetica per benchmark e test di carico.
+
+SyntheticFleet genera report nello stesso formato JSON che i gateway
+inviano a /api/ingest-metrics/ (blocchi "mirth" e "CheckStatus"), con
+contatori Mirth cumulativi che crescono con un traffico diverso per
+canale, azzeramenti occasionali (canale ridistribuito), code e check
+fuori soglia di tanto in tanto. I dati sono deterministici a parità di
+seed.
+
+seed_fleet() scrive la flotta e il suo storico nel database (con il
+writer dell'ingestion), più righe di kfe_log_event; i dati sintetici
+sono riconoscibili dal prefisso dei gtw_uid / external_id e
+delete_fleet() li rimuove. Scrive solo su un database dedicato
+(BENCHMARK_DATABASE=True), dove create_tables() crea le tabelle mancanti.
+"""
+import random
+import uuid
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .alerts import OPERATORS
+from .ingestion import build_check_rows, build_mirth_rows
+from .latest_state import STATES, rebuild_latest_state
+from .models import (
+    Alert, CheckStatusMetrics, CheckStatusMetricsRollup, CheckStatusState, GatewayPendingActions, Gateways,
+    KfeLogEvent, MirthChannelState, MirthMetrics, MirthMetricsRollup,
+)
+from .rollups import ROLLUPS, rebuild_rollups
+from .writers import get_metrics_writer
+
+DEFAULT_PREFIX = 'bench-'
+
+CHANNELS = (
+    'ADT_Inbound', 'ORU_Referti', 'ORM_Ordini', 'MDM_Documenti',
+    'XDS_Export', 'PDF_Archivio', 'SIU_Agenda', 'DFT_Addebiti',
+)
+# nome -> (operatore, limite, valore tipico)
+CHECKS = {
+    'disk_usage_pct': ('<', 90, 55),
+    'db_connections': ('<', 100, 35),
+    'oldest_queued_min': ('<', 30, 3),
+    'failed_logins': ('<', 10, 1),
+    'backup_age_hours': ('<', 26, 12),
+}
+LOG_BATCHES = ('xds_cron', 'import_pda', 'export_referti', 'invio_documenti', 'archivio', 'firma_digitale')
+LOG_WORDS = (
+    'documento', 'paziente', 'referto', 'timeout', 'connessione', 'firma', 'invio',
+    'ricezione', 'completato', 'errore', 'ritentato', 'archiviato', 'notifica',
+)
+
+# Probabilità per report: canale ridistribuito (contatori azzerati), check fuori soglia
+RESET_PROBABILITY = 0.0005
+BREACH_PROBABILITY = 0.01
+
+
+def check_benchmark_database():
+    """Solleva ImproperlyConfigured se il database non è dedicato al benchmark."""
+    if not settings.BENCHMARK_DATABASE:
+        raise ImproperlyConfigured(
+            "Il database non è dedicato al benchmark: impostare BENCHMARK_DATABASE=True "
+            "solo su un database di prova (es. DB_ENGINE=sqlite)"
+        )
+
+
+def create_tables():
+    """
+    Crea nel database di benchmark le tabelle mancanti di portal_app,
+    anche quelle legacy (managed = False, senza migrazioni). Le tabelle
+    di Django (auth, ...) vengono da manage.py migrate. Restituisce i
+    nomi delle tabelle create.
+    """
+    check_benchmark_database()
+    existing = set(connection.introspection.table_names())
+    created = []
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('portal_app').get_models():
+            if model._meta.db_table not in existing:
+                editor.create_model(model)
+                created.append(model._meta.db_table)
+    return created
+
+
+class SyntheticFleet:
+
+    def __init__(self, gateways=10, channels=4, checks=3, seed=42, prefix=DEFAULT_PREFIX):
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.gateway_uids = [f'{prefix}{i:04d}' for i in range(gateways)]
+        self.channels = [
+            CHANNELS[i % len(CHANNELS)] + (f'_{i // len(CHANNELS)}' if i >= len(CHANNELS) else '')
+            for i in range(channels)
+        ]
+        self.checks = list(CHECKS)[:checks]
+
+        # Per canale: messaggi al minuto, channelId di Mirth, contatori
+        # cumulativi [received, sent, error, filtered] e coda
+        self.rates = {}
+        self.channel_ids = {}
+        self.counters = {}
+        self.queued = {}
+        for gtw_uid in self.gateway_uids:
+            for channel in self.channels:
+                key = (gtw_uid, channel)
+                self.rates[key] = self.rng.lognormvariate(1.5, 1.0)
+                self.channel_ids[key] = str(uuid.UUID(int=self.rng.getrandbits(128)))
+                self.counters[key] = [0, 0, 0, 0]
+                self.queued[key] = 0
+
+    def gateways(self):
+        """Istanze (non salvate) dei gateway della flotta."""
+        return [
+            Gateways(
+                gtw_uid=gtw_uid, gtw_name=f'Benchmark {i:04d}', sw_version='1.0', current_version='1.0',
+                gateway_description='Gateway sintetico (manage.py benchmark)', last_date_call=timezone.now(),
+            )
+            for i, gtw_uid in enumerate(self.gateway_uids)
+        ]
+
+    def resume(self):
+        """Riprende i contatori dall'ultimo stato salvato (mirth_channel_state)."""
+        rows = MirthChannelState.objects.filter(gateway_id__in=self.gateway_uids).values_list(
+            'gateway_id', 'channel_name', 'received', 'sent', 'error', 'filtered', 'queued'
+        )
+        for gtw_uid, channel, received, sent, error, filtered, queued in rows:
+            if (gtw_uid, channel) in self.counters:
+                self.counters[gtw_uid, channel] = [received, sent, error, filtered]
+                self.queued[gtw_uid, channel] = queued
+
+    def report(self, gtw_uid, timestamp, elapsed=60):
+        """
+        Report di un gateway al `timestamp` (datetime), con i contatori
+        avanzati del traffico di `elapsed` secondi.
+        """
+        rng = self.rng
+        mirth = {}
+        for channel in self.channels:
+            key = (gtw_uid, channel)
+            counters = self.counters[key]
+            if rng.random() < RESET_PROBABILITY:
+                counters[:] = [0, 0, 0, 0]
+            received = int(self.rates[key] * elapsed / 60 * rng.uniform(0.5, 1.5))
+            error = received // 100 + (rng.random() < (received % 100) / 100)
+            filtered = received // 20
+            for i, value in enumerate((received, received - error - filtered, error, filtered)):
+                counters[i] += value
+            self.queued[key] = max(0, self.queued[key] + rng.randint(-3, 3))
+            mirth[channel] = {
+                'channelId': self.channel_ids[key],
+                'metrics': {
+                    'received': counters[0], 'sent': counters[1], 'error': counters[2],
+                    'filtered': counters[3], 'queued': self.queued[key],
+                },
+            }
+
+        check_status = {}
+        for name in self.checks:
+            operator, limit, typical = CHECKS[name]
+            if rng.random() < BREACH_PROBABILITY:
+                actual = limit + rng.randint(1, max(1, limit // 2))
+            else:
+                actual = max(0, int(rng.gauss(typical, typical * 0.3)))
+            ok = OPERATORS[operator](actual, limit)
+            check_status[name] = {
+                'level': 'OK' if ok else rng.choice(('WARNING', 'ERROR')),
+                'description': '' if ok else f'{name} oltre la soglia',
+                'act': actual, 'limit': limit, 'operator': operator,
+                'query_time_sec': round(rng.uniform(0.001, 0.2), 4),
+            }
+
+        return {
+            'gtw_uid': gtw_uid,
+            'timestamp': timestamp.isoformat(),
+            'mirth': mirth,
+            'CheckStatus': check_status,
+        }
+
+    def history(self, start, end, interval):
+        """Report di tutti i gateway ogni `interval` secondi tra start ed end, in ordine di tempo."""
+        step = timedelta(seconds=interval)
+        timestamp = start
+        while timestamp <= end:
+            for gtw_uid in self.gateway_uids:
+                yield self.report(gtw_uid, timestamp, elapsed=interval)
+            timestamp += step
+
+    def log_events(self, count, end):
+        """Righe di kfe_log_event (non salvate), una ogni pochi secondi fino a `end`."""
+        rng = self.rng
+        timestamp = end
+        for i in range(count):
+            timestamp -= timedelta(seconds=rng.randint(1, 10))
+            level = rng.choices(('INFO', 'WARNING', 'ERROR'), weights=(85, 10, 5))[0]
+            yield KfeLogEvent(
+                username=rng.choice(('system', 'operatore', 'cron')),
+                node_fk=rng.randint(1, 50),
+                action=rng.choice(('IMPORT', 'EXPORT', 'SEND', 'SIGN')),
+                description=(
+                    f"{rng.choice(LOG_BATCHES)} - (({i:x})) " + ' '.join(rng.choices(LOG_WORDS, k=8))
+                ),
+                level=level,
+                datetime=timestamp,
+                node_type='GTW',
+                doc_channel=f'CH{rng.randint(0, 499):05d}',
+                external_id=f'{self.prefix}{i}',
+            )
+
+
+def seed_fleet(fleet, days, interval, logs, batch_size=5000):
+    """
+    Scrive nel database la flotta, `days` giorni di storico con un report
+    per gateway ogni `interval` secondi e `logs` righe di log. Aggiorna
+    poi ultimo stato e rollup dei soli gateway sintetici. Restituisce il
+    numero di righe scritte.
+    """
+    check_benchmark_database()
+    end = timezone.now()
+    start = end - timedelta(days=days)
+    Gateways.objects.bulk_create(fleet.gateways(), batch_size=1000)
+
+    writer = get_metrics_writer()
+    counts = {'gateways': len(fleet.gateway_uids), 'mirth_metrics': 0, 'check_status_metrics': 0, 'kfe_log_event': 0}
+    mirth_rows, check_rows = [], []
+
+    def flush():
+        with transaction.atomic():
+            writer.write_mirth(mirth_rows)
+            writer.write_checks(check_rows)
+        counts['mirth_metrics'] += len(mirth_rows)
+        counts['check_status_metrics'] += len(check_rows)
+        mirth_rows.clear()
+        check_rows.clear()
+
+    for report in fleet.history(start, end, interval):
+        # Stessa conversione dell'ingestion
+        mirth_rows.extend(build_mirth_rows(report['gtw_uid'], report['timestamp'], report['mirth']))
+        check_rows.extend(build_check_rows(report['gtw_uid'], report['timestamp'], report['CheckStatus']))
+        if len(mirth_rows) + len(check_rows) >= batch_size:
+            flush()
+    flush()
+
+    events = []
+    for event in fleet.log_events(logs, end):
+        events.append(event)
+        if len(events) >= batch_size:
+            KfeLogEvent.objects.bulk_create(events)
+            counts['kfe_log_event'] += len(events)
+            events = []
+    KfeLogEvent.objects.bulk_create(events)
+    counts['kfe_log_event'] += len(events)
+
+    for model in STATES:
+        with transaction.atomic():
+            rebuild_latest_state(model, since=start, gateways=fleet.gateway_uids)
+    for name in ROLLUPS:
+        rebuild_rollups(name, start, fleet.gateway_uids)
+    return counts
+
+
+def delete_fleet(prefix=DEFAULT_PREFIX):
+    """Rimuove i gateway sintetici con prefisso `prefix` e tutti i loro dati."""
+    if not prefix:
+        raise ValueError("Prefisso vuoto: verrebbero rimossi tutti i gateway")
+    gtw_uids = list(Gateways.objects.filter(gtw_uid__startswith=prefix).values_list('gtw_uid', flat=True))
+    with transaction.atomic():
+        for model in (
+            MirthMetrics, CheckStatusMetrics, MirthMetricsRollup, CheckStatusMetricsRollup,
+            MirthChannelState, CheckStatusState, Alert, GatewayPendingActions,
+        ):
+            model.objects.filter(gateway_id__in=gtw_uids).delete()
+        KfeLogEvent.objects.filter(external_id__startswith=prefix).delete()
+        Gateways.objects.filter(gtw_uid__in=gtw_uids).delete()
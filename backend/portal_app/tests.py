@@ -0,0 +1,372 @@
+import base64
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.test import TestCase, override_settings
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .alerts import Observation, apply_observations, evaluate_alerts, reported_subjects
+from .counters import DELTA_COUNTERS, counter_deltas, counter_values
+from .models import Alert, Gateways, KfeLogEvent, MirthMetrics, MirthMetricsRollup
+from .pagination import KeysetPagination
+from .rollups import refresh_rollups
+from .timeseries import TimeBucket, lttb
+
+# Le tabelle legacy (managed = False) esistono solo nel database di
+# produzione: nel database di test vengono create come le altre
+for model in apps.get_app_config('portal_app').get_models():
+    model._meta.managed = True
+
+T0 = datetime(2026, 10, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+
+def minutes(n):
+    return T0 + timedelta(minutes=n)
+
+
+def check(minute, breach, subject='disk'):
+    return Observation(
+        'gw1', 'check', subject, minutes(minute), breach, 'WARNING', 95 if breach else 50, 90, f'{subject}: test',
+    )
+
+
+def check_row(minute, name='disk', actual=50, level='OK'):
+    """Riga come writers.CHECK_COLUMNS."""
+    return ('gw1', minutes(minute).isoformat(), name, level, '', actual, 90, '<', 0.01)
+
+
+@override_settings(ALERTS_ENABLED=True, ALERT_OPEN_AFTER=2, ALERT_CLOSE_AFTER=2)
+class AlertStateMachineTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Gateways.objects.create(gtw_uid='gw1', gtw_name='Gateway 1')
+
+    def apply(self, *observations):
+        apply_observations(list(observations))
+
+    def alert(self):
+        return Alert.objects.get(status__in=('PENDING', 'OPEN'))
+
+    def test_opens_after_consecutive_breaches(self):
+        self.apply(check(0, True))
+        self.assertEqual(self.alert().status, 'PENDING')
+        self.apply(check(1, True))
+        alert = self.alert()
+        self.assertEqual(alert.status, 'OPEN')
+        self.assertEqual(alert.first_seen_at, minutes(0))
+        self.assertEqual(alert.opened_at, minutes(1))
+
+    def test_flap_drops_pending_alert(self):
+        self.apply(check(0, True))
+        self.apply(check(1, False))
+        self.assertFalse(Alert.objects.exists())
+
+    def test_flap_within_one_block(self):
+        self.apply(check(0, True), check(1, False))
+        self.assertFalse(Alert.objects.exists())
+
+    def test_closes_after_consecutive_recoveries(self):
+        self.apply(check(0, True), check(1, True))
+        self.apply(check(2, False))
+        self.assertEqual(self.alert().status, 'OPEN')
+        # Una nuova violazione azzera il conteggio dei rientri
+        self.apply(check(3, True))
+        self.apply(check(4, False))
+        self.assertEqual(self.alert().status, 'OPEN')
+        self.apply(check(5, False))
+        alert = Alert.objects.get()
+        self.assertEqual(alert.status, 'CLOSED')
+        self.assertEqual(alert.closed_at, minutes(5))
+
+    def test_late_report_ignored_by_active_alert(self):
+        self.apply(check(0, True), check(5, True))
+        self.apply(check(2, False), check(3, False))
+        alert = self.alert()
+        self.assertEqual(alert.status, 'OPEN')
+        self.assertEqual(alert.ok_count, 0)
+        self.assertEqual(alert.last_seen_at, minutes(5))
+
+    def test_late_report_does_not_reopen_closed_alert(self):
+        self.apply(check(0, True), check(1, True), check(2, False), check(3, False))
+        self.apply(check(1, True))
+        self.apply(check(3, True))
+        self.assertEqual(list(Alert.objects.values_list('status', flat=True)), ['CLOSED'])
+
+    def test_new_breach_after_close_opens_new_alert(self):
+        self.apply(check(0, True), check(1, True), check(2, False), check(3, False))
+        self.apply(check(4, True), check(5, True))
+        self.assertEqual(
+            sorted(Alert.objects.values_list('status', flat=True)), ['CLOSED', 'OPEN']
+        )
+
+    def test_missing_subject_closes_alert(self):
+        evaluate_alerts([], [check_row(0, actual=95), check_row(0, 'cpu')])
+        evaluate_alerts([], [check_row(1, actual=95), check_row(1, 'cpu')])
+        self.assertEqual(self.alert().status, 'OPEN')
+        # Il check 'disk' non viene più inviato
+        evaluate_alerts([], [check_row(2, 'cpu')])
+        evaluate_alerts([], [check_row(3, 'cpu')])
+        alert = Alert.objects.get()
+        self.assertEqual(alert.status, 'CLOSED')
+        self.assertEqual(alert.closed_at, minutes(3))
+
+    def test_report_without_block_keeps_alert(self):
+        self.apply(check(0, True), check(1, True))
+        # Report con i soli canali Mirth: nessuna informazione sui check
+        mirth_row = ('gw1', minutes(2).isoformat(), 'ADT', 'id', 1, 1, 0, 0, 0)
+        reported = reported_subjects([mirth_row], [])
+        apply_observations([], reported)
+        apply_observations([], reported_subjects([mirth_row[:1] + (minutes(3).isoformat(),) + mirth_row[2:]], []))
+        self.assertEqual(self.alert().status, 'OPEN')
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Timestamp ripetuti (spareggio sull'id) e righe senza datetime
+        events = [KfeLogEvent(datetime=minutes(i // 3), node_fk=i % 7) for i in range(23)]
+        events += [KfeLogEvent(datetime=None, node_fk=None) for _ in range(5)]
+        KfeLogEvent.objects.bulk_create(events)
+        cls.rows = list(KfeLogEvent.objects.values_list('id', 'datetime', 'node_fk'))
+
+    def paginate(self, url, queryset, ordering):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get(url))
+        rows = paginator.paginate_queryset(queryset, request, SimpleNamespace(keyset_ordering=ordering))
+        return [row.id for row in rows], paginator
+
+    def walk(self, ordering, page_size, queryset=None):
+        """Id di tutte le pagine seguendo i link 'next'."""
+        queryset = KfeLogEvent.objects.all() if queryset is None else queryset
+        url = f'/api/logs/?page_size={page_size}'
+        ids = []
+        while url:
+            page, paginator = self.paginate(url, queryset, ordering)
+            self.assertLessEqual(len(page), page_size)
+            ids += page
+            url = paginator.get_next_link()
+        return ids
+
+    def expected(self, value, descending):
+        """Ordine atteso: righe con valore ordinate per (valore, id), poi quelle senza per id."""
+        valued = sorted((r for r in self.rows if r[value] is not None), key=lambda r: (r[value], r[0]))
+        empty = sorted(r[0] for r in self.rows if r[value] is None)
+        if descending:
+            valued.reverse()
+            empty.reverse()
+        return [r[0] for r in valued] + empty
+
+    def test_descending_walk(self):
+        for page_size in (1, 4, 23, 100):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk(('-datetime', '-id'), page_size), self.expected(1, True))
+
+    def test_ascending_walk(self):
+        for page_size in (1, 5, 23):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk(('datetime', 'id'), page_size), self.expected(1, False))
+
+    def test_annotation_ordering(self):
+        # Come l'ordinamento per rank della ricerca fts: campo annotato, con valori NULL
+        queryset = KfeLogEvent.objects.annotate(rank=ExpressionWrapper(F('node_fk') * 1.0, output_field=FloatField()))
+        self.assertEqual(self.walk(('-rank', '-id'), 4, queryset), self.expected(2, True))
+
+    def test_page_boundary_on_null_tail(self):
+        # L'ultima pagina con valori è piena: la successiva parte dalla coda NULL
+        first, paginator = self.paginate('/api/logs/?page_size=23', KfeLogEvent.objects.all(), ('-datetime', '-id'))
+        self.assertEqual(len(first), 23)
+        second, paginator = self.paginate(paginator.get_next_link(), KfeLogEvent.objects.all(), ('-datetime', '-id'))
+        self.assertEqual(second, self.expected(1, True)[23:])
+        self.assertIsNone(paginator.get_next_link())
+
+    def test_invalid_cursor(self):
+        encode = lambda raw: base64.urlsafe_b64encode(raw.encode()).decode()
+        for cursor in ('%%%', encode('[]'), encode('{"v": 1}'), encode('{"v": "non una data", "k": 1}')):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(NotFound):
+                    self.paginate(f'/api/logs/?cursor={cursor}', KfeLogEvent.objects.all(), ('-datetime', '-id'))
+
+    def test_count_only_on_first_page(self):
+        user = User.objects.create_user('operatore')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/logs/?page_size=10&count=exact')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 28)
+        response = client.get(response.data['next'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(
+            [row['id'] for row in response.data['results']], self.expected(1, True)[10:20]
+        )
+
+
+@override_settings(COUNTER_MAX_GAP_SECONDS=3600)
+class CounterDeltaTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Gateways.objects.create(gtw_uid='gw1', gtw_name='Gateway 1')
+        samples = [
+            ('ADT', 0, 100), ('ADT', 1, 110),
+            # Contatore ripartito da zero: il delta è il valore stesso
+            ('ADT', 2, 5), ('ADT', 3, 15),
+            # Gateway offline per più di COUNTER_MAX_GAP_SECONDS: intervallo non conteggiato
+            ('ADT', 64, 500), ('ADT', 65, 520),
+            # Serie con un solo campione
+            ('ORM', 10, 40),
+        ]
+        MirthMetrics.objects.bulk_create([
+            MirthMetrics(
+                gateway_id='gw1', channel_name=channel, channel_id=channel, gateway_timestamp=minutes(minute),
+                received=received, sent=received, error=0, filtered=0,
+            )
+            for channel, minute, received in samples
+        ])
+
+    def deltas(self, group_by, **kwargs):
+        queryset = MirthMetrics.objects.annotate(bucket=TimeBucket('gateway_timestamp', 3600))
+        return list(counter_deltas(queryset, group_by, partition_by=('gateway', 'channel_name'), **kwargs))
+
+    def test_reset_and_gap(self):
+        rows = {row['channel_name']: row for row in self.deltas(('channel_name',))}
+        adt = rows['ADT']
+        self.assertEqual(adt['samples'], 6)
+        self.assertEqual(adt['received_delta'], 10 + 5 + 10 + 20)
+        self.assertEqual(adt['error_delta'], 0)
+        self.assertEqual(adt['delta_seconds'], 4 * 60)
+
+    def test_single_sample(self):
+        rows = {row['channel_name']: row for row in self.deltas(('channel_name',))}
+        orm = rows['ORM']
+        self.assertEqual(orm['samples'], 1)
+        self.assertIsNone(orm['received_delta'])
+        self.assertIsNone(orm['delta_seconds'])
+        values = counter_values({c: orm[f'{c}_delta'] for c in DELTA_COUNTERS}, orm['delta_seconds'], 'rate')
+        self.assertEqual(values, {c: None for c in DELTA_COUNTERS})
+
+    def test_since_uses_previous_sample_as_base(self):
+        rows = self.deltas(('channel_name',), since=minutes(3))
+        adt = next(row for row in rows if row['channel_name'] == 'ADT')
+        # Il campione del minuto 2 serve solo da base per il minuto 3
+        self.assertEqual(adt['samples'], 3)
+        self.assertEqual(adt['received_delta'], 10 + 20)
+        self.assertEqual(adt['delta_seconds'], 2 * 60)
+
+    def test_buckets_and_values(self):
+        rows = self.deltas(('channel_name', 'bucket'))
+        adt = [row for row in rows if row['channel_name'] == 'ADT']
+        self.assertEqual(len(adt), 2)
+        first, second = adt
+        deltas = {c: first[f'{c}_delta'] for c in DELTA_COUNTERS}
+        self.assertEqual(counter_values(deltas, first['delta_seconds'], 'delta')['received'], 25)
+        self.assertAlmostEqual(counter_values(deltas, first['delta_seconds'], 'rate')['received'], 25 * 60 / 180)
+        # Il primo campione dopo la pausa non è conteggiato, il secondo sì
+        self.assertEqual(second['received_delta'], 20)
+        self.assertEqual(second['delta_seconds'], 60)
+
+
+class TimeSeriesTests(TestCase):
+
+    def test_time_bucket(self):
+        Gateways.objects.create(gtw_uid='gw1', gtw_name='Gateway 1')
+        for minute in (0, 59, 60, 119, 120):
+            MirthMetrics.objects.create(gateway_id='gw1', gateway_timestamp=minutes(minute), channel_name='ADT', channel_id='ADT')
+        buckets = list(
+            MirthMetrics.objects.annotate(bucket=TimeBucket('gateway_timestamp', 3600))
+            .order_by('gateway_timestamp').values_list('bucket', flat=True)
+        )
+        # Le ore esatte restano nel proprio bucket
+        self.assertEqual(buckets, [minutes(0), minutes(0), minutes(60), minutes(60), minutes(120)])
+
+    def points(self, values):
+        return [{'gateway_timestamp': minutes(i), 'v': value} for i, value in enumerate(values)]
+
+    def test_lttb_short_series(self):
+        points = self.points([1, 2, 3])
+        self.assertIs(lttb(points, 10, 'v'), points)
+        self.assertIs(lttb(points, 2, 'v'), points)
+        self.assertEqual(lttb(self.points([7]), 3, 'v'), self.points([7]))
+
+    def test_lttb_keeps_peaks_and_ends(self):
+        values = [0] * 100
+        values[37], values[80] = 50, -30
+        points = self.points(values)
+        sampled = lttb(points, 10, 'v')
+        self.assertEqual(len(sampled), 10)
+        self.assertIs(sampled[0], points[0])
+        self.assertIs(sampled[-1], points[-1])
+        self.assertIn(points[37], sampled)
+        self.assertIn(points[80], sampled)
+        times = [p['gateway_timestamp'] for p in sampled]
+        self.assertEqual(times, sorted(times))
+
+
+@override_settings(ROLLUP_OVERLAP_ROWS=10, COUNTER_MAX_GAP_SECONDS=3600)
+class RollupRefreshTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Gateways.objects.create(gtw_uid='gw1', gtw_name='Gateway 1')
+
+    def sample(self, minute, received, pk=None):
+        MirthMetrics.objects.create(
+            pk=pk, gateway_id='gw1', gateway_timestamp=minutes(minute), channel_name='ADT', channel_id='ADT',
+            received=received,
+        )
+
+    def rollup(self, period, minute):
+        return MirthMetricsRollup.objects.get(period=period, bucket_start=minutes(minute))
+
+    def test_late_timestamp_rebuilds_old_hour(self):
+        self.sample(0, 100)
+        self.sample(30, 130)
+        self.sample(60, 150)
+        refresh_rollups('mirth_metrics')
+        self.assertEqual(self.rollup('1h', 0).received_delta, 30)
+
+        # Report in ritardo: id nuovo, timestamp in un'ora già aggregata
+        self.sample(45, 145)
+        n_rows, n_hours, n_days = refresh_rollups('mirth_metrics')
+        self.assertEqual(n_rows, 1)
+        hour = self.rollup('1h', 0)
+        self.assertEqual(hour.samples, 3)
+        self.assertEqual(hour.received_max, 145)
+        self.assertEqual(hour.received_delta, 45)
+        self.assertEqual(hour.delta_seconds, 45 * 60)
+        # L'ora successiva usa il nuovo campione come base del delta
+        self.assertEqual(self.rollup('1h', 60).received_delta, 5)
+        day = self.rollup('1d', -12 * 60)
+        self.assertEqual(day.samples, 4)
+        self.assertEqual(day.received_delta, 50)
+
+    def test_commit_out_of_order_within_overlap(self):
+        self.sample(0, 100, pk=1)
+        self.sample(20, 120, pk=3)
+        refresh_rollups('mirth_metrics')
+        # Riga con id sotto il watermark, resa visibile dopo il refresh
+        self.sample(10, 200, pk=2)
+        refresh_rollups('mirth_metrics')
+        hour = self.rollup('1h', 0)
+        self.assertEqual(hour.samples, 3)
+        self.assertEqual(hour.received_max, 200)
+        self.assertEqual(MirthMetricsRollup.objects.filter(period='1h').count(), 1)
+
+    @override_settings(ROLLUP_OVERLAP_ROWS=0)
+    def test_commit_out_of_order_without_overlap(self):
+        self.sample(0, 100, pk=1)
+        self.sample(20, 120, pk=3)
+        refresh_rollups('mirth_metrics')
+        self.sample(10, 200, pk=2)
+        refresh_rollups('mirth_metrics')
+        self.assertEqual(self.rollup('1h', 0).samples, 2)
+        # Va ripresa con --rebuild-since
+        refresh_rollups('mirth_metrics', rebuild_since=minutes(0))
+        self.assertEqual(self.rollup('1h', 0).samples, 3)
@@ -0,0 +1,148 @@
+"""
+Utility per le serie temporali delle metriche: intervallo temporale
+dalla query string, raggruppamento a bucket in SQL e downsampling LTTB.
+"""
+from datetime import timedelta
+
+from django.db.models import DateTimeField, Func
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Intervalli predefiniti per il parametro 'range'
+RANGES = {
+    '24h': timedelta(hours=24),
+    '7d': timedelta(days=7),
+    '30d': timedelta(days=30),
+}
+
+# Bucket supportati (in secondi), dal più fine al più grosso
+BUCKETS = {
+    '1m': 60,
+    '5m': 5 * 60,
+    '1h': 60 * 60,
+    '1d': 24 * 60 * 60,
+}
+
+
+def resolve_time_range(params, default_range='24h'):
+    """
+    Restituisce (start, end) da 'from'/'to' (ISO 8601) oppure da 'range'.
+    Solleva ValueError se i parametri non sono validi.
+    """
+    now = timezone.now()
+    raw_from = params.get('from')
+    raw_to = params.get('to')
+
+    if raw_from or raw_to:
+        start = _parse_param(raw_from, 'from') if raw_from else None
+        end = _parse_param(raw_to, 'to') if raw_to else now
+        if start is None:
+            start = end - RANGES[default_range]
+        if start >= end:
+            raise ValueError("'from' deve precedere 'to'")
+        return start, end
+
+    range_key = params.get('range', default_range)
+    if range_key not in RANGES:
+        raise ValueError(f"range non valido (valori ammessi: {', '.join(RANGES)})")
+    return now - RANGES[range_key], now
+
+
+def _parse_param(value, name):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"'{name}' non è una data ISO 8601 valida")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def choose_bucket(start, end, max_points):
+    """
+    Sceglie il bucket più fine che restituisce al massimo max_points punti.
+    """
+    span = (end - start).total_seconds()
+    for name, seconds in BUCKETS.items():
+        if span / seconds <= max_points:
+            return name
+    return '1d'
+
+
+class TimeBucket(Func):
+    """
+    Arrotonda un timestamp all'inizio del suo bucket di `seconds` secondi
+    (equivalente a date_bin con origine epoch).
+    """
+    output_field = DateTimeField()
+
+    def __init__(self, expression, seconds, **extra):
+        self.seconds = int(seconds)
+        super().__init__(expression, **extra)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        if connection.pg_version >= 140000:
+            template = (
+                f"date_bin(interval '{self.seconds} seconds', %(expressions)s, "
+                "timestamptz '1970-01-01 00:00:00+00')"
+            )
+        else:
+            template = (
+                f"to_timestamp(floor(extract(epoch from %(expressions)s) / {self.seconds}) "
+                f"* {self.seconds})"
+            )
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Arrotondato ai millisecondi (come counters.Epoch) prima di troncare:
+        # l'errore in virgola mobile di julianday portava le ore esatte nel
+        # bucket precedente
+        epoch = "CAST(ROUND((julianday(%(expressions)s) - 2440587.5) * 86400, 3) AS INTEGER)"
+        template = f"datetime(({epoch} / {self.seconds}) * {self.seconds}, 'unixepoch')"
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+
+def lttb(points, threshold, key):
+    """
+    Largest-Triangle-Three-Buckets: riduce `points` (lista ordinata per
+    tempo di dict con 'gateway_timestamp') a `threshold` punti
+    preservando la forma della serie `key`.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return points
+
+    def x(p):
+        return p['gateway_timestamp'].timestamp()
+
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Media del bucket successivo (punto "C" del triangolo)
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_range = points[avg_start:avg_end] or [points[-1]]
+        avg_x = sum(x(p) for p in avg_range) / len(avg_range)
+        avg_y = sum(p[key] for p in avg_range) / len(avg_range)
+
+        # Punto del bucket corrente che massimizza l'area del triangolo
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        ax, ay = x(points[a]), points[a][key]
+        best_area = -1
+        best = range_start
+        for j in range(range_start, range_end):
+            area = abs(
+                (ax - avg_x) * (points[j][key] - ay)
+                - (ax - x(points[j])) * (avg_y - ay)
+            )
+            if area > best_area:
+                best_area = area
+                best = j
+
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
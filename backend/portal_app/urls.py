@@ -1,12 +1,29 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
 
+# In modalità ASGI le view più sollecitate hanno una versione async
+if settings.SERVER_MODE == 'asgi':
+    from . import async_views
+    ingestion_view = async_views.AsyncMetricsIngestionView
+    dashboard_view = async_views.AsyncDashboardStatsView
+    history_view = async_views.AsyncMirthMetricsHistoryView
+    mantis_view = async_views.AsyncMantisTicketView
+else:
+    ingestion_view = views.MetricsIngestionView
+    dashboard_view = views.DashboardStatsView
+    history_view = views.MirthMetricsHistoryView
+    mantis_view = views.MantisTicketView
+
 # Il router crea automaticamente gli URL per i ViewSet
 router = DefaultRouter()
 router.register(r'gateways', views.GatewayViewSet)
 router.register(r'channels', views.ChannelViewSet)
 router.register(r'logs', views.KfeLogEventViewSet)
+router.register(r'mirth-metrics', views.MirthMetricsViewSet)
+router.register(r'check-metrics', views.CheckStatusMetricsViewSet)
+router.register(r'alerts', views.AlertViewSet)
 # Aggiungere altri router per PdaStats, ExportPda, etc.
 
 urlpatterns = [
@@ -14,15 +31,20 @@ urlpatterns = [
     path('', include(router.urls)),
     
     # Endpoint di Ingestion (pubblico, ma da proteggere)
-    path('ingest-metrics/', views.MetricsIngestionView.as_view(), name='ingest-metrics'),
+    path('ingest-metrics/', ingestion_view.as_view(), name='ingest-metrics'),
+    path('ingest-metrics/batch/', views.MetricsBatchIngestionView.as_view(), name='ingest-metrics-batch'),
+    path('gateway-actions/results/', views.ActionResultsView.as_view(), name='gateway-action-results'),
+    path('gateway-actions/wait/', views.GatewayActionsWaitView.as_view(), name='gateway-action-wait'),
     
     # Endpoint della Dashboard
-    path('dashboard/stats/', views.DashboardStatsView.as_view(), name='dashboard-stats'),
+    path('dashboard/stats/', dashboard_view.as_view(), name='dashboard-stats'),
+    path('live/', views.LiveUpdatesView.as_view(), name='live-updates'),
+    path('fleet/overview/', views.FleetOverviewView.as_view(), name='fleet-overview'),
     
     # Endpoint per Grafici
-    path('metrics/mirth/history/', views.MirthMetricsHistoryView.as_view(), name='mirth-history'),
+    path('metrics/mirth/history/', history_view.as_view(), name='mirth-history'),
     
     # Endpoint Azioni e Integrazioni (protetti da Auth)
     path('actions/create/', views.CreateActionView.as_view(), name='create-action'),
-    path('integrations/mantis/create-ticket/', views.MantisTicketView.as_view(), name='mantis-create'),
+    path('integrations/mantis/create-ticket/', mantis_view.as_view(), name='mantis-create'),
 ]
@@ -1,25 +1,58 @@
 import os
+import time
 import requests
+from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
-from django.db import transaction
-from django.db.models import Count, Q
+from django.db import connection, transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.db.models import Count, Max, Avg, Sum, Min
 from rest_framework import viewsets, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.settings import api_settings
 
 from .models import (
     Gateways, KfeLogEvent, Channels, ExportPda, PdaStatsV6, ErroriDaImportare,
-    MirthMetrics, CheckStatusMetrics, GatewayPendingActions
+    MirthMetrics, CheckStatusMetrics, GatewayPendingActions, Alert
 )
 from .serializers import (
-    GatewaySerializer, KfeLogEventSerializer, ChannelSerializer, ExportPdaSerializer,
+    GatewaySerializer, KfeLogEventSerializer, ChannelSerializer,
     PdaStatsV6Serializer, ErroriDaImportareSerializer, MirthMetricsSerializer,
-    CheckStatusMetricsSerializer, GatewayPendingActionSerializer,
-    CreateActionSerializer, MantisTicketSerializer
+    CheckStatusMetricsSerializer, MirthMetricsBucketSerializer,
+    CreateActionSerializer, MantisTicketSerializer, ActionResultsReportSerializer, AlertSerializer
 )
+from .ingestion import build_mirth_rows, build_check_rows, ingest_reports, enqueue_reports, store_report
+from .actions import deliver_pending_actions, report_action_results
+from .action_channel import TooManyWaiters, hub as action_hub
+from .pg_listener import ensure_listener
+from .live import TOPICS as LIVE_TOPICS, AsyncLiveStream, LiveStream, TooManyClients
+from .ingestion_queue import QueueFull
+from .gateway_cache import gateway_cache
+from .timeseries import BUCKETS, RANGES, TimeBucket, choose_bucket, lttb, resolve_time_range
+from .rollups import (
+    cutoff_from_watermark, mirth_rollup_queryset, pending_queryset, rollup_points, watermark_queryset,
+)
+from .counters import DELTA_COUNTERS, MODES as COUNTER_MODES, Epoch, counter_deltas, counter_values, from_epoch, max_gap
+from .dashboard import get_snapshot
+from .latest_state import fleet_overview
+from .logs import BatchName, resolve_search_mode, search_logs, top_batch_errors
+from .parsers import NDJSONParser
+from .pagination import KeysetPagination
+from .exports import ExportMixin
+from .columnar import ColumnarContentNegotiation, metrics_renderer_classes, to_columnar, wants_columnar
+from .fastjson import FastListMixin, fast_serialization_enabled, get_row_serializer, serialize_rows
+from .async_api import run_queries
+from .conditional import ConditionalGetMixin
+from .instrumentation import HasMetricsAccess, MetricsTokenAuthentication, collect, render_prometheus
+
+# Timeout (secondi) delle chiamate a MantisBT
+MANTIS_TIMEOUT = 10
 
 # --- API di Ingestion (Accesso consentito solo ai Gateway) ---
 # NB: Questa API dovrebbe avere un suo sistema di autenticazione
@@ -36,138 +69,226 @@ class MetricsIngestionView(APIView):
             gtw_uid = data['gtw_uid']
             timestamp = data['timestamp']
             
-            # 1. Trova il gateway
-            try:
-                gateway = Gateways.objects.get(gtw_uid=gtw_uid)
-            except Gateways.DoesNotExist:
+            # 1. Trova il gateway (cache in-process con TTL)
+            gateway = gateway_cache.get(gtw_uid)
+            if gateway is None:
                 return Response({"error": "Gateway non valido"}, status=status.HTTP_404_NOT_FOUND)
 
-            # 2. Salva Mirth Metrics
-            mirth_metrics_data = data.get('mirth', {})
-            mirth_objs = [
-                MirthMetrics(
-                    gateway=gateway,
-                    gateway_timestamp=timestamp,
-                    channel_name=name,
-                    channel_id=details['channelId'],
-                    received=metrics['received'], sent=metrics['sent'],
-                    error=metrics['error'], filtered=metrics['filtered'],
-                    queued=metrics['queued']
-                )
-                for name, details in mirth_metrics_data.items()
-                for metrics in [details['metrics']]
-            ]
-            MirthMetrics.objects.bulk_create(mirth_objs)
-
-            # 3. Salva Check Status Metrics
-            check_status_data = data.get('CheckStatus', {})
-            check_objs = [
-                CheckStatusMetrics(
-                    gateway=gateway,
-                    gateway_timestamp=timestamp,
-                    check_name=name,
-                    level=details['level'],
-                    description=details.get('description', ''),
-                    actual_value=details['act'],
-                    limit_value=details['limit'],
-                    operator=details['operator'],
-                    query_time_sec=details.get('query_time_sec')
-                )
-                for name, details in check_status_data.items()
-            ]
-            CheckStatusMetrics.objects.bulk_create(check_objs)
-
-            # 4. Aggiorna 'last_date_call' sul gateway
-            gateway.last_date_call = timezone.now()
-            gateway.save(update_fields=['last_date_call'])
-
-            # 5. Cerca azioni in sospeso per questo gateway
-            pending_actions = GatewayPendingActions.objects.filter(
-                gateway=gateway, 
-                status='PENDING'
-            )
-            actions_data = GatewayPendingActionSerializer(pending_actions, many=True).data
-            
-            # Segna le azioni come "Consegnate"
-            action_ids = [a['id'] for a in actions_data]
-            GatewayPendingActions.objects.filter(id__in=action_ids).update(status='DELIVERED')
+            # 2. Prepara Mirth Metrics e Check Status Metrics (valida anche il payload)
+            mirth_rows = build_mirth_rows(gtw_uid, timestamp, data.get('mirth', {}))
+            check_rows = build_check_rows(gtw_uid, timestamp, data.get('CheckStatus', {}))
+
+            # 3. Salva le righe (o, in modalità coda, le lascia al writer in
+            # background), aggiorna 'last_date_call' e prende le azioni in sospeso
+            queued, actions_data = store_report(gateway, data, mirth_rows, check_rows)
+            response_status = status.HTTP_202_ACCEPTED if queued else status.HTTP_201_CREATED
 
             return Response({
                 "status": "success", 
-                "mirth_records": len(mirth_objs), 
-                "check_records": len(check_objs),
+                "queued": queued,
+                "mirth_records": len(mirth_rows), 
+                "check_records": len(check_rows),
                 "pending_actions": actions_data # Invia i comandi al gateway
-            }, status=status.HTTP_201_CREATED)
+            }, status=response_status)
 
+        except QueueFull as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '30'})
         except KeyError as e:
             return Response({"error": f"Campo JSON mancante: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"error": f"Valore non valido: {e}"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": f"Errore durante l'elaborazione: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class MetricsBatchIngestionView(APIView):
+    """
+    Ingestion batch: riceve più report (anche di gateway diversi) in una
+    sola chiamata, come array JSON, come {"reports": [...]} oppure come
+    stream NDJSON (Content-Type: application/x-ndjson).
+    Tutto viene salvato in una transazione, con una insert per tabella
+    (o accodato, se INGESTION_MODE='queue').
+    """
+    permission_classes = [AllowAny] # CAMBIARE in produzione con un TokenAuth
+    parser_classes = [JSONParser, NDJSONParser]
+
+    @transaction.atomic
+    def post(self, request, *args, **kwargs):
+        reports = request.data
+        if isinstance(reports, dict):
+            reports = reports.get('reports')
+        if not isinstance(reports, list):
+            return Response({"error": "Atteso un array di report"}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_reports = getattr(settings, 'INGESTION_BATCH_MAX_REPORTS', 500)
+        if len(reports) > max_reports:
+            return Response(
+                {"error": f"Troppi report nel batch (massimo {max_reports})"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        queued = settings.INGESTION_MODE == 'queue'
+        try:
+            if queued:
+                results, actions_data = enqueue_reports(reports)
+            else:
+                results, actions_data = ingest_reports(reports)
+        except QueueFull as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '30'})
+        except Exception as e:
+            return Response({"error": f"Errore durante l'elaborazione: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        accepted = sum(1 for r in results if r['status'] == 'success')
+        if accepted < len(results):
+            response_status = status.HTTP_207_MULTI_STATUS
+        elif queued:
+            response_status = status.HTTP_202_ACCEPTED
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({
+            "status": "success" if accepted == len(results) else "partial",
+            "queued": queued,
+            "accepted": accepted,
+            "rejected": len(results) - accepted,
+            "results": results,
+            "pending_actions": actions_data # Comandi per tutti i gateway del batch
+        }, status=response_status)
+
 # --- API per la Dashboard (Solo Utenti Autenticati) ---
 
+class ActionResultsView(APIView):
+    """
+    Esiti delle azioni eseguite da un gateway, in blocco:
+    POST /api/gateway-actions/results/
+    {"gtw_uid": "...", "results": [{"id": 12, "status": "COMPLETED"}, {"id": 13, "status": "FAILED"}]}
+    """
+    permission_classes = [AllowAny] # CAMBIARE in produzione con un TokenAuth (come l'ingestion)
+
+    def post(self, request, *args, **kwargs):
+        serializer = ActionResultsReportSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        if gateway_cache.get(data['gtw_uid']) is None:
+            return Response({"error": "Gateway non valido"}, status=status.HTTP_404_NOT_FOUND)
+
+        updated, ignored = report_action_results(data['gtw_uid'], data['results'])
+        # "ignored": azioni sconosciute, di altri gateway o non in stato DELIVERED
+        return Response({"updated": updated, "ignored": ignored})
+
+class GatewayActionsWaitView(APIView):
+    """
+    Long-poll del canale comandi: il gateway resta in attesa finché non
+    ci sono azioni per lui (o fino al timeout) e le riceve subito.
+    GET /api/gateway-actions/wait/?gtw_uid=...&timeout=25
+    """
+    permission_classes = [AllowAny] # CAMBIARE in produzione con un TokenAuth (come l'ingestion)
+
+    def get(self, request, *args, **kwargs):
+        gtw_uid = request.query_params.get('gtw_uid')
+        if not gtw_uid or gateway_cache.get(gtw_uid) is None:
+            return Response({"error": "Gateway non valido"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            timeout = float(request.query_params.get('timeout', settings.ACTION_WAIT_TIMEOUT))
+        except ValueError:
+            return Response({"error": "timeout non valido"}, status=status.HTTP_400_BAD_REQUEST)
+        timeout = max(0.0, min(timeout, settings.ACTION_WAIT_MAX_TIMEOUT))
+
+        ensure_listener()
+        deadline = time.monotonic() + timeout
+        while True:
+            # Il token va letto prima del controllo sul DB (nessuna notifica persa)
+            token = action_hub.token(gtw_uid)
+            actions_data = deliver_pending_actions([gtw_uid])
+            remaining = deadline - time.monotonic()
+            if actions_data or remaining <= 0:
+                return Response({"pending_actions": actions_data})
+
+            # Durante l'attesa la connessione al DB non serve: la restituiamo
+            connection.close()
+            try:
+                action_hub.wait(gtw_uid, token, remaining)
+            except TooManyWaiters as e:
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+
 class DashboardStatsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
         """
         Endpoint aggregato che raccoglie tutti i KPI per la dashboard.
+        I KPI arrivano da uno snapshot condiviso (vedi dashboard.py):
+        il campo "snapshot" indica quando è stato calcolato.
         """
-        now = timezone.now()
-        last_24h = now - timedelta(hours=24)
-        
-        # 1. KPI Gateways
-        active_gateways = Gateways.objects.filter(
-            last_date_call__gte=now - timedelta(minutes=15) # Attivo negli ultimi 15 min
-        ).count()
-        total_gateways = Gateways.objects.count()
-
-        # 2. KPI Canali
-        channels_to_update = Channels.objects.filter(to_update=1).count()
-        channels_to_delete = Channels.objects.filter(to_delete=1).count()
-
-        # 3. KPI Errori (ultime 24h)
-        errors_last_24h = KfeLogEvent.objects.filter(
-            datetime__gte=last_24h,
-            level__in=['ERROR', 'WARNING'] # Includiamo entrambi
-        ).count()
-        
-        # 4. KPI Errori da Importare
-        import_errors_count = ErroriDaImportare.objects.count()
+        snapshot, stale = get_snapshot()
+        return self.snapshot_response(snapshot, stale)
 
-        # 5. Stato Ultime Esportazioni
-        recent_exports = ExportPda.objects.order_by('-insert_time')[:5]
-        
-        # 6. Errori per Batch (ultime 24h)
-        # Questo è costoso, potremmo volerlo in un'API separata
-        errors_by_batch = KfeLogEvent.objects.filter(
-            datetime__gte=last_24h, 
-            level='ERROR'
-        ).values('description') # Prendiamo la descrizione
-        
-        # Semplice aggregazione in Python (per l'API con `batch_name`)
-        batch_counts = {}
-        for log in errors_by_batch:
-            desc = log['description']
-            if desc:
-                batch_name = desc.split(' - ', 1)[0].strip()
-                batch_counts[batch_name] = batch_counts.get(batch_name, 0) + 1
-        
-        # Ordina e prendi i top 5
-        top_5_batch_errors = sorted(batch_counts.items(), key=lambda item: item[1], reverse=True)[:5]
+    def snapshot_response(self, snapshot, stale):
+        age = max(0.0, (timezone.now() - snapshot['computed_at']).total_seconds())
 
-        return Response({
-            "kpi": {
-                "active_gateways": active_gateways,
-                "total_gateways": total_gateways,
-                "channels_to_update": channels_to_update,
-                "channels_to_delete": channels_to_delete,
-                "errors_last_24h": errors_last_24h,
-                "import_errors_count": import_errors_count,
-            },
-            "recent_exports": ExportPdaSerializer(recent_exports, many=True).data,
-            "top_batch_errors": top_5_batch_errors,
-        })
+        data = dict(snapshot['data'])
+        data["snapshot"] = {
+            "computed_at": snapshot['computed_at'],
+            "age_seconds": round(age, 1),
+            "stale": stale,
+        }
+        return Response(data, headers={'Age': str(int(age))})
+
+class FleetOverviewView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Stato corrente di tutti i gateway (canali Mirth e check con gli
+        ultimi valori), letto dalle tabelle di ultimo stato (latest_state.py).
+        """
+        return Response(fleet_overview())
+
+class PrometheusMetricsView(APIView):
+    """
+    GET /metrics: metriche delle richieste in formato Prometheus, sommate
+    su tutti i worker (vedi instrumentation.py). Accesso con un utente
+    autenticato o con Authorization: Bearer <METRICS_TOKEN>.
+    """
+    authentication_classes = [MetricsTokenAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    permission_classes = [HasMetricsAccess]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class LiveUpdatesView(APIView):
+    """
+    Stream Server-Sent Events con i KPI cambiati e i nuovi punti Mirth
+    (vedi live.py). GET /api/live/?topics=kpi,points&gateway_uid=...&channel_name=...
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        topics = [t for t in request.query_params.get('topics', ','.join(LIVE_TOPICS)).split(',') if t]
+        if not topics or any(t not in LIVE_TOPICS for t in topics):
+            return Response({"error": f"topics non valido (valori: {', '.join(LIVE_TOPICS)})"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ensure_listener()
+        # Sotto ASGI lo stream deve essere asincrono: un iteratore sincrono
+        # verrebbe letto per intero prima di inviare la risposta
+        stream_class = AsyncLiveStream if isinstance(request._request, ASGIRequest) else LiveStream
+        try:
+            stream = stream_class(
+                topics,
+                gateway_uid=request.query_params.get('gateway_uid'),
+                channel_name=request.query_params.get('channel_name'),
+                last_event_id=request.headers.get('Last-Event-ID'),
+            )
+        except TooManyClients as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '10'})
+
+        # La connessione al DB non serve durante lo stream
+        connection.close()
+        response = StreamingHttpResponse(stream, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 class CreateActionView(APIView):
     """
@@ -201,18 +322,35 @@ class MantisTicketView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, *args, **kwargs):
+        error, mantis_request = self.mantis_request(request)
+        if error is not None:
+            return error
+
+        try:
+            response = requests.post(**mantis_request, timeout=MANTIS_TIMEOUT)
+            response.raise_for_status() # Lancia un errore se la richiesta fallisce
+            return self.mantis_response(request, response.status_code, response.json())
+
+        except requests.exceptions.RequestException as e:
+            return Response({"error": f"Errore chiamata Mantis: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
+
+    def mantis_request(self, request):
+        """
+        Valida la richiesta e prepara la chiamata a Mantis.
+        Restituisce (risposta di errore, None) oppure (None, argomenti della POST).
+        """
         serializer = MantisTicketSerializer(data=request.data)
         if not serializer.is_valid():
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST), None
         
         mantis_data = serializer.validated_data
         
         # Prendi l'API Key e URL dal settings/.env
         api_key = os.getenv('MANTIS_API_KEY')
-        api_url = os.getenv('MANTIS_API_URL') + '/issues'
+        api_url = os.getenv('MANTIS_API_URL')
         
         if not api_key or not api_url:
-            return Response({"error": "Configurazione Mantis mancante sul server"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({"error": "Configurazione Mantis mancante sul server"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR), None
 
         headers = {
             'Authorization': api_key,
@@ -226,90 +364,387 @@ class MantisTicketView(APIView):
             # "project": {"id": mantis_data['project_id']},
             # "category": {"id": mantis_data['category_id']},
         }
+        return None, {'url': api_url + '/issues', 'headers': headers, 'json': payload}
 
-        try:
-            response = requests.post(api_url, headers=headers, json=payload, timeout=10)
-            response.raise_for_status() # Lancia un errore se la richiesta fallisce
-            
-            # Traccia l'azione (es. loggandola)
-            print(f"L'utente {request.user.username} ha creato il ticket Mantis {response.json().get('issue', {}).get('id')}")
-            
-            return Response(response.json(), status=response.status_code)
-
-        except requests.exceptions.RequestException as e:
-            return Response({"error": f"Errore chiamata Mantis: {str(e)}"}, status=status.HTTP_502_BAD_GATEWAY)
+    def mantis_response(self, request, status_code, body):
+        # Traccia l'azione (es. loggandola)
+        print(f"L'utente {request.user.username} ha creato il ticket Mantis {body.get('issue', {}).get('id')}")
+        
+        return Response(body, status=status_code)
 
 # --- ViewSet per Lettura Dati (Read-Only) ---
 
-class GatewayViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Gateways.objects.all()
+# Canali e gateway: solo le colonne serializzate (restano fuori XSD,
+# dizionari, configurazioni JSON...) e GET condizionali, così i polling
+# del frontend su dati invariati ricevono 304 senza corpo
+class GatewayViewSet(ConditionalGetMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Gateways.objects.only(*GatewaySerializer.Meta.fields).order_by('pk')
     serializer_class = GatewaySerializer
     permission_classes = [IsAuthenticated]
+    # last_date_call non segue le modifiche (nome, versioni, ...): ETag dai valori
+    etag_fields = GatewaySerializer.Meta.fields
 
-class ChannelViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Channels.objects.all()
+class ChannelViewSet(ConditionalGetMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Channels.objects.only(*ChannelSerializer.Meta.fields).order_by('pk')
     serializer_class = ChannelSerializer
     permission_classes = [IsAuthenticated]
+    last_modified_field = 'lastupdate_time'
     
     # Esempio di filtro: /api/channels/?active=1
     def get_queryset(self):
-        queryset = Channels.objects.all()
+        queryset = super().get_queryset()
         active = self.request.query_params.get('active')
         if active is not None:
             queryset = queryset.filter(active=active)
         return queryset
 
-class KfeLogEventViewSet(viewsets.ReadOnlyModelViewSet):
+class KfeLogEventViewSet(ExportMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = KfeLogEvent.objects.all()
     serializer_class = KfeLogEventSerializer
     permission_classes = [IsAuthenticated]
+    # Paginazione a cursore: niente COUNT(*) né OFFSET sulla tabella dei log
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-datetime', '-id')
+    # Export: /api/logs/export/?format=csv&level=ERROR&gzip=1
+    export_extra_columns = [('batch_name', 'batch')]
     
-    # Esempio di filtri: /api/logs/?level=ERROR&search=xds
+    # Esempio di filtri: /api/logs/?level=ERROR&search=xds&batch_name=xds_cron
+    # Pagine successive: seguire il link "next" (?cursor=...), totale stimato con ?count=approx
+    # Ricerca: ?search_mode=icontains|trigram|fts (default LOG_SEARCH_MODE),
+    # con fts anche ?ordering=rank per ordinare per rilevanza
     def get_queryset(self):
-        queryset = KfeLogEvent.objects.all().order_by('-datetime') # Sempre ordinati
+        # Il nome batch è calcolato in SQL (stessa espressione dell'indice)
+        queryset = KfeLogEvent.objects.annotate(
+            batch=BatchName('description')
+        ).order_by('-datetime') # Sempre ordinati
         level = self.request.query_params.get('level')
         search = self.request.query_params.get('search')
+        batch_name = self.request.query_params.get('batch_name')
+        self.search_mode = None
         
         if level:
             queryset = queryset.filter(level=level)
+        if batch_name:
+            queryset = queryset.filter(batch=batch_name)
         if search:
-            queryset = queryset.filter(
-                Q(description__icontains=search) | 
-                Q(doc_channel__icontains=search)
-            )
+            try:
+                self.search_mode = resolve_search_mode(self.request.query_params.get('search_mode'))
+            except ValueError as e:
+                raise ValidationError({"error": str(e)})
+            queryset = search_logs(queryset, search, self.search_mode)
+            if self.search_mode == 'fts' and self.request.query_params.get('ordering') == 'rank':
+                self.keyset_ordering = ('-rank', '-id')
         return queryset
 
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.search_mode:
+            response.data['search_mode'] = self.search_mode
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Modalità di ricerca effettivamente usata (utile per i confronti)
+        if getattr(self, 'search_mode', None):
+            response['X-Search-Mode'] = self.search_mode
+        return response
+
+    @action(detail=False, url_path='batch-errors')
+    def batch_errors(self, request):
+        """
+        Top batch per numero di log:
+        GET /api/logs/batch-errors/?window=24h&level=ERROR,WARNING&top=10
+        """
+        window = request.query_params.get('window', '24h')
+        levels = [l for l in request.query_params.get('level', 'ERROR').split(',') if l]
+        try:
+            top = int(request.query_params.get('top', 5))
+            if window not in RANGES:
+                raise ValueError(f"window non valido (valori ammessi: {', '.join(RANGES)})")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        top = max(1, min(top, 100))
+
+        since = timezone.now() - RANGES[window]
+        rows = top_batch_errors(since=since, levels=levels, top=top)
+        return Response({
+            "window": window,
+            "levels": levels,
+            "results": [{"batch_name": name, "count": count} for name, count in rows],
+        })
+
+class MetricsViewSetMixin(ExportMixin, FastListMixin):
+    """
+    Filtri comuni alle metriche grezze: gateway_uid, serie (canale o check)
+    e intervallo temporale (from/to oppure range).
+    """
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-gateway_timestamp', '-id')
+    series_field = None
+
+    def get_queryset(self):
+        queryset = self.queryset.model.objects.all()
+        params = self.request.query_params
+        gtw_uid = params.get('gateway_uid')
+        series = params.get(self.series_field)
+
+        if gtw_uid:
+            queryset = queryset.filter(gateway_id=gtw_uid)
+        if series:
+            queryset = queryset.filter(**{self.series_field: series})
+        if any(params.get(p) for p in ('from', 'to', 'range')):
+            try:
+                start_date, end_date = resolve_time_range(params)
+            except ValueError as e:
+                raise ValidationError({"error": str(e)})
+            queryset = queryset.filter(gateway_timestamp__gte=start_date, gateway_timestamp__lte=end_date)
+        return queryset
+
+class MirthMetricsViewSet(MetricsViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Metriche Mirth grezze, dalla più recente:
+    GET /api/mirth-metrics/?gateway_uid=...&channel_name=...&from=...&to=...
+    GET /api/mirth-metrics/export/?format=csv|ndjson&... (stessi filtri)
+    """
+    queryset = MirthMetrics.objects.all()
+    serializer_class = MirthMetricsSerializer
+    permission_classes = [IsAuthenticated]
+    series_field = 'channel_name'
+
+class CheckStatusMetricsViewSet(MetricsViewSetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Check di stato grezzi, dal più recente:
+    GET /api/check-metrics/?gateway_uid=...&check_name=...&from=...&to=...
+    GET /api/check-metrics/export/?format=csv|ndjson&... (stessi filtri)
+    """
+    queryset = CheckStatusMetrics.objects.all()
+    serializer_class = CheckStatusMetricsSerializer
+    permission_classes = [IsAuthenticated]
+    series_field = 'check_name'
+
+class AlertViewSet(FastListMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Allarmi generati dall'ingestion (vedi alerts.py), dal più recente:
+    GET /api/alerts/                       allarmi aperti
+    GET /api/alerts/?status=CLOSED&gateway_uid=...&rule=check|mirth_errors|mirth_queue
+    """
+    queryset = Alert.objects.all()
+    serializer_class = AlertSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        params = self.request.query_params
+        queryset = Alert.objects.filter(status=params.get('status', 'OPEN'))
+        if params.get('gateway_uid'):
+            queryset = queryset.filter(gateway_id=params['gateway_uid'])
+        if params.get('rule'):
+            queryset = queryset.filter(rule=params['rule'])
+        return queryset.order_by('-opened_at', '-id')
+
 class MirthMetricsHistoryView(APIView):
     """
     Endpoint per i grafici:
     GET /api/metrics/mirth/history/?gateway_uid=...&channel_name=...&range=24h
+
+    Parametri opzionali:
+    - range=24h|7d|30d, oppure from=...&to=... (ISO 8601)
+    - bucket=auto|raw|1m|5m|1h|1d: aggregazione in SQL (default auto);
+      1h e 1d vengono letti dai rollup, se disponibili
+    - agg=max|avg|sum|min: funzione applicata ai contatori nel bucket (default max,
+      i contatori Mirth sono cumulativi)
+    - mode=value|delta|rate: valori cumulativi (default), messaggi nell'intervallo
+      o messaggi al minuto per received/sent/error/filtered, calcolati in SQL
+      con LAG() gestendo gli azzeramenti dei contatori (vedi counters.py);
+      agg si applica solo a queued
+    - max_points=N: numero massimo di punti restituiti; un bucket esplicito
+      troppo fine viene sostituito dal più fine che ci sta e, se nemmeno
+      '1d' basta, il periodo viene accorciato ai bucket più recenti; con
+      bucket=raw si tengono i campioni più recenti
+    - downsample=lttb (&y=received): riduzione che preserva la forma della serie
+    - format=columnar: un array per colonna invece di un oggetto per punto
+      (vedi columnar.py); con Accept: application/msgpack in MessagePack
     """
     permission_classes = [IsAuthenticated]
-    
+    renderer_classes = metrics_renderer_classes()
+    content_negotiation_class = ColumnarContentNegotiation
+    # Serializzazione con .values() + orjson invece dei serializer DRF
+    fast_serialization = True
+
+    COUNTERS = ('received', 'sent', 'error', 'filtered', 'queued')
+    AGGREGATES = {'max': Max, 'avg': Avg, 'sum': Sum, 'min': Min}
+    SQL_AGGREGATES = {'max': 'MAX', 'avg': 'AVG', 'sum': 'SUM', 'min': 'MIN'}
+    ROLLUP_PERIODS = ('1h', '1d')
+
     def get(self, request, *args, **kwargs):
-        gtw_uid = request.query_params.get('gateway_uid')
-        channel_name = request.query_params.get('channel_name')
-        range_hours = request.query_params.get('range', '24h') # '24h', '7d'
+        return run_queries(self.history(request))
+
+    def history(self, request):
+        """
+        Logica dell'endpoint come generatore di query (vedi async_api.py):
+        condivisa con la versione async della view.
+        """
+        params = request.query_params
+        gtw_uid = params.get('gateway_uid')
+        channel_name = params.get('channel_name')
 
         if not gtw_uid or not channel_name:
             return Response({"error": "gateway_uid e channel_name sono richiesti"}, status=400)
 
         # Calcola intervallo temporale
-        if range_hours == '7d':
-            start_date = timezone.now() - timedelta(days=7)
-        else:
-            start_date = timezone.now() - timedelta(hours=24)
-            
-        # TODO: Aggiungere aggregazione per non restituire troppi punti
-        # (es. media oraria)
-        
-        queryset = MirthMetrics.objects.filter(
-            gateway__gtw_uid=gtw_uid,
-            channel_name=channel_name,
-            gateway_timestamp__gte=start_date
-        ).order_by('gateway_timestamp')
-        
-        serializer = MirthMetricsSerializer(queryset, many=True)
-        return Response(serializer.data)
-        
+        try:
+            start_date, end_date = resolve_time_range(params)
+            max_points = min(
+                int(params.get('max_points', settings.HISTORY_DEFAULT_MAX_POINTS)),
+                settings.HISTORY_MAX_POINTS
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if max_points < 3:
+            return Response({"error": "max_points deve essere almeno 3"}, status=400)
+
+        bucket = params.get('bucket', 'auto')
+        downsample = params.get('downsample')
+        agg = params.get('agg', 'max')
+        mode = params.get('mode', 'value')
+        if bucket not in ('auto', 'raw', *BUCKETS):
+            return Response({"error": f"bucket non valido: {bucket}"}, status=400)
+        if agg not in self.AGGREGATES:
+            return Response({"error": f"agg non valido: {agg}"}, status=400)
+        if downsample not in (None, 'lttb'):
+            return Response({"error": f"downsample non valido: {downsample}"}, status=400)
+        if mode not in COUNTER_MODES:
+            return Response({"error": f"mode non valido: {mode}"}, status=400)
+        self.mode = mode
+
+        series = MirthMetrics.objects.filter(gateway_id=gtw_uid, channel_name=channel_name)
+        queryset = series.filter(gateway_timestamp__gte=start_date, gateway_timestamp__lte=end_date)
+
+        if downsample == 'lttb':
+            # Dati grezzi ridotti lato server preservando picchi e andamento
+            y = params.get('y', 'received')
+            if y not in self.COUNTERS:
+                return Response({"error": f"y non valido: {y}"}, status=400)
+            if mode != 'value':
+                rows = yield self._deltas(series, start_date, end_date, ('epoch',), agg)
+                points = [p for p in self._delta_points(rows, 'epoch') if p[y] is not None]
+                return self._points_response(lttb(points, max_points, y), 'lttb')
+            points = yield queryset.order_by('gateway_timestamp').values(
+                'gateway_timestamp', *self.COUNTERS
+            )
+            return self._points_response([dict(p, samples=1) for p in lttb(points, max_points, y)], 'lttb')
+
+        if bucket == 'auto':
+            bucket = choose_bucket(start_date, end_date, max_points)
+        elif bucket != 'raw':
+            # Bucket esplicito troppo fine per max_points: il più fine che ci sta
+            bucket = max(bucket, choose_bucket(start_date, end_date, max_points), key=BUCKETS.get)
+        if bucket != 'raw':
+            seconds = BUCKETS[bucket]
+            if (end_date - start_date).total_seconds() / seconds > max_points:
+                # Nemmeno '1d' basta: solo gli ultimi max_points bucket
+                start_date = end_date - timedelta(seconds=seconds * (max_points - 1))
+                queryset = series.filter(gateway_timestamp__gte=start_date, gateway_timestamp__lte=end_date)
+
+        # Dati grezzi oltre max_points: si tengono i più recenti
+        if bucket == 'raw' and mode != 'value':
+            rows = yield self._deltas(
+                series, start_date, end_date, ('epoch',), agg, limit=max_points, descending=True
+            )
+            return self._points_response(self._delta_points(rows, 'epoch')[::-1], bucket)
+
+        if bucket == 'raw':
+            queryset = queryset.order_by('-gateway_timestamp')[:max_points]
+            if wants_columnar(request):
+                points = yield queryset.values('gateway_timestamp', *self.COUNTERS)
+                return Response(to_columnar(self, points[::-1], self.COUNTERS, bucket=bucket))
+            if fast_serialization_enabled(self):
+                rows = yield queryset.values(*get_row_serializer(MirthMetricsSerializer).sources)
+                return Response(serialize_rows(self, MirthMetricsSerializer, rows[::-1]))
+            instances = yield queryset.select_related('gateway')
+            serializer = MirthMetricsSerializer(instances[::-1], many=True)
+            return Response(serializer.data)
+
+        # Bucket orari/giornalieri: i rollup coprono il periodo già consolidato,
+        # i dati grezzi solo la coda più recente
+        raw_start = start_date
+        points = []
+        if bucket in self.ROLLUP_PERIODS:
+            watermark = yield watermark_queryset('mirth_metrics')
+            cutoff = None
+            if watermark:
+                refreshed_at, last_id = watermark[0]
+                pending = yield pending_queryset(series, last_id)
+                cutoff = cutoff_from_watermark(refreshed_at, bucket, pending[0] if pending else None)
+            if cutoff is not None and cutoff > start_date:
+                raw_start = min(cutoff, end_date)
+                rows = yield mirth_rollup_queryset(gtw_uid, channel_name, bucket, start_date, raw_start)
+                points = rollup_points(rows, agg, mode)
+
+        if raw_start < end_date and mode != 'value':
+            rows = yield self._deltas(series, raw_start, end_date, ('bucket',), agg, bucket=BUCKETS[bucket])
+            points += self._delta_points(rows, 'bucket')
+        elif raw_start < end_date:
+            rows = yield self._aggregate_raw(
+                queryset.filter(gateway_timestamp__gte=raw_start), BUCKETS[bucket], agg
+            )
+            points += self._bucket_points(rows)
+        return self._points_response(points, bucket)
+
+    def _points_response(self, points, bucket):
+        if wants_columnar(self.request):
+            extra = {'bucket': bucket}
+            if self.mode != 'value':
+                extra['mode'] = self.mode
+            return Response(to_columnar(self, points, self.COUNTERS + ('samples',), **extra))
+        if fast_serialization_enabled(self):
+            return Response(serialize_rows(self, MirthMetricsBucketSerializer, points))
+        return Response(MirthMetricsBucketSerializer(points, many=True).data)
+
+    def _aggregate_raw(self, queryset, seconds, agg):
+        """
+        Queryset dell'aggregazione per bucket temporale, calcolata interamente in SQL.
+        """
+        aggregate = self.AGGREGATES[agg]
+        return (
+            queryset
+            .annotate(bucket=TimeBucket('gateway_timestamp', seconds))
+            .values('bucket')
+            .annotate(samples=Count('pk'), **{
+                f'agg_{name}': aggregate(name) for name in self.COUNTERS
+            })
+            .order_by('bucket')
+        )
+
+    def _deltas(self, series, start, end, group_by, agg, bucket=None, limit=None, descending=False):
+        """
+        Query dei delta dei contatori tra start e end, per campione
+        (group_by 'epoch') o per bucket di `bucket` secondi. Legge anche
+        le righe fino a COUNTER_MAX_GAP_SECONDS prima di start, base di LAG().
+        """
+        queryset = series.filter(gateway_timestamp__gte=start - max_gap(), gateway_timestamp__lte=end)
+        if bucket is not None:
+            queryset = queryset.annotate(bucket=Epoch(TimeBucket('gateway_timestamp', bucket)))
+        return counter_deltas(
+            queryset, group_by, gauges={'queued': self.SQL_AGGREGATES[agg]}, since=start, limit=limit,
+            descending=descending,
+        )
+
+    def _delta_points(self, rows, key):
+        return [
+            dict(
+                counter_values({c: row[f'{c}_delta'] for c in DELTA_COUNTERS}, row['delta_seconds'], self.mode),
+                gateway_timestamp=from_epoch(row[key]), queued=row['queued'], samples=row['samples']
+            )
+            for row in rows
+        ]
+
+    def _bucket_points(self, rows):
+        return [
+            dict(
+                {name: row[f'agg_{name}'] for name in self.COUNTERS},
+                gateway_timestamp=row['bucket'], samples=row['samples']
+            )
+            for row in rows
+        ]
+
 # Aggiungere ViewSet simili per ExportPda, PdaStatsV6, ecc.
@@ -0,0 +1,140 @@
+"""
+Writer "bulk" per le tabelle delle metriche (mirth_metrics, check_status_metrics).
+
+Le righe arrivano come tuple già ordinate secondo MIRTH_COLUMNS /
+CHECK_COLUMNS, senza istanze dei modelli, con i valori già convertiti
+(timestamp aware, contatori interi: vedi ingestion.build_mirth_rows),
+così i due writer salvano gli stessi valori. Su PostgreSQL vengono scritte
+con COPY FROM STDIN da un buffer in memoria; sugli altri backend
+(es. SQLite in sviluppo) si ripiega su bulk_create.
+
+Il writer da usare si sceglie con settings.METRICS_WRITER:
+'auto' (default), 'copy' oppure 'bulk_create'.
+"""
+import io
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from .models import MirthMetrics, CheckStatusMetrics
+
+# Ordine delle colonne nelle tuple prodotte dall'ingestion
+MIRTH_COLUMNS = (
+    'gateway_uid', 'gateway_timestamp', 'channel_name', 'channel_id',
+    'received', 'sent', 'error', 'filtered', 'queued',
+)
+CHECK_COLUMNS = (
+    'gateway_uid', 'gateway_timestamp', 'check_name', 'level', 'description',
+    'actual_value', 'limit_value', 'operator', 'query_time_sec',
+)
+
+
+class MetricsWriter:
+    """
+    Interfaccia comune dei writer. Le sottoclassi implementano _write().
+    """
+    name = 'base'
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+
+    def write_mirth(self, rows):
+        return self._write(MirthMetrics, MIRTH_COLUMNS, rows)
+
+    def write_checks(self, rows):
+        return self._write(CheckStatusMetrics, CHECK_COLUMNS, rows)
+
+    def _write(self, model, columns, rows):
+        raise NotImplementedError
+
+
+class BulkCreateWriter(MetricsWriter):
+    """
+    Fallback portabile: costruisce le istanze e usa bulk_create.
+    """
+    name = 'bulk_create'
+
+    def _write(self, model, columns, rows):
+        if not rows:
+            return 0
+        # 'gateway_uid' è la db_column della FK: l'attributo è 'gateway_id'
+        attnames = [
+            model._meta.get_field('gateway').attname if col == 'gateway_uid' else col
+            for col in columns
+        ]
+        objs = [model(**dict(zip(attnames, row))) for row in rows]
+        model.objects.using(self.using).bulk_create(objs)
+        return len(objs)
+
+
+def _copy_text(value):
+    """
+    Formatta un valore per COPY in formato testo (NULL = \\N).
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    text = str(value)
+    if isinstance(value, str):
+        text = (
+            text.replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r')
+        )
+    return text
+
+
+class PostgresCopyWriter(MetricsWriter):
+    """
+    Scrive le righe con COPY FROM STDIN (psycopg2 o psycopg 3).
+    """
+    name = 'copy'
+
+    def _write(self, model, columns, rows):
+        if not rows:
+            return 0
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_text(v) for v in row))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        connection = connections[self.using]
+        quote = connection.ops.quote_name
+        sql = 'COPY {} ({}) FROM STDIN'.format(
+            quote(model._meta.db_table), ', '.join(quote(c) for c in columns)
+        )
+        with connection.cursor() as cursor:
+            if hasattr(cursor.cursor, 'copy_expert'):
+                # psycopg2
+                cursor.cursor.copy_expert(sql, buffer)
+            else:
+                # psycopg 3
+                with cursor.cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+        return len(rows)
+
+
+WRITERS = {
+    BulkCreateWriter.name: BulkCreateWriter,
+    PostgresCopyWriter.name: PostgresCopyWriter,
+}
+
+
+def get_metrics_writer(name=None, using=DEFAULT_DB_ALIAS):
+    """
+    Restituisce il writer configurato. Con 'auto' usa COPY solo su PostgreSQL.
+    """
+    name = name or getattr(settings, 'METRICS_WRITER', 'auto')
+    if name == 'auto':
+        vendor = connections[using].vendor
+        name = PostgresCopyWriter.name if vendor == 'postgresql' else BulkCreateWriter.name
+    if name == PostgresCopyWriter.name and connections[using].vendor != 'postgresql':
+        raise ImproperlyConfigured("METRICS_WRITER='copy' richiede PostgreSQL")
+    try:
+        return WRITERS[name](using=using)
+    except KeyError:
+        raise ImproperlyConfigured(f"METRICS_WRITER sconosciuto: {name}")
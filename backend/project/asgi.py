@@ -0,0 +1,10 @@
+"""
+Entry point ASGI (SERVER_MODE=asgi, vedi gunicorn.conf.py).
+"""
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+application = get_asgi_application()
@@ -27,6 +27,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Per primo: misura anche il tempo degli altri middleware (vedi METRICS_MODE)
+    'portal_app.instrumentation.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     # CorsMiddleware deve essere prima di CommonMiddleware
@@ -58,6 +60,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'project.wsgi.application'
 
+# Modalità di servizio: 'wsgi' (gunicorn gthread) o 'asgi' (gunicorn + uvicorn,
+# con le view async di portal_app/async_views.py). Vedi gunicorn.conf.py
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
 # --- Database (legge da .env) ---
 # Si connette al tuo DB esistente
 DATABASES = {
@@ -70,6 +76,43 @@ DATABASES = {
         'PORT': os.getenv('DB_PORT'),
     }
 }
+# I modelli legacy mappano la colonna 'pk' in un campo con lo stesso nome
+# (vedi models.py): senza questa riga i comandi di manage.py si fermano ai check
+SILENCED_SYSTEM_CHECKS = ['fields.E003']
+
+# DB_ENGINE=sqlite: file SQLite locale (DB_NAME = percorso del file), per
+# sviluppo e benchmark (manage.py benchmark --create-tables crea le tabelle)
+if os.getenv('DB_ENGINE', 'postgresql') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('DB_NAME') or str(BASE_DIR / 'db.sqlite3'),
+    }
+
+# Gestione delle connessioni (DB_POOL_MODE):
+# - 'none' (default): una nuova connessione per ogni richiesta
+# - 'persistent': ogni thread riusa la sua connessione per al più
+#   DB_CONN_MAX_AGE secondi, verificandola prima del riuso (health check).
+#   Attenzione: ogni thread dei worker può tenere aperta una connessione,
+#   cioè fino a workers x threads connessioni (vedi gunicorn.conf.py)
+# - 'pool': pool di psycopg 3 (richiede psycopg[pool]) condiviso dai thread
+#   di ogni worker: al più DB_POOL_MAX_SIZE connessioni per processo, attesa
+#   di una connessione libera al più DB_POOL_TIMEOUT secondi (poi errore),
+#   connessioni verificate al prelievo e chiuse dopo DB_POOL_MAX_IDLE secondi inattive
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'none')
+if DB_POOL_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_POOL_MODE == 'pool':
+    # Con il pool Django passa a psycopg_pool il check delle connessioni
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+        },
+    }
 
 AUTH_PASSWORD_VALIDATORS = [
     # ... validatori di default ...
@@ -83,6 +126,18 @@ USE_TZ = True
 STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# --- Cache ---
+# Di default su file, così è condivisa tra i worker gunicorn e i comandi
+# di manage.py (es. refresh_dashboard_snapshot). FileBasedCache non ha un
+# add() atomico: il lock dello snapshot dashboard usa quindi un advisory
+# lock PostgreSQL (vedi dashboard.snapshot_lock)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / '.cache')),
+    }
+}
+
 # --- Configurazione CORS ---
 # Permetti al frontend (es. localhost:3000) di chiamare l'API
 CORS_ALLOWED_ORIGINS = [
@@ -99,7 +154,12 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 25
+    'PAGE_SIZE': 25,
+    # Come JSONRenderer, ma usa orjson per le risposte del fast path (vedi portal_app/fastjson.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'portal_app.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 # --- Configurazione JWT ---
@@ -108,3 +168,116 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
+
+# --- Configurazione Ingestion Metriche ---
+# Numero massimo di report accettati in una singola chiamata batch
+INGESTION_BATCH_MAX_REPORTS = int(os.getenv('INGESTION_BATCH_MAX_REPORTS', '500'))
+# Writer per mirth_metrics/check_status_metrics: 'auto' (COPY su PostgreSQL,
+# bulk_create altrove), 'copy' oppure 'bulk_create'
+METRICS_WRITER = os.getenv('METRICS_WRITER', 'auto')
+
+# Modalità di ingestion: 'sync' (scrittura immediata) oppure 'queue'
+# (i report vengono accodati su disco e scritti da `manage.py ingestion_writer`)
+INGESTION_MODE = os.getenv('INGESTION_MODE', 'sync')
+INGESTION_SPOOL_DIR = os.getenv('INGESTION_SPOOL_DIR', str(BASE_DIR / 'spool'))
+# Oltre questa profondità le view rispondono 503 (backpressure)
+INGESTION_QUEUE_MAX_DEPTH = int(os.getenv('INGESTION_QUEUE_MAX_DEPTH', '10000'))
+INGESTION_WRITER_BATCH_SIZE = int(os.getenv('INGESTION_WRITER_BATCH_SIZE', '500'))
+INGESTION_WRITER_FLUSH_INTERVAL = float(os.getenv('INGESTION_WRITER_FLUSH_INTERVAL', '2'))
+# Tentativi di scrittura di un file della coda prima di spostarlo in failed/
+INGESTION_WRITER_MAX_ATTEMPTS = int(os.getenv('INGESTION_WRITER_MAX_ATTEMPTS', '5'))
+
+# --- Cache Gateway e heartbeat ---
+# Un gateway è "attivo" se ha chiamato negli ultimi N minuti
+GATEWAY_ACTIVE_WINDOW_MINUTES = int(os.getenv('GATEWAY_ACTIVE_WINDOW_MINUTES', '15'))
+# Durata (secondi) delle voci nella cache gtw_uid -> gateway
+GATEWAY_CACHE_TTL = float(os.getenv('GATEWAY_CACHE_TTL', '300'))
+# Ogni quanti secondi scrivere i 'last_date_call' accorpati (0 = scrittura immediata)
+HEARTBEAT_FLUSH_INTERVAL = float(os.getenv('HEARTBEAT_FLUSH_INTERVAL', '30'))
+
+# --- Storico metriche (grafici) ---
+# Punti restituiti di default e limite massimo per una singola serie
+HISTORY_DEFAULT_MAX_POINTS = int(os.getenv('HISTORY_DEFAULT_MAX_POINTS', '1000'))
+HISTORY_MAX_POINTS = int(os.getenv('HISTORY_MAX_POINTS', '10000'))
+# mode=delta|rate: intervallo massimo (secondi) tra due campioni di un
+# contatore perché il delta venga conteggiato (oltre, il gateway era offline)
+COUNTER_MAX_GAP_SECONDS = int(os.getenv('COUNTER_MAX_GAP_SECONDS', '3600'))
+# Rollup: righe già sotto il watermark rielaborate a ogni refresh, per le
+# transazioni di ingestion che committano dopo id più alti (dimensionare
+# su righe ricevute durante la transazione di ingestion più lunga)
+ROLLUP_OVERLAP_ROWS = int(os.getenv('ROLLUP_OVERLAP_ROWS', '10000'))
+
+# --- Partizionamento e retention metriche (solo PostgreSQL) ---
+# Usati da `manage.py manage_partitions`
+METRICS_PARTITIONS_AHEAD = int(os.getenv('METRICS_PARTITIONS_AHEAD', '3'))
+# Mesi di dati grezzi da conservare (0 = nessuna retention; i rollup restano)
+METRICS_RETENTION_MONTHS = int(os.getenv('METRICS_RETENTION_MONTHS', '0'))
+
+# --- Snapshot KPI dashboard ---
+# Secondi in cui lo snapshot è considerato fresco
+DASHBOARD_SNAPSHOT_TTL = int(os.getenv('DASHBOARD_SNAPSHOT_TTL', '30'))
+# Secondi oltre il TTL in cui si serve lo snapshot vecchio mentre si ricalcola
+DASHBOARD_SNAPSHOT_STALE_TTL = int(os.getenv('DASHBOARD_SNAPSHOT_STALE_TTL', '300'))
+# Durata massima del lock di ricalcolo (single-flight)
+DASHBOARD_SNAPSHOT_LOCK_TIMEOUT = int(os.getenv('DASHBOARD_SNAPSHOT_LOCK_TIMEOUT', '30'))
+
+# --- Ricerca nei log ---
+# 'auto' (trigram se gli indici di create_log_indexes esistono, altrimenti
+# icontains), 'icontains', 'trigram' oppure 'fts' (ricerca per parole)
+LOG_SEARCH_MODE = os.getenv('LOG_SEARCH_MODE', 'auto')
+
+# --- Export in streaming (CSV/NDJSON) ---
+# Righe lette dal cursore lato server (e scritte) per blocco
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# --- Serializzazione veloce (fast path .values() + orjson opzionale) ---
+# Interruttore globale; ogni view lo abilita con fast_serialization = True
+FAST_SERIALIZATION = os.getenv('FAST_SERIALIZATION', 'True') == 'True'
+
+# --- Canale comandi verso i gateway (long-poll, vedi portal_app/action_channel.py) ---
+# Notifiche tra processi (canale comandi e aggiornamenti live, vedi pg_listener.py):
+# 'auto' (LISTEN/NOTIFY su PostgreSQL, notifica in-process altrove), 'postgres' o 'local'
+# ACTION_NOTIFY_BACKEND è il vecchio nome, ancora letto se NOTIFY_BACKEND manca
+NOTIFY_BACKEND = os.getenv('NOTIFY_BACKEND', os.getenv('ACTION_NOTIFY_BACKEND', 'auto'))
+# Attesa di default e massima di una richiesta (secondi)
+ACTION_WAIT_TIMEOUT = int(os.getenv('ACTION_WAIT_TIMEOUT', '25'))
+ACTION_WAIT_MAX_TIMEOUT = int(os.getenv('ACTION_WAIT_MAX_TIMEOUT', '55'))
+# Gateway in attesa per processo: ognuno occupa un thread del worker,
+# deve restare sotto il numero di thread di gunicorn (vedi Dockerfile)
+ACTION_WAIT_MAX_WAITERS = int(os.getenv('ACTION_WAIT_MAX_WAITERS', '24'))
+
+# --- Aggiornamenti live della dashboard (Server-Sent Events, vedi portal_app/live.py) ---
+LIVE_UPDATES = os.getenv('LIVE_UPDATES', 'True') == 'True'
+# Client collegati per processo: ognuno occupa un thread del worker (vedi Dockerfile)
+LIVE_MAX_CLIENTS = int(os.getenv('LIVE_MAX_CLIENTS', '16'))
+# Intervallo minimo tra due ricalcoli dei KPI dopo nuovi dati (secondi)
+LIVE_KPI_INTERVAL = int(os.getenv('LIVE_KPI_INTERVAL', '5'))
+# Eventi tenuti in memoria per i client in ritardo o che si ricollegano
+LIVE_BUFFER_SIZE = int(os.getenv('LIVE_BUFFER_SIZE', '2000'))
+# Keep-alive (secondi), durata massima di una connessione (secondi) e attesa prima di ricollegarsi (ms)
+LIVE_HEARTBEAT = int(os.getenv('LIVE_HEARTBEAT', '15'))
+LIVE_MAX_DURATION = int(os.getenv('LIVE_MAX_DURATION', '600'))
+LIVE_RETRY_MS = int(os.getenv('LIVE_RETRY_MS', '5000'))
+
+# --- Allarmi valutati durante l'ingestion (vedi portal_app/alerts.py) ---
+ALERTS_ENABLED = os.getenv('ALERTS_ENABLED', 'True') == 'True'
+# Valutazioni consecutive fuori soglia per aprire un allarme e rientrate per chiuderlo
+ALERT_OPEN_AFTER = int(os.getenv('ALERT_OPEN_AFTER', '2'))
+ALERT_CLOSE_AFTER = int(os.getenv('ALERT_CLOSE_AFTER', '2'))
+# Messaggi in coda oltre i quali una coda Mirth in crescita genera un allarme
+ALERT_QUEUE_THRESHOLD = int(os.getenv('ALERT_QUEUE_THRESHOLD', '100'))
+
+# --- Metriche delle richieste per Prometheus (GET /metrics, vedi portal_app/instrumentation.py) ---
+# 'basic' (default, adatto alla produzione), 'full' (anche le query ripetute) oppure 'off'
+METRICS_MODE = os.getenv('METRICS_MODE', 'basic')
+# Directory in cui ogni worker salva le sue metriche, sommate da /metrics ('' = solo il processo corrente)
+METRICS_DIR = os.getenv('METRICS_DIR', str(BASE_DIR / '.metrics'))
+# Ogni quanti secondi (al più) un worker salva le sue metriche
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '10'))
+# Token per lo scraper (Authorization: Bearer <token>); senza, serve un utente autenticato
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# --- Benchmark (manage.py benchmark, vedi portal_app/synthetic.py) ---
+# True solo su un database dedicato: il benchmark vi scrive gateway, metriche,
+# log e un utente sintetici e ricalcola stato e rollup dei gateway sintetici
+BENCHMARK_DATABASE = os.getenv('BENCHMARK_DATABASE', 'False') == 'True'
@@ -4,6 +4,7 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
+from portal_app.views import PrometheusMetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -14,4 +15,7 @@ urlpatterns = [
     # API Endpoints per l'autenticazione JWT
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+
+    # Metriche per Prometheus (fuori da /api/, percorso di default dello scraper)
+    path('metrics', PrometheusMetricsView.as_view(), name='metrics'),
 ]
@@ -0,0 +1,10 @@
+"""
+Entry point WSGI (SERVER_MODE=wsgi, default, vedi gunicorn.conf.py).
+"""
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+application = get_wsgi_application()
@@ -0,0 +1,67 @@
+import axiosClient from './axiosClient';
+
+// Stream degli aggiornamenti live (Server-Sent Events, /api/live/).
+// Letto con fetch invece di EventSource, che non permette di inviare
+// l'header Authorization con il token JWT.
+// onEvent(nomeEvento, dati) viene chiamata per ogni evento ('kpi', 'points', 'reset').
+// Restituisce una funzione che chiude lo stream.
+export function openLiveStream(params, onEvent) {
+  const controller = new AbortController();
+  const query = new URLSearchParams(params).toString();
+  let lastEventId = null;
+  let retryMs = 5000;
+
+  const handleBlock = (block) => {
+    let event = 'message';
+    let data = '';
+    for (const line of block.split('\n')) {
+      if (line.startsWith(':')) continue; // keep-alive
+      const sep = line.indexOf(':');
+      const field = sep >= 0 ? line.slice(0, sep) : line;
+      const value = sep >= 0 ? line.slice(sep + 1).replace(/^ /, '') : '';
+      if (field === 'event') event = value;
+      else if (field === 'data') data += value;
+      else if (field === 'id') lastEventId = value;
+      else if (field === 'retry') retryMs = Number(value) || retryMs;
+    }
+    if (data) onEvent(event, JSON.parse(data));
+  };
+
+  const run = async () => {
+    while (!controller.signal.aborted) {
+      try {
+        const headers = { Accept: 'text/event-stream' };
+        const token = localStorage.getItem('access_token');
+        if (token) headers['Authorization'] = 'Bearer ' + token;
+        if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+
+        const response = await fetch(`${axiosClient.defaults.baseURL}/live/?${query}`, {
+          headers,
+          signal: controller.signal,
+        });
+        if (!response.ok) throw new Error(`Stream live: HTTP ${response.status}`);
+
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += value.replace(/\r\n/g, '\n');
+          let end;
+          while ((end = buffer.indexOf('\n\n')) >= 0) {
+            handleBlock(buffer.slice(0, end));
+            buffer = buffer.slice(end + 2);
+          }
+        }
+      } catch (err) {
+        if (controller.signal.aborted) return;
+        console.error(err);
+      }
+      // Il server chiude periodicamente lo stream: ci si ricollega
+      await new Promise((resolve) => setTimeout(resolve, retryMs));
+    }
+  };
+  run();
+
+  return () => controller.abort();
+}
@@ -1,7 +1,8 @@
 import React, { useState, useEffect } from 'react';
 import axiosClient from '../api/axiosClient';
+import { openLiveStream } from '../api/liveStream';
 import KpiCard from '../components/KpiCard';
-import { Grid, Typography, CircularProgress, Alert, Paper } from '@mui/material';
+import { Grid, Typography, CircularProgress, Alert, Paper, Box } from '@mui/material';
 import { DataGrid } from '@mui/x-data-grid'; // Per le tabelle
 
 const DashboardPage = () => {
@@ -23,6 +24,23 @@ const DashboardPage = () => {
       }
     };
     fetchStats();
+
+    // Aggiornamenti live: il server invia solo i KPI cambiati
+    const closeStream = openLiveStream({ topics: 'kpi' }, (event, data) => {
+      if (event === 'reset') {
+        fetchStats();
+        return;
+      }
+      if (event !== 'kpi') return;
+      const { kpi, computed_at, ...tables } = data;
+      setStats((prev) => prev && ({
+        ...prev,
+        ...tables,
+        kpi: { ...prev.kpi, ...kpi },
+        snapshot: { ...prev.snapshot, computed_at, age_seconds: 0, stale: false },
+      }));
+    });
+    return closeStream;
   }, []);
 
   if (loading) return <CircularProgress />;
@@ -45,6 +63,16 @@ const DashboardPage = () => {
     { field: 'count', headerName: 'N. Errori', width: 100 },
   ];
 
+  // Colonne per "Allarmi Attivi" (i 10 più recenti)
+  const alertColumns = [
+    { field: 'gateway', headerName: 'Gateway', width: 150 },
+    { field: 'severity', headerName: 'Gravità', width: 100 },
+    { field: 'message', headerName: 'Dettaglio', width: 350 },
+    { field: 'opened_at', headerName: 'Aperto il', width: 180,
+      valueFormatter: (params) => new Date(params.value).toLocaleString()
+    },
+  ];
+
   // Trasforma i dati per la tabella
   const batchErrorRows = stats.top_batch_errors.map((item, index) => ({
     id: index,
@@ -55,6 +83,11 @@ const DashboardPage = () => {
   return (
     <Box>
       <Typography variant="h4" gutterBottom>Dashboard</Typography>
+      {stats.snapshot && (
+        <Typography variant="caption" color="text.secondary" display="block" sx={{ mb: 2 }}>
+          Dati aggiornati {Math.round(stats.snapshot.age_seconds)} secondi fa
+        </Typography>
+      )}
       
       {/* KPI Cards */}
       <Grid container spacing={3} sx={{ mb: 4 }}>
@@ -85,10 +118,28 @@ const DashboardPage = () => {
             isError={stats.kpi.import_errors_count > 0}
           />
         </Grid>
+        <Grid item>
+          <KpiCard 
+            title="Allarmi Attivi" 
+            value={stats.kpi.active_alerts}
+            isError={stats.kpi.active_alerts > 0}
+          />
+        </Grid>
       </Grid>
 
       {/* Tabelle */}
       <Grid container spacing={3}>
+        <Grid item xs={12}>
+          <Typography variant="h6">Allarmi Attivi</Typography>
+          <Paper style={{ height: 300, width: '100%' }}>
+            <DataGrid
+              rows={stats.active_alerts}
+              columns={alertColumns}
+              pageSize={5}
+              rowsPerPageOptions={[5]}
+            />
+          </Paper>
+        </Grid>
         <Grid item xs={12} md={6}>
           <Typography variant="h6">Top Errori Batch (24h)</Typography>
           <Paper style={{ height: 300, width: '100%' }}>
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import axiosClient from '../api/axiosClient';
 import { Paper, Box, Typography, CircularProgress, Alert } from '@mui/material';
 import { DataGrid, GridToolbar } from '@mui/x-data-grid';
@@ -22,8 +22,19 @@ const getStatusChip = (lastCall) => {
   }
 };
 
+// Intervallo di aggiornamento della panoramica (ms)
+const REFRESH_INTERVAL = 30000;
+
+// Cella numerica evidenziata quando il valore è > 0
+const renderCount = (color) => (params) => (
+  <Box sx={{ color: params.value > 0 ? color : 'text.secondary', fontWeight: params.value > 0 ? 'bold' : 'normal' }}>
+    {params.value}
+  </Box>
+);
+
 const GatewaysPage = () => {
   const [gateways, setGateways] = useState([]);
+  const [summary, setSummary] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
 
@@ -62,28 +73,56 @@ const GatewaysPage = () => {
         );
       }
     },
+    {
+      field: 'channels_count',
+      headerName: 'Canali',
+      width: 90,
+      valueGetter: (params) => params.row.channels.filter((c) => !c.stale).length,
+    },
+    { field: 'errors', headerName: 'Errori', width: 90, renderCell: renderCount('error.main') },
+    { field: 'queued', headerName: 'In coda', width: 90, renderCell: renderCount('warning.main') },
+    {
+      field: 'checks_not_ok',
+      headerName: 'Check KO',
+      width: 110,
+      renderCell: (params) => {
+        const failing = params.row.checks
+          .filter((c) => !c.stale && c.level !== 'OK')
+          .map((c) => `${c.check_name}: ${c.level} (${c.actual_value}/${c.limit_value})`);
+        return (
+          <Box title={failing.join('\n')}>
+            {renderCount('error.main')(params)}
+          </Box>
+        );
+      }
+    },
     { field: 'sw_version', headerName: 'Ver. SW', width: 100 },
     { field: 'current_version', headerName: 'Ver. Attuale', width: 100 },
     { field: 'gateway_description', headerName: 'Descrizione', width: 250 },
   ];
 
-  useEffect(() => {
-    const fetchGateways = async () => {
-      setLoading(true);
+  // Stato corrente di tutti i gateway (ultimi valori di canali e check)
+  const fetchOverview = useCallback(async (showLoading) => {
+    if (showLoading) setLoading(true);
+    try {
+      const response = await axiosClient.get('/fleet/overview/');
+      setGateways(response.data.gateways);
+      setSummary(response.data.summary);
       setError('');
-      try {
-        const response = await axiosClient.get('/gateways/');
-        setGateways(response.data.results || []); // Gestisce la paginazione
-      } catch (err) {
-        setError('Impossibile caricare i gateway.');
-        console.error(err);
-      } finally {
-        setLoading(false);
-      }
-    };
-    
-    fetchGateways();
-  }, []); // Esegui solo al caricamento
+    } catch (err) {
+      setError('Impossibile caricare i gateway.');
+      console.error(err);
+    } finally {
+      if (showLoading) setLoading(false);
+    }
+  }, []);
+
+  useEffect(() => {
+    fetchOverview(true);
+    // Aggiornamento periodico senza spinner
+    const timer = setInterval(() => fetchOverview(false), REFRESH_INTERVAL);
+    return () => clearInterval(timer);
+  }, [fetchOverview]);
 
   if (loading) return <CircularProgress />;
   if (error) return <Alert severity="error">{error}</Alert>;
@@ -91,6 +130,11 @@ const GatewaysPage = () => {
   return (
     <Box>
       <Typography variant="h4" gutterBottom>Gestione Gateway</Typography>
+      {summary && (
+        <Typography variant="body2" color="text.secondary" gutterBottom>
+          {summary.online}/{summary.gateways} online · errori {summary.errors} · in coda {summary.queued} · check KO {summary.checks_not_ok}
+        </Typography>
+      )}
       
       {/* Tabella dei Gateway */}
       <Paper style={{ height: 600, width: '100%' }}>
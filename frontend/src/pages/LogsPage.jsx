@@ -1,15 +1,18 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback } from 'react';
 import axiosClient from '../api/axiosClient';
-import { Paper, TextField, MenuItem, Box, Typography } from '@mui/material';
+import { Paper, TextField, MenuItem, Box, Typography, Button } from '@mui/material';
 import { DataGrid, GridToolbar } from '@mui/x-data-grid';
 
 const LogsPage = () => {
   const [logs, setLogs] = useState([]);
   const [loading, setLoading] = useState(false);
+  // Link alla pagina successiva (paginazione a cursore, senza COUNT)
+  const [nextUrl, setNextUrl] = useState(null);
   
   // Stati per i filtri
   const [filterLevel, setFilterLevel] = useState(''); // 'ERROR', 'WARNING', ''
   const [filterSearch, setFilterSearch] = useState('');
+  const [filterBatch, setFilterBatch] = useState('');
 
   // Colonne per DataGrid
   const columns = [
@@ -24,29 +27,34 @@ const LogsPage = () => {
     { field: 'doc_channel', headerName: 'Canale', width: 130 },
   ];
 
+  // Carica una pagina: dai filtri (reset) oppure dal cursore "next" (append)
+  const fetchLogs = useCallback(async (url, append) => {
+    setLoading(true);
+    try {
+      const response = await axiosClient.get(url);
+      const results = response.data.results || [];
+      setLogs((prev) => (append ? [...prev, ...results] : results));
+      setNextUrl(response.data.next);
+    } catch (err) {
+      console.error(err);
+    } finally {
+      setLoading(false);
+    }
+  }, []);
+
   useEffect(() => {
-    const fetchLogs = async () => {
-      setLoading(true);
-      try {
-        // Costruisci i parametri di query
-        const params = new URLSearchParams();
-        if (filterLevel) params.append('level', filterLevel);
-        if (filterSearch) params.append('search', filterSearch);
+    // Costruisci i parametri di query
+    const params = new URLSearchParams();
+    if (filterLevel) params.append('level', filterLevel);
+    if (filterSearch) params.append('search', filterSearch);
+    if (filterBatch) params.append('batch_name', filterBatch);
+    params.append('page_size', '100');
 
-        const response = await axiosClient.get(`/logs/?${params.toString()}`);
-        setLogs(response.data.results || []); // Gestisce la paginazione
-      } catch (err) {
-        console.error(err);
-      } finally {
-        setLoading(false);
-      }
-    };
-    
     // Attendi 500ms prima di lanciare la ricerca (debounce)
-    const timerId = setTimeout(fetchLogs, 500);
+    const timerId = setTimeout(() => fetchLogs(`/logs/?${params.toString()}`, false), 500);
     return () => clearTimeout(timerId);
     
-  }, [filterLevel, filterSearch]); // Ricarica i dati quando i filtri cambiano
+  }, [filterLevel, filterSearch, filterBatch, fetchLogs]); // Ricarica i dati quando i filtri cambiano
 
   return (
     <Box>
@@ -72,6 +80,12 @@ const LogsPage = () => {
           onChange={(e) => setFilterSearch(e.target.value)}
           sx={{ minWidth: 300 }}
         />
+        <TextField
+          label="Batch"
+          value={filterBatch}
+          onChange={(e) => setFilterBatch(e.target.value)}
+          sx={{ minWidth: 150 }}
+        />
       </Box>
       
       {/* Tabella dei Log */}
@@ -80,12 +94,19 @@ const LogsPage = () => {
           rows={logs}
           columns={columns}
           loading={loading}
-          pagination // Abilita paginazione (se il backend la supporta)
-          // Se usi la paginazione di Django, dovrai implementare
-          // la modalità "server" di DataGrid.
+          pagination // Paginazione lato client sulle righe già caricate
           components={{ Toolbar: GridToolbar }} // Aggiunge filtri, export, etc.
         />
       </Paper>
+      <Box sx={{ mt: 2, display: 'flex', justifyContent: 'center' }}>
+        <Button
+          variant="outlined"
+          disabled={!nextUrl || loading}
+          onClick={() => fetchLogs(nextUrl, true)}
+        >
+          {nextUrl ? 'Carica altri' : 'Nessun altro log'}
+        </Button>
+      </Box>
     </Box>
   );
 };
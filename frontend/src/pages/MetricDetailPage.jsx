@@ -1,32 +1,88 @@
 import React, { useState, useEffect } from 'react';
 import { useParams } from 'react-router-dom';
 import axiosClient from '../api/axiosClient';
+import { openLiveStream } from '../api/liveStream';
 import { Typography, CircularProgress, Alert, Paper, Box, TextField, MenuItem } from '@mui/material';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 
+// Durata dei bucket restituiti dallo storico (vedi timeseries.BUCKETS nel backend)
+const BUCKET_MS = { '1m': 60000, '5m': 300000, '1h': 3600000, '1d': 86400000 };
+
+const toChartPoint = (ms, received, sent, error) => ({
+  ms,
+  time: new Date(ms).toLocaleString(),
+  received,
+  sent,
+  error,
+});
+
+// Intervallo minimo tra due ricariche dei rate (storico non aggregato)
+const MIN_RATE_REFRESH_MS = 60000;
+
+// Aggiunge i punti live alla serie: se lo storico è aggregato, ogni punto
+// aggiorna il bucket a cui appartiene (contatori cumulativi: vale il massimo)
+const mergeLivePoints = (prev, points, bucket) => {
+  const size = BUCKET_MS[bucket];
+  const next = [...prev];
+  points.forEach((p) => {
+    const last = next[next.length - 1];
+    if (!size) {
+      if (!last || p.timestamp > last.ms) {
+        next.push(toChartPoint(p.timestamp, p.received, p.sent, p.error));
+      }
+      return;
+    }
+    const start = Math.floor(p.timestamp / size) * size;
+    if (last && last.ms === start) {
+      next[next.length - 1] = toChartPoint(
+        start,
+        Math.max(last.received, p.received),
+        Math.max(last.sent, p.sent),
+        Math.max(last.error, p.error),
+      );
+    } else if (!last || start > last.ms) {
+      next.push(toChartPoint(start, p.received, p.sent, p.error));
+    }
+  });
+  return next;
+};
+
 const MetricDetailPage = () => {
   const { gatewayUid, channelName } = useParams();
   const [data, setData] = useState([]);
-  const [range, setRange] = useState('24h'); // '24h' o '7d'
+  const [range, setRange] = useState('24h'); // '24h', '7d' o '30d'
+  // 'value': totali cumulativi di Mirth; 'rate': messaggi al minuto (calcolati dal backend)
+  const [mode, setMode] = useState('value');
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
   useEffect(() => {
-    const fetchHistory = async () => {
-      setLoading(true);
+    // Bucket dell'ultimo storico caricato ('raw' = campioni non aggregati)
+    let bucket = 'raw';
+    // Rate: ricarica al più una volta per bucket, con un'ultima ricarica in coda
+    let lastFetch = 0;
+    let refreshTimer = null;
+
+    const fetchHistory = async (showLoading = true) => {
+      if (showLoading) setLoading(true);
+      lastFetch = Date.now();
       try {
         const params = new URLSearchParams({
           gateway_uid: gatewayUid,
           channel_name: channelName,
           range: range,
+          mode: mode,
+          // Il backend aggrega i punti in bucket: il grafico resta leggibile
+          max_points: 500,
+          // Un array per colonna: payload più piccolo, niente parsing delle date ISO
+          format: 'columnar',
         });
         const response = await axiosClient.get(`/metrics/mirth/history/?${params.toString()}`);
         
-        // Trasforma i dati per il grafico (parsa la data)
-        const chartData = response.data.map(item => ({
-          ...item,
-          time: new Date(item.gateway_timestamp).toLocaleString(),
-        }));
+        // Trasforma le colonne nei punti del grafico (timestamps in ms epoch)
+        const { timestamps, received, sent, error: errors } = response.data;
+        bucket = response.data.bucket;
+        const chartData = timestamps.map((ms, i) => toChartPoint(ms, received[i], sent[i], errors[i]));
         setData(chartData);
         
       } catch (err) {
@@ -37,7 +93,35 @@ const MetricDetailPage = () => {
       }
     };
     fetchHistory();
-  }, [gatewayUid, channelName, range]); // Ricarica se i parametri cambiano
+
+    // Nuovi punti in tempo reale, senza ricaricare tutto lo storico
+    const closeStream = openLiveStream(
+      { topics: 'points', gateway_uid: gatewayUid, channel_name: channelName },
+      (event, payload) => {
+        if (event === 'reset') {
+          fetchHistory();
+          return;
+        }
+        if (event !== 'points') return;
+        if (mode !== 'value') {
+          // I rate si calcolano sul server: ricarica lo storico senza spinner,
+          // non più spesso di un bucket (un punto nuovo per bucket)
+          if (refreshTimer) return;
+          const interval = Math.max(BUCKET_MS[bucket] || 0, MIN_RATE_REFRESH_MS);
+          refreshTimer = setTimeout(() => {
+            refreshTimer = null;
+            fetchHistory(false);
+          }, Math.max(0, lastFetch + interval - Date.now()));
+          return;
+        }
+        setData((prev) => mergeLivePoints(prev, payload.points, bucket));
+      }
+    );
+    return () => {
+      clearTimeout(refreshTimer);
+      closeStream();
+    };
+  }, [gatewayUid, channelName, range, mode]); // Ricarica se i parametri cambiano
 
   return (
     <Box>
@@ -57,6 +141,18 @@ const MetricDetailPage = () => {
       >
         <MenuItem value="24h">Ultime 24 ore</MenuItem>
         <MenuItem value="7d">Ultimi 7 giorni</MenuItem>
+        <MenuItem value="30d">Ultimi 30 giorni</MenuItem>
+      </TextField>
+
+      <TextField
+        select
+        label="Valori"
+        value={mode}
+        onChange={(e) => setMode(e.target.value)}
+        sx={{ mb: 2, ml: 2, minWidth: 200 }}
+      >
+        <MenuItem value="value">Totali cumulativi</MenuItem>
+        <MenuItem value="rate">Messaggi al minuto</MenuItem>
       </TextField>
 
       {loading && <CircularProgress />}
@@ -60,3 +60,178 @@ CREATE TABLE public.check_status_metrics (
 CREATE INDEX idx_check_status_timestamp ON public.check_status_metrics(gateway_timestamp DESC);
 CREATE INDEX idx_check_status_gateway_uid ON public.check_status_metrics(gateway_uid);
 CREATE INDEX idx_check_status_check_name ON public.check_status_metrics(check_name);
+
+-- Rollup orari/giornalieri (aggiornati da `manage.py refresh_rollups`)
+CREATE TABLE public.mirth_metrics_rollup (
+    id bigserial NOT NULL,
+    gateway_uid varchar(64) NOT NULL,
+    channel_name varchar(255) NOT NULL,
+    -- '1h' oppure '1d'
+    period varchar(2) NOT NULL,
+    bucket_start timestamptz NOT NULL,
+    samples int4 NOT NULL DEFAULT 0,
+    received_sum int8 NOT NULL DEFAULT 0,
+    received_min int4 NOT NULL DEFAULT 0,
+    received_max int4 NOT NULL DEFAULT 0,
+    sent_sum int8 NOT NULL DEFAULT 0,
+    sent_min int4 NOT NULL DEFAULT 0,
+    sent_max int4 NOT NULL DEFAULT 0,
+    error_sum int8 NOT NULL DEFAULT 0,
+    error_min int4 NOT NULL DEFAULT 0,
+    error_max int4 NOT NULL DEFAULT 0,
+    filtered_sum int8 NOT NULL DEFAULT 0,
+    filtered_min int4 NOT NULL DEFAULT 0,
+    filtered_max int4 NOT NULL DEFAULT 0,
+    "queued_sum" int8 NOT NULL DEFAULT 0,
+    "queued_min" int4 NOT NULL DEFAULT 0,
+    "queued_max" int4 NOT NULL DEFAULT 0,
+    -- Delta dei contatori cumulativi e secondi conteggiati (mode=delta|rate)
+    received_delta int8 NOT NULL DEFAULT 0,
+    sent_delta int8 NOT NULL DEFAULT 0,
+    error_delta int8 NOT NULL DEFAULT 0,
+    filtered_delta int8 NOT NULL DEFAULT 0,
+    delta_seconds float8 NOT NULL DEFAULT 0,
+
+    CONSTRAINT mirth_metrics_rollup_pkey PRIMARY KEY (id),
+    -- Usato anche come indice per le query dello storico
+    CONSTRAINT uniq_mirth_metrics_rollup
+        UNIQUE (gateway_uid, channel_name, period, bucket_start),
+    CONSTRAINT fk_mirth_rollup_gateway_uid
+        FOREIGN KEY (gateway_uid)
+        REFERENCES public.gateways(gtw_uid)
+        ON DELETE CASCADE
+);
+
+-- Su un database esistente:
+--   ALTER TABLE public.mirth_metrics_rollup
+--       ADD COLUMN received_delta int8 NOT NULL DEFAULT 0,
+--       ADD COLUMN sent_delta int8 NOT NULL DEFAULT 0,
+--       ADD COLUMN error_delta int8 NOT NULL DEFAULT 0,
+--       ADD COLUMN filtered_delta int8 NOT NULL DEFAULT 0,
+--       ADD COLUMN delta_seconds float8 NOT NULL DEFAULT 0;
+-- e poi `python manage.py refresh_rollups --only mirth_metrics --rebuild-since <data>`
+
+CREATE TABLE public.check_status_metrics_rollup (
+    id bigserial NOT NULL,
+    gateway_uid varchar(64) NOT NULL,
+    check_name varchar(255) NOT NULL,
+    period varchar(2) NOT NULL,
+    bucket_start timestamptz NOT NULL,
+    samples int4 NOT NULL DEFAULT 0,
+    non_ok_samples int4 NOT NULL DEFAULT 0,
+    actual_sum int8 NOT NULL DEFAULT 0,
+    actual_min int4 NOT NULL DEFAULT 0,
+    actual_max int4 NOT NULL DEFAULT 0,
+    limit_max int4 NOT NULL DEFAULT 0,
+
+    CONSTRAINT check_status_metrics_rollup_pkey PRIMARY KEY (id),
+    CONSTRAINT uniq_check_status_metrics_rollup
+        UNIQUE (gateway_uid, check_name, period, bucket_start),
+    CONSTRAINT fk_check_rollup_gateway_uid
+        FOREIGN KEY (gateway_uid)
+        REFERENCES public.gateways(gtw_uid)
+        ON DELETE CASCADE
+);
+
+-- Ultimo id sorgente incluso nei rollup
+CREATE TABLE public.rollup_watermark (
+    id bigserial NOT NULL,
+    name varchar(64) NOT NULL UNIQUE,
+    last_id int8 NOT NULL DEFAULT 0,
+    refreshed_at timestamptz NULL,
+
+    CONSTRAINT rollup_watermark_pkey PRIMARY KEY (id)
+);
+
+-- Ultimo stato per gateway/canale e gateway/check (upsert dall'ingestion).
+-- Su un database esistente, dopo la creazione:
+--   python manage.py rebuild_latest_state
+CREATE TABLE public.mirth_channel_state (
+    id bigserial NOT NULL,
+    gateway_uid varchar(64) NOT NULL,
+    channel_name varchar(255) NOT NULL,
+    channel_id varchar(50) NOT NULL,
+    gateway_timestamp timestamptz NOT NULL,
+    received int4 NOT NULL DEFAULT 0,
+    sent int4 NOT NULL DEFAULT 0,
+    error int4 NOT NULL DEFAULT 0,
+    filtered int4 NOT NULL DEFAULT 0,
+    "queued" int4 NOT NULL DEFAULT 0,
+
+    CONSTRAINT mirth_channel_state_pkey PRIMARY KEY (id),
+    -- Chiave dell'upsert e indice della panoramica
+    CONSTRAINT uniq_mirth_channel_state UNIQUE (gateway_uid, channel_name),
+    CONSTRAINT fk_mirth_state_gateway_uid
+        FOREIGN KEY (gateway_uid)
+        REFERENCES public.gateways(gtw_uid)
+        ON DELETE CASCADE
+);
+
+CREATE TABLE public.check_status_state (
+    id bigserial NOT NULL,
+    gateway_uid varchar(64) NOT NULL,
+    check_name varchar(255) NOT NULL,
+    gateway_timestamp timestamptz NOT NULL,
+    level varchar(10) NOT NULL,
+    description text NULL,
+    actual_value int4 NOT NULL,
+    limit_value int4 NOT NULL,
+    operator varchar(5) NOT NULL,
+    query_time_sec float8 NULL,
+
+    CONSTRAINT check_status_state_pkey PRIMARY KEY (id),
+    CONSTRAINT uniq_check_status_state UNIQUE (gateway_uid, check_name),
+    CONSTRAINT fk_check_state_gateway_uid
+        FOREIGN KEY (gateway_uid)
+        REFERENCES public.gateways(gtw_uid)
+        ON DELETE CASCADE
+);
+
+-- Allarmi aperti/chiusi dall'ingestion (check fuori soglia, errori e code Mirth).
+-- Le righe PENDING sono allarmi in attesa di conferma (soppressione dei flap)
+CREATE TABLE public.alerts (
+    id bigserial NOT NULL,
+    gateway_uid varchar(64) NOT NULL,
+    -- 'check', 'mirth_errors' oppure 'mirth_queue'
+    rule varchar(20) NOT NULL,
+    -- Nome del check o del canale
+    subject varchar(255) NOT NULL,
+    -- 'PENDING', 'OPEN' oppure 'CLOSED'
+    status varchar(10) NOT NULL,
+    severity varchar(10) NOT NULL,
+    message text NOT NULL DEFAULT '',
+    value float8 NULL,
+    threshold float8 NULL,
+    breach_count int4 NOT NULL DEFAULT 0,
+    ok_count int4 NOT NULL DEFAULT 0,
+    first_seen_at timestamptz NOT NULL,
+    last_seen_at timestamptz NOT NULL,
+    opened_at timestamptz NULL,
+    closed_at timestamptz NULL,
+
+    CONSTRAINT alerts_pkey PRIMARY KEY (id),
+    CONSTRAINT fk_alerts_gateway_uid
+        FOREIGN KEY (gateway_uid)
+        REFERENCES public.gateways(gtw_uid)
+        ON DELETE CASCADE
+);
+
+-- Al più un allarme non chiuso per gateway/regola/soggetto
+CREATE UNIQUE INDEX uniq_active_alert ON public.alerts (gateway_uid, rule, subject) WHERE status <> 'CLOSED';
+CREATE INDEX alerts_status_opened_idx ON public.alerts (status, opened_at DESC);
+
+-- Partizionamento mensile di mirth_metrics e check_status_metrics
+-- (RANGE su gateway_timestamp). Non va eseguito a mano: la conversione
+-- delle tabelle esistenti, la creazione delle partizioni future e la
+-- retention sono gestite da
+--   python manage.py manage_partitions --convert
+--   python manage.py manage_partitions --retention-months 12   (es. da cron)
+-- Dopo la conversione la pk diventa (id, gateway_timestamp) e gli indici
+-- su singola colonna sono sostituiti da (gateway_uid, channel_name|check_name,
+-- gateway_timestamp) e (gateway_timestamp), creati su ogni partizione.
+
+-- gateway_pending_actions è gestita da Django: su un DB esistente l'indice
+-- parziale usato dalla consegna delle azioni si crea con
+--   CREATE INDEX CONCURRENTLY gpa_pending_gateway_idx
+--       ON public.gateway_pending_actions (gateway_uid, created_at)
+--       WHERE status = 'PENDING';